@@ -0,0 +1,307 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from benchlib import workspace
+
+# errori JSON-RPC restituiti come farebbe Kodi
+_method_not_found = {'code': -32601, 'message': 'Method not found.'}
+_invalid_params = {'code': -32602, 'message': 'Invalid params.'}
+
+
+class LibraryRpc:
+    """
+    Sostituto del server JSON-RPC di Kodi per i metodi usati dagli add-on, con i dati letti dai db SQLite
+    della libreria (MyMusic) e della cache delle texture. Ogni thread usa la sua connessione.
+    Le cartelle delle condivisioni che esistono su disco (etichette, playlist) vengono elencate dal file system,
+    quelle musicali dalla tabella path come farebbe Kodi con la vista per sorgenti.
+    """
+
+    def __init__(self, music_db_path, textures_db_path=None, kodi_home=None, share_root=None):
+        self.music_db_path = music_db_path
+        self.textures_db_path = textures_db_path
+        self.kodi_home = kodi_home
+        self.share_root = share_root
+        self._local = threading.local()
+        self.methods = {
+            'AudioLibrary.GetAlbumDetails': self.get_album_details,
+            'AudioLibrary.GetAlbums': self.get_albums,
+            'AudioLibrary.GetArtists': self.get_artists,
+            'AudioLibrary.GetGenres': self.get_genres,
+            'AudioLibrary.GetProperties': self.get_properties,
+            'AudioLibrary.GetSongs': self.get_songs,
+            'AudioLibrary.GetSources': self.get_sources,
+            'AudioLibrary.Scan': self.scan,
+            'Files.GetDirectory': self.get_directory,
+            'JSONRPC.Ping': lambda params: 'pong',
+            'Textures.GetTextures': self.get_textures,
+            'Textures.RemoveTexture': self.remove_texture,
+        }
+
+    def _db(self, db_path):
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        db = connections.get(db_path)
+        if db is None:
+            db = sqlite3.connect(db_path, timeout=60)
+            connections[db_path] = db
+        return db
+
+    @property
+    def music_db(self):
+        return self._db(self.music_db_path)
+
+    @property
+    def textures_db(self):
+        return self._db(self.textures_db_path)
+
+    def handle(self, payload):
+        """Esegue una richiesta (o un batch) già serializzata e restituisce la risposta serializzata"""
+        request = json.loads(payload)
+        if isinstance(request, list):
+            return json.dumps([self._handle_single(single_request) for single_request in request])
+        return json.dumps(self._handle_single(request))
+
+    def _handle_single(self, request):
+        method = self.methods.get(request.get('method'))
+        response = {'id': request.get('id'), 'jsonrpc': '2.0'}
+        if method is None:
+            response['error'] = _method_not_found
+            return response
+        try:
+            response['result'] = method(request.get('params') or {})
+        except (KeyError, TypeError, ValueError) as e:
+            response['error'] = dict(_invalid_params, data={'message': str(e)})
+        return response
+
+    # AudioLibrary
+
+    def get_sources(self, params):
+        query = 'SELECT idSource, strName, strMultipath FROM source ORDER BY strName'
+        sources = [{'sourceid': id_source, 'label': name, 'file': path}
+                   for (id_source, name, path) in self.music_db.execute(query)]
+        return {'sources': sources, 'limits': _limits(len(sources))}
+
+    def get_properties(self, params):
+        (last_scanned,) = self.music_db.execute('SELECT MAX(lastscanned) FROM versiontagscan').fetchone()
+        properties = {
+            'librarylastupdated': last_scanned or '',
+            'librarylastcleaned': last_scanned or '',
+            'missingartistid': 1,
+            'artistlinksupdated': last_scanned or '',
+            'genresupdated': last_scanned or '',
+            'songslastadded': last_scanned or '',
+            'albumslastadded': last_scanned or '',
+            'artistslastadded': last_scanned or '',
+            'songsmodified': last_scanned or '',
+            'albumsmodified': last_scanned or '',
+            'artistsmodified': last_scanned or '',
+        }
+        return {key: properties.get(key) for key in params.get('properties', [])}
+
+    def get_albums(self, params):
+        query = 'SELECT idAlbum, strAlbum, strLabel, strMusicBrainzAlbumID, strGenres FROM album ORDER BY idAlbum'
+        albums = [_album_properties(row, params.get('properties', [])) for row in self.music_db.execute(query)]
+        return {'albums': albums, 'limits': _limits(len(albums))}
+
+    def get_album_details(self, params):
+        query = 'SELECT idAlbum, strAlbum, strLabel, strMusicBrainzAlbumID, strGenres FROM album WHERE idAlbum = ?'
+        row = self.music_db.execute(query, (params['albumid'],)).fetchone()
+        if row is None:
+            raise ValueError(f'album {params["albumid"]} non trovato')
+        return {'albumdetails': _album_properties(row, params.get('properties', []))}
+
+    def get_artists(self, params):
+        query = 'SELECT idArtist, strArtist, strMusicBrainzArtistID FROM artist ORDER BY strArtist'
+        artists = []
+        for (id_artist, name, mbid) in self.music_db.execute(query):
+            artist = {'artistid': id_artist, 'artist': name, 'label': name}
+            if 'musicbrainzartistid' in params.get('properties', []):
+                artist['musicbrainzartistid'] = [mbid] if mbid else []
+            artists.append(artist)
+        return {'artists': artists, 'limits': _limits(len(artists))}
+
+    def get_genres(self, params):
+        query = 'SELECT idGenre, strGenre FROM genre ORDER BY strGenre'
+        genres = [{'genreid': id_genre, 'label': genre} for (id_genre, genre) in self.music_db.execute(query)]
+        return {'genres': genres, 'limits': _limits(len(genres))}
+
+    def get_songs(self, params):
+        song_filter = params.get('filter') or {}
+        query = f'''
+                SELECT song.idSong, song.strTitle, song.idAlbum, path.strPath || song.strFileName,
+                       album.strMusicBrainzAlbumID
+                FROM song
+                         JOIN path ON path.idPath = song.idPath
+                         JOIN album ON album.idAlbum = song.idAlbum
+                {'WHERE song.idAlbum = ?' if 'albumid' in song_filter else ''}
+                ORDER BY song.idAlbum, song.iTrack'''
+        rows = self.music_db.execute(query, (song_filter['albumid'],) if 'albumid' in song_filter else ()).fetchall()
+        artists_by_song = self._get_song_artists([row[0] for row in rows])
+        properties = params.get('properties', [])
+        songs = []
+        for (id_song, title, id_album, file, album_mbid) in rows:
+            song = {'songid': id_song, 'label': title}
+            values = {'albumid': id_album, 'file': file, 'musicbrainzalbumid': album_mbid or '', 'title': title,
+                      'artistid': artists_by_song.get(id_song, [])}
+            song.update({key: values[key] for key in properties if key in values})
+            songs.append(song)
+        return {'songs': songs, 'limits': _limits(len(songs))}
+
+    def scan(self, params):
+        # la scansione vera non serve: chi la avvia aspetta solo la notifica di fine, inviata dallo stub di xbmc
+        return 'OK'
+
+    def _get_song_artists(self, id_songs):
+        artists_by_song = {}
+        for chunk_start in range(0, len(id_songs), 500):
+            chunk = id_songs[chunk_start:chunk_start + 500]
+            query = f'''SELECT idSong, idArtist FROM song_artist
+                        WHERE idSong IN ({','.join(['?'] * len(chunk))}) AND idRole = 1 ORDER BY iOrder'''
+            for (id_song, id_artist) in self.music_db.execute(query, chunk):
+                artists_by_song.setdefault(id_song, []).append(id_artist)
+        return artists_by_song
+
+    def _get_album_artists(self, id_albums):
+        artists_by_album = {}
+        for chunk_start in range(0, len(id_albums), 500):
+            chunk = id_albums[chunk_start:chunk_start + 500]
+            query = f'''SELECT idAlbum, idArtist FROM album_artist
+                        WHERE idAlbum IN ({','.join(['?'] * len(chunk))}) ORDER BY iOrder'''
+            for (id_album, id_artist) in self.music_db.execute(query, chunk):
+                artists_by_album.setdefault(id_album, []).append(id_artist)
+        return artists_by_album
+
+    # Files
+
+    def get_directory(self, params):
+        directory = params['directory']
+        if not directory.endswith('/'):
+            directory += '/'
+        local_path = workspace.to_local_path(directory, self.kodi_home, self.share_root)
+        if local_path and os.path.isdir(local_path):
+            files = self._list_file_system(directory, local_path, params.get('properties', []))
+        else:
+            files = self._list_music_directory(directory, params.get('properties', []))
+        if (params.get('sort') or {}).get('method') == 'file':
+            files.sort(key=lambda entry: entry['file'])
+        return {'files': files, 'limits': _limits(len(files))}
+
+    @staticmethod
+    def _list_file_system(directory, local_path, properties):
+        files = []
+        for entry in sorted(os.scandir(local_path), key=lambda entry: entry.name):
+            if entry.is_dir():
+                files.append({'file': f'{directory}{entry.name}/', 'filetype': 'directory', 'label': entry.name,
+                              'type': 'unknown'})
+                continue
+            file_entry = {'file': f'{directory}{entry.name}', 'filetype': 'file', 'label': entry.name, 'type': 'unknown'}
+            if 'size' in properties or 'lastmodified' in properties:
+                stat = entry.stat()
+                values = {'size': stat.st_size,
+                          'lastmodified': datetime.fromtimestamp(int(stat.st_mtime)).strftime('%Y-%m-%d %H:%M:%S')}
+                file_entry.update({key: values[key] for key in properties if key in values})
+            files.append(file_entry)
+        return files
+
+    def _list_music_directory(self, directory, properties):
+        files = []
+        # le sottocartelle dirette sono i path che iniziano con la cartella e hanno un solo segmento in più
+        query = 'SELECT strPath FROM path WHERE strPath > ? AND strPath < ? ORDER BY strPath'
+        subdirectories = {}
+        for (str_path,) in self.music_db.execute(query, (directory, directory + '\uffff')):
+            child = str_path[len(directory):].split('/', 1)[0]
+            if child:
+                subdirectories.setdefault(f'{directory}{child}/', child)
+        for (subdirectory, label) in subdirectories.items():
+            files.append({'file': subdirectory, 'filetype': 'directory', 'label': label, 'type': 'unknown'})
+        song_query = '''
+                     SELECT song.idSong, song.strTitle, song.strFileName, song.idAlbum, album.strMusicBrainzAlbumID
+                     FROM song
+                              JOIN path ON path.idPath = song.idPath
+                              JOIN album ON album.idAlbum = song.idAlbum
+                     WHERE path.strPath = ?
+                     ORDER BY song.strFileName'''
+        rows = self.music_db.execute(song_query, (directory,)).fetchall()
+        if rows:
+            artists_by_song = self._get_song_artists([row[0] for row in rows])
+            artists_by_album = self._get_album_artists(list({row[3] for row in rows}))
+            for (id_song, title, file_name, id_album, album_mbid) in rows:
+                entry = {'file': f'{directory}{file_name}', 'filetype': 'file', 'id': id_song, 'label': title,
+                         'type': 'song'}
+                values = {'albumid': id_album, 'artistid': artists_by_song.get(id_song, []),
+                          'albumartistid': artists_by_album.get(id_album, []),
+                          'musicbrainzalbumid': album_mbid or '', 'title': title}
+                entry.update({key: values[key] for key in properties if key in values})
+                files.append(entry)
+        return files
+
+    # Textures
+
+    def get_textures(self, params):
+        (where, args) = _texture_filter_to_sql(params.get('filter'))
+        query = f'SELECT id, url, cachedurl FROM texture {"WHERE " + where if where else ""} ORDER BY id'
+        properties = params.get('properties', [])
+        textures = []
+        for (id_texture, url, cached_url) in self.textures_db.execute(query, args):
+            texture = {'textureid': id_texture}
+            values = {'url': url, 'cachedurl': cached_url}
+            texture.update({key: values[key] for key in properties if key in values})
+            textures.append(texture)
+        return {'textures': textures}
+
+    def remove_texture(self, params):
+        textures_db = self.textures_db
+        textures_db.execute('DELETE FROM sizes WHERE idtexture = ?', (params['textureid'],))
+        textures_db.execute('DELETE FROM texture WHERE id = ?', (params['textureid'],))
+        textures_db.commit()
+        return 'OK'
+
+
+def _limits(total):
+    return {'start': 0, 'end': total, 'total': total}
+
+
+def _album_properties(row, properties):
+    (id_album, title, label, mbid, genres) = row
+    album = {'albumid': id_album, 'label': title}
+    values = {'albumlabel': label or '', 'musicbrainzalbumid': mbid or '', 'title': title,
+              'genre': genres.split(' / ') if genres else []}
+    album.update({key: values[key] for key in properties if key in values})
+    return album
+
+
+_texture_operators = {
+    'is': ('url = ?', lambda value: value),
+    'isnot': ('url != ?', lambda value: value),
+    'contains': ("instr(url, ?) > 0", lambda value: value),
+    'doesnotcontain': ("instr(url, ?) = 0", lambda value: value),
+    'startswith': ("substr(url, 1, length(?1)) = ?1", lambda value: value),
+    'endswith': ("substr(url, -length(?1)) = ?1", lambda value: value),
+}
+
+
+def _texture_filter_to_sql(texture_filter):
+    """Traduce un filtro di Textures.GetTextures (campo url, con and/or annidati) in una condizione SQL"""
+    if not texture_filter:
+        return '', []
+    for combinator in ('and', 'or'):
+        if combinator in texture_filter:
+            conditions = []
+            args = []
+            for sub_filter in texture_filter.get(combinator):
+                (condition, sub_args) = _texture_filter_to_sql(sub_filter)
+                conditions.append(f'({condition})')
+                args.extend(sub_args)
+            return f' {combinator.upper()} '.join(conditions), args
+    if texture_filter.get('field') != 'url' or texture_filter.get('operator') not in _texture_operators:
+        raise ValueError(f'filtro non supportato {texture_filter}')
+    (condition, convert) = _texture_operators.get(texture_filter.get('operator'))
+    value = convert(texture_filter.get('value'))
+    if '?1' in condition:
+        # i parametri numerati non si mescolano con quelli posizionali: espando il valore due volte
+        return condition.replace('?1', '?'), [value, value]
+    return condition, [value]
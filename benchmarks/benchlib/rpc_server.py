@@ -0,0 +1,44 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _JsonRpcRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive come il webserver di Kodi, le sessioni requests degli add-on riusano la connessione
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jsonrpc':
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = self.rfile.read(length).decode('utf-8')
+        body = self.server.rpc.handle(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class JsonRpcServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, rpc, host='127.0.0.1', port=0):
+        super().__init__((host, port), _JsonRpcRequestHandler)
+        self.rpc = rpc
+
+    @property
+    def url(self):
+        (host, port) = self.server_address[:2]
+        return f'http://{host}:{port}/jsonrpc'
+
+
+def start_json_rpc_server(rpc, host='127.0.0.1', port=0):
+    """Avvia in un thread un webserver JSON-RPC che risponde con il LibraryRpc indicato, come il Kodi centrale"""
+    server = JsonRpcServer(rpc, host, port)
+    thread = threading.Thread(target=server.serve_forever, name='json-rpc-server', daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,219 @@
+# Schema ridotto dei db di Kodi: solo tabelle, colonne e indici letti o scritti dagli add-on del repository.
+# I nomi di tabelle e colonne sono quelli di Kodi 21 (MyMusic83, Textures13, ViewModes6).
+
+music_db_name = 'MyMusic83'
+textures_db_name = 'Textures13'
+view_modes_db_name = 'ViewModes6'
+
+music_schema = '''
+CREATE TABLE artist
+(
+    idArtist               INTEGER PRIMARY KEY,
+    strArtist              TEXT,
+    strSortName            TEXT,
+    strMusicBrainzArtistID TEXT,
+    strType                TEXT,
+    strGender              TEXT,
+    strDisambiguation      TEXT,
+    strBorn                TEXT,
+    strFormed              TEXT,
+    strGenres              TEXT,
+    strMoods               TEXT,
+    strStyles              TEXT,
+    strInstruments         TEXT,
+    strBiography           TEXT,
+    strDied                TEXT,
+    strDisbanded           TEXT,
+    strYearsActive         TEXT,
+    strImage               TEXT,
+    lastScraped            TEXT DEFAULT NULL,
+    dateAdded              TEXT
+);
+CREATE UNIQUE INDEX idxArtist1 ON artist (strArtist COLLATE NOCASE, strMusicBrainzArtistID);
+
+CREATE TABLE album
+(
+    idAlbum                  INTEGER PRIMARY KEY,
+    strAlbum                 TEXT,
+    strMusicBrainzAlbumID    TEXT,
+    strReleaseGroupMBID      TEXT,
+    strArtistDisp            TEXT,
+    strArtistSort            TEXT,
+    strGenres                TEXT,
+    strReleaseDate           TEXT,
+    strOrigReleaseDate       TEXT,
+    strLabel                 TEXT,
+    strType                  TEXT,
+    strReleaseType           TEXT,
+    lastScraped              TEXT DEFAULT NULL,
+    dateAdded                TEXT,
+    dateNew                  TEXT,
+    dateModified             TEXT
+);
+CREATE INDEX idxAlbum ON album (strAlbum);
+CREATE UNIQUE INDEX idxAlbum_2 ON album (strMusicBrainzAlbumID);
+CREATE INDEX idxAlbum_3 ON album (dateAdded);
+
+CREATE TABLE album_artist
+(
+    idArtist  INTEGER,
+    idAlbum   INTEGER,
+    iOrder    INTEGER,
+    strArtist TEXT
+);
+CREATE UNIQUE INDEX idxAlbumArtist_1 ON album_artist (idAlbum, idArtist);
+CREATE UNIQUE INDEX idxAlbumArtist_2 ON album_artist (idArtist, idAlbum);
+
+CREATE TABLE genre
+(
+    idGenre  INTEGER PRIMARY KEY,
+    strGenre TEXT
+);
+CREATE INDEX idxGenre ON genre (strGenre);
+
+CREATE TABLE path
+(
+    idPath  INTEGER PRIMARY KEY,
+    strPath TEXT,
+    strHash TEXT
+);
+CREATE UNIQUE INDEX idxPath ON path (strPath);
+
+CREATE TABLE song
+(
+    idSong        INTEGER PRIMARY KEY,
+    idAlbum       INTEGER,
+    idPath        INTEGER,
+    strArtistDisp TEXT,
+    strGenres     TEXT,
+    strTitle      VARCHAR(512),
+    iTrack        INTEGER,
+    iDuration     INTEGER,
+    strFileName   TEXT,
+    strMusicBrainzTrackID TEXT,
+    dateAdded     TEXT,
+    dateNew       TEXT,
+    dateModified  TEXT
+);
+CREATE INDEX idxSong ON song (strTitle);
+CREATE INDEX idxSong3 ON song (idAlbum);
+CREATE INDEX idxSong6 ON song (idPath, strFileName);
+
+CREATE TABLE song_artist
+(
+    idArtist  INTEGER,
+    idSong    INTEGER,
+    idRole    INTEGER,
+    iOrder    INTEGER,
+    strArtist TEXT
+);
+CREATE UNIQUE INDEX idxSongArtist_1 ON song_artist (idSong, idArtist, idRole);
+CREATE INDEX idxSongArtist_2 ON song_artist (idSong, idRole);
+CREATE INDEX idxSongArtist_3 ON song_artist (idArtist, idRole);
+
+CREATE TABLE song_genre
+(
+    idGenre INTEGER,
+    idSong  INTEGER,
+    iOrder  INTEGER
+);
+CREATE UNIQUE INDEX idxSongGenre_1 ON song_genre (idSong, idGenre);
+CREATE UNIQUE INDEX idxSongGenre_2 ON song_genre (idGenre, idSong);
+
+CREATE TABLE discography
+(
+    idDisc              INTEGER PRIMARY KEY,
+    idArtist            INTEGER,
+    strAlbum            TEXT,
+    strYear             TEXT,
+    strReleaseGroupMBID TEXT
+);
+CREATE INDEX idxDiscography_1 ON discography (idArtist);
+
+CREATE TABLE art
+(
+    art_id     INTEGER PRIMARY KEY,
+    media_id   INTEGER,
+    media_type TEXT,
+    type       TEXT,
+    url        TEXT
+);
+CREATE INDEX ix_art ON art (media_id, media_type, type);
+
+CREATE TABLE source
+(
+    idSource     INTEGER PRIMARY KEY,
+    strName      TEXT,
+    strMultipath TEXT
+);
+
+CREATE TABLE versiontagscan
+(
+    idVersion       INTEGER,
+    iNeedsScan      INTEGER,
+    lastscanned     VARCHAR(20),
+    lastcleaned     VARCHAR(20),
+    artistlinksupdated VARCHAR(20),
+    genresupdated   VARCHAR(20)
+);
+
+CREATE VIEW songview AS
+SELECT song.idSong,
+       song.strArtistDisp,
+       song.strArtistDisp          AS strArtists,
+       song.strGenres,
+       song.strTitle,
+       song.iTrack,
+       song.iDuration,
+       song.strFileName,
+       song.strMusicBrainzTrackID,
+       song.dateAdded,
+       path.idPath,
+       path.strPath,
+       album.idAlbum,
+       album.strAlbum,
+       album.strMusicBrainzAlbumID,
+       album.strLabel
+FROM song
+         JOIN album ON song.idAlbum = album.idAlbum
+         JOIN path ON song.idPath = path.idPath;
+'''
+
+textures_schema = '''
+CREATE TABLE texture
+(
+    id            INTEGER PRIMARY KEY,
+    url           TEXT,
+    cachedurl     TEXT,
+    imagehash     TEXT,
+    lasthashcheck TEXT
+);
+CREATE INDEX idxTexture ON texture (url);
+
+CREATE TABLE sizes
+(
+    idtexture   INTEGER,
+    size        INTEGER,
+    width       INTEGER,
+    height      INTEGER,
+    usecount    INTEGER,
+    lastusetime TEXT
+);
+CREATE INDEX idxSize ON sizes (idtexture, size);
+'''
+
+view_modes_schema = '''
+CREATE TABLE view
+(
+    idView         INTEGER PRIMARY KEY,
+    window         INTEGER,
+    path           TEXT,
+    viewMode       INTEGER,
+    sortMethod     INTEGER,
+    sortOrder      INTEGER,
+    sortAttributes INTEGER,
+    skin           TEXT
+);
+CREATE INDEX idxViews ON view (path);
+CREATE INDEX idxViewsWindow ON view (window);
+'''
@@ -0,0 +1,58 @@
+import os
+import re
+
+# variabili d'ambiente con cui il runner passa le cartelle del dataset al processo dell'add-on
+kodi_home_env = 'BENCH_KODI_HOME'
+share_root_env = 'BENCH_SHARE_ROOT'
+
+_special_roots = {
+    'userdata': 'userdata',
+    'profile': 'userdata',
+    'masterprofile': 'userdata',
+    'database': os.path.join('userdata', 'Database'),
+    'thumbnails': os.path.join('userdata', 'Thumbnails'),
+    'temp': 'temp',
+    'home': '',
+    'xbmc': 'xbmc',
+}
+_network_url_pattern = re.compile(r'^(smb|nfs|dav|davs|http|https)://([^/]+)/?(.*)$')
+
+
+def get_kodi_home():
+    return os.environ.get(kodi_home_env, os.path.join(os.getcwd(), 'kodi'))
+
+
+def get_share_root():
+    return os.environ.get(share_root_env, os.path.join(os.getcwd(), 'share'))
+
+
+def translate_special(path, kodi_home=None):
+    """Come xbmcvfs.translatePath: traduce solo i percorsi special://, gli altri restano invariati"""
+    if not path.startswith('special://'):
+        return path
+    kodi_home = kodi_home or get_kodi_home()
+    root, _, rest = path[len('special://'):].partition('/')
+    base = _special_roots.get(root)
+    if base is None:
+        base = root
+    return os.path.join(kodi_home, base, rest)
+
+
+def to_local_path(path, kodi_home=None, share_root=None):
+    """
+    Percorso su disco per un url di Kodi: special:// finisce nella home Kodi del dataset,
+    le condivisioni di rete (smb://host/..., davs://host/...) sotto la cartella share/host/...
+    Restituisce None per gli url che non corrispondono a file (image://, musicdb://, ...).
+    """
+    if path.startswith('special://'):
+        return translate_special(path, kodi_home)
+    network_match = _network_url_pattern.match(path)
+    if network_match:
+        (_, host, rest) = network_match.groups()
+        share_root = share_root or get_share_root()
+        # i percorsi WebDAV arrivano codificati, su disco i nomi sono in chiaro
+        from urllib.parse import unquote
+        return os.path.join(share_root, host, unquote(rest))
+    if '://' in path:
+        return None
+    return path
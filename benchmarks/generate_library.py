@@ -0,0 +1,481 @@
+"""
+Genera una libreria musicale sintetica per i benchmark: db centrale (MyMusic in SQLite, letto dallo shim di pymysql
+e dal finto Kodi centrale), home Kodi locale con MyMusic, Textures e ViewModes già popolati, centralsettings.json
+e la condivisione di rete con etichette e playlist.
+
+Il db locale è una copia del centrale con id diversi e qualche differenza voluta (album nuovi non ancora scansionati,
+art cambiate o mancanti, biografie aggiornate), così gli add-on hanno lavoro reale da fare.
+A parità di seme il risultato è identico.
+
+    python benchmarks/generate_library.py --size 10k
+    python benchmarks/generate_library.py --albums 2500 --out /tmp/bench-2500
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import time
+import unicodedata
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchlib import schema  # noqa: E402
+
+sizes = {'1k': 1000, '10k': 10000, '100k': 100000}
+default_seed = 20240917
+smb_host = 'bench-nas'
+smb_source_base = f'smb://{smb_host}/music'
+webdav_source_base = f'davs://{smb_host}/music'
+artworker_base = 'https://art.bench.local'
+genres = ['Acid Jazz', 'Afrobeat', 'Ambient', 'Art Rock', 'Blues', 'Bossa Nova', 'Britpop', 'Cantautori', 'Dark Wave',
+          'Disco', 'Doom Metal', 'Drum and Bass', 'Dub', 'Electro', 'Folk', 'Free Jazz', 'Funk', 'Garage Rock',
+          'Glam Rock', 'Grunge', 'Hard Bop', 'Hardcore', 'Hip Hop', 'House', 'IDM', 'Indie Pop', 'Italo Disco',
+          'Jazz Fusion', 'Krautrock', 'Lo-Fi', 'Math Rock', 'Modal Jazz', 'New Wave', 'Noise Rock', 'Post-Punk',
+          'Post-Rock', 'Progressive Rock', 'Psychedelic Rock', 'Punk', 'Reggae', 'Shoegaze', 'Soul', 'Space Rock',
+          'Stoner Rock', 'Synth-Pop', 'Techno', 'Trip Hop']
+words = ['acid', 'aurora', 'basalto', 'cenere', 'cobalto', 'delta', 'eco', 'ferro', 'fiume', 'gelo', 'grano', 'isola',
+         'lampo', 'luna', 'marea', 'nebbia', 'notte', 'onda', 'ossido', 'polvere', 'quarzo', 'radice', 'rame', 'sale',
+         'selva', 'specchio', 'tempesta', 'terra', 'vento', 'vetro', 'zolfo', 'zenit', 'ámbar', 'città', 'perché',
+         'über', 'naïve', 'señal', 'façade']
+moods = ['Aggressive', 'Brooding', 'Calm', 'Dreamy', 'Energetic', 'Gloomy', 'Hypnotic', 'Melancholy', 'Playful']
+instruments = ['bass', 'drums', 'guitar', 'piano', 'saxophone', 'synthesizer', 'trumpet', 'vocals']
+# id locali spostati rispetto al centrale: nella realtà le due istanze numerano in modo indipendente
+local_id_offsets = {'album': 3, 'song': 11, 'artist': 5, 'path': 2}
+
+
+def log(msg):
+    print(msg, flush=True)
+
+
+def new_mbid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def sentence(rng, min_words, max_words):
+    return ' '.join(rng.choice(words) for _ in range(rng.randint(min_words, max_words))).capitalize()
+
+
+def title(rng, min_words=1, max_words=4):
+    return ' '.join(rng.choice(words).capitalize() for _ in range(rng.randint(min_words, max_words)))
+
+
+def folder_name(name):
+    return re.sub(r'[\\/:*?"<>|]', '_', name)
+
+
+def kodi_image_url(url, prefix='image://{0}/'):
+    # stessa codifica di encode_to_kodi_image_url degli add-on
+    encoded_url = prefix.format(quote(url, '()!')).replace('~', '%7e')
+    return re.sub(r'%[0-9A-F]{2}', lambda mo: mo.group().lower(), encoded_url)
+
+
+def label_filename(label):
+    # come get_label_filename del label preloader
+    sanitized = re.sub(r"[^\w\s\+\-]", '', label)
+    sanitized = ''.join(c for c in sanitized if unicodedata.category(c)[0] != 'C')
+    return sanitized.lower().replace(' ', '')
+
+
+def label_folder(label):
+    initial = label[0].upper()
+    if not initial.isalpha():
+        return 'NSP'
+    return unicodedata.normalize('NFKD', initial).encode('ascii', 'ignore').decode() or 'NSP'
+
+
+def connect(db_path, ddl):
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    db = sqlite3.connect(db_path)
+    db.execute('PRAGMA journal_mode=OFF')
+    db.execute('PRAGMA synchronous=OFF')
+    db.executescript(ddl)
+    return db
+
+
+def build_artists(rng, artists_count, now):
+    artists = []
+    for id_artist in range(1, artists_count + 1):
+        is_group = rng.random() < 0.6
+        start_year = rng.randint(1950, 2015)
+        artists.append((
+            id_artist,
+            f'{title(rng, 1, 3)} {id_artist}',
+            new_mbid(rng),
+            'Group' if is_group else 'Person',
+            '' if is_group else rng.choice(['Male', 'Female', 'Other']),
+            sentence(rng, 0, 3),
+            '' if is_group else str(start_year),
+            str(start_year) if is_group else '',
+            ' / '.join(rng.sample(genres, rng.randint(1, 3))),
+            ' / '.join(rng.sample(moods, rng.randint(0, 3))),
+            ' / '.join(rng.sample(genres, rng.randint(0, 2))),
+            ' / '.join(rng.sample(instruments, rng.randint(0, 3))),
+            ' '.join(sentence(rng, 8, 20) + '.' for _ in range(rng.randint(2, 12))),
+            '' if rng.random() < 0.9 else str(start_year + rng.randint(20, 60)),
+            '' if rng.random() < 0.8 else str(start_year + rng.randint(2, 30)),
+            f'{start_year} - ' + ('' if rng.random() < 0.7 else str(start_year + rng.randint(2, 40))),
+            '',
+            (now - timedelta(days=rng.randint(1, 900))).strftime('%Y-%m-%d %H:%M:%S'),
+            (now - timedelta(days=rng.randint(900, 1500))).strftime('%Y-%m-%d %H:%M:%S'),
+        ))
+    return artists
+
+
+def generate_central(db_path, albums_count, songs_per_album, rng):
+    """Scrive il db centrale e restituisce le informazioni che servono per condivisione e texture"""
+    now = datetime(2025, 6, 1, 12, 0, 0)
+    db = connect(db_path, schema.music_schema)
+    artists_count = max(20, albums_count // 4)
+    artists = build_artists(rng, artists_count, now)
+    db.executemany(f'INSERT INTO artist (idArtist, strArtist, strMusicBrainzArtistID, strType, strGender, '
+                   f'strDisambiguation, strBorn, strFormed, strGenres, strMoods, strStyles, strInstruments, '
+                   f'strBiography, strDied, strDisbanded, strYearsActive, strImage, lastScraped, dateAdded) '
+                   f'VALUES ({",".join(["?"] * 19)})', artists)
+    db.executemany('INSERT INTO genre (idGenre, strGenre) VALUES (?, ?)',
+                   [(id_genre, genre) for (id_genre, genre) in enumerate(genres, 1)])
+    labels_count = max(10, albums_count // 15)
+    labels = sorted({f'{title(rng, 1, 2)} Records' if rng.random() < 0.7 else f'{rng.randint(1, 99)} {title(rng, 1, 1)}'
+                     for _ in range(labels_count)})
+    discography = []
+    for (id_artist, *_) in artists:
+        for _ in range(rng.randint(2, 10)):
+            discography.append((id_artist, title(rng), str(rng.randint(1960, 2025)), new_mbid(rng)))
+    db.executemany('INSERT INTO discography (idArtist, strAlbum, strYear, strReleaseGroupMBID) VALUES (?, ?, ?, ?)',
+                   discography)
+    artist_art = []
+    for (id_artist, _, artist_mbid, *_) in artists:
+        artist_art.append((id_artist, 'artist', 'thumb', f'{artworker_base}/artist/{artist_mbid}/thumb.jpg'))
+        if rng.random() < 0.7:
+            artist_art.append((id_artist, 'artist', 'fanart', f'{artworker_base}/artist/{artist_mbid}/fanart.jpg'))
+    db.executemany('INSERT INTO art (media_id, media_type, type, url) VALUES (?, ?, ?, ?)', artist_art)
+
+    source_path = f'{smb_source_base}/'
+    paths = {source_path: 1}
+    db.execute('INSERT INTO source (idSource, strName, strMultipath) VALUES (1, ?, ?)', ('Musica', source_path))
+    db.execute("INSERT INTO versiontagscan VALUES (82, 0, ?, ?, ?, ?)",
+               tuple([(now - timedelta(days=3)).strftime('%Y-%m-%d %H:%M:%S')] * 4))
+
+    def path_id(path):
+        if path not in paths:
+            paths[path] = len(paths) + 1
+        return paths[path]
+
+    albums = []
+    album_artists = []
+    songs = []
+    song_artists = []
+    song_genres = []
+    arts = []
+    id_song = 0
+    shared_folder = None
+    start = now - timedelta(days=3 * 365)
+    for id_album in range(1, albums_count + 1):
+        (id_artist, artist_name, *_) = artists[min(int(rng.paretovariate(1.2)) - 1, artists_count - 1)
+                                               if rng.random() < 0.3 else rng.randrange(artists_count)]
+        album_title = title(rng)
+        year = rng.randint(1960, 2025)
+        album_mbid = new_mbid(rng) if rng.random() < 0.99 else None
+        album_genres = rng.sample(range(1, len(genres) + 1), rng.randint(1, 2))
+        date_added = start + timedelta(seconds=int((now - start).total_seconds() * id_album / albums_count))
+        album_folder = f'{source_path}{folder_name(artist_name)}/{year} - {folder_name(album_title)} [{id_album}]/'
+        # qualche cartella con più album insieme, come le raccolte di singoli
+        if shared_folder and rng.random() < 0.01:
+            album_folder = shared_folder
+        elif rng.random() < 0.02:
+            shared_folder = album_folder
+        path_id(f'{source_path}{folder_name(artist_name)}/')
+        discs = 2 if rng.random() < 0.05 else 1
+        albums.append((id_album, album_title, album_mbid, new_mbid(rng), artist_name, artist_name,
+                       ' / '.join(genres[id_genre - 1] for id_genre in album_genres), str(year), str(year),
+                       rng.choice(labels), 'album', 'album', date_added.strftime('%Y-%m-%d %H:%M:%S'),
+                       date_added.strftime('%Y-%m-%d %H:%M:%S')))
+        album_artists.append((id_artist, id_album, 0, artist_name))
+        album_thumb = f'{album_folder}folder.jpg'
+        arts.append((id_album, 'album', 'thumb', album_thumb))
+        if rng.random() < 0.5:
+            arts.append((id_album, 'album', 'fanart', f'{artworker_base}/album/{album_mbid}/fanart.jpg'))
+        tracks = max(1, songs_per_album + rng.randint(-3, 3))
+        for track in range(1, tracks + 1):
+            id_song += 1
+            disc = 1 + (track - 1) * discs // tracks
+            song_folder = f'{album_folder}CD{disc}/' if discs > 1 else album_folder
+            song_title = title(rng, 1, 5)
+            songs.append((id_song, id_album, path_id(song_folder), artist_name,
+                          ' / '.join(genres[id_genre - 1] for id_genre in album_genres), song_title,
+                          disc * 65536 + track, rng.randint(90, 600),
+                          f'{track:02d} - {folder_name(song_title)}.flac', new_mbid(rng),
+                          date_added.strftime('%Y-%m-%d %H:%M:%S')))
+            song_artists.append((id_artist, id_song, 1, 0, artist_name))
+            if rng.random() < 0.1:
+                (guest_id, guest_name, *_) = artists[rng.randrange(artists_count)]
+                if guest_id != id_artist:
+                    song_artists.append((guest_id, id_song, 1, 1, guest_name))
+            for (order, id_genre) in enumerate(album_genres):
+                song_genres.append((id_genre, id_song, order))
+            arts.append((id_song, 'song', 'thumb', album_thumb))
+        if len(songs) > 50000:
+            _flush_central(db, albums, album_artists, songs, song_artists, song_genres, arts)
+    _flush_central(db, albums, album_artists, songs, song_artists, song_genres, arts)
+    db.executemany('INSERT INTO path (idPath, strPath, strHash) VALUES (?, ?, ?)',
+                   [(id_path, path, f'{id_path:08x}') for (path, id_path) in paths.items()])
+    db.commit()
+    (songs_count,) = db.execute('SELECT COUNT(*) FROM song').fetchone()
+    db.close()
+    return {'artists': artists_count, 'albums': albums_count, 'songs': songs_count, 'labels': labels,
+            'paths': len(paths)}
+
+
+def _flush_central(db, albums, album_artists, songs, song_artists, song_genres, arts):
+    db.executemany(f'INSERT INTO album (idAlbum, strAlbum, strMusicBrainzAlbumID, strReleaseGroupMBID, '
+                   f'strArtistDisp, strArtistSort, strGenres, strReleaseDate, strOrigReleaseDate, strLabel, '
+                   f'strType, strReleaseType, dateAdded, lastScraped) VALUES ({",".join(["?"] * 14)})', albums)
+    db.executemany('INSERT INTO album_artist (idArtist, idAlbum, iOrder, strArtist) VALUES (?, ?, ?, ?)', album_artists)
+    db.executemany(f'INSERT INTO song (idSong, idAlbum, idPath, strArtistDisp, strGenres, strTitle, iTrack, iDuration, '
+                   f'strFileName, strMusicBrainzTrackID, dateAdded) VALUES ({",".join(["?"] * 11)})', songs)
+    db.executemany('INSERT INTO song_artist (idArtist, idSong, idRole, iOrder, strArtist) VALUES (?, ?, ?, ?, ?)',
+                   song_artists)
+    db.executemany('INSERT INTO song_genre (idGenre, idSong, iOrder) VALUES (?, ?, ?)', song_genres)
+    db.executemany('INSERT INTO art (media_id, media_type, type, url) VALUES (?, ?, ?, ?)', arts)
+    for rows in (albums, album_artists, songs, song_artists, song_genres, arts):
+        rows.clear()
+
+
+def derive_local(central_db_path, local_db_path, drift, rng):
+    """Il db locale parte dal centrale: id spostati e una quota drift di differenze da riallineare"""
+    shutil.copyfile(central_db_path, local_db_path)
+    db = sqlite3.connect(local_db_path)
+    db.execute('PRAGMA journal_mode=OFF')
+    db.execute('PRAGMA synchronous=OFF')
+    (albums_count,) = db.execute('SELECT MAX(idAlbum) FROM album').fetchone()
+    missing_albums = max(1, int(albums_count * drift / 2))
+    # gli ultimi album aggiunti al centrale non sono ancora arrivati sul locale
+    first_missing = albums_count - missing_albums + 1
+    db.execute('''DELETE FROM art WHERE media_type = 'song'
+                  AND media_id IN (SELECT idSong FROM song WHERE idAlbum >= ?)''', (first_missing,))
+    db.execute("DELETE FROM art WHERE media_type = 'album' AND media_id >= ?", (first_missing,))
+    db.execute('DELETE FROM song_artist WHERE idSong IN (SELECT idSong FROM song WHERE idAlbum >= ?)', (first_missing,))
+    db.execute('DELETE FROM song_genre WHERE idSong IN (SELECT idSong FROM song WHERE idAlbum >= ?)', (first_missing,))
+    db.execute('DELETE FROM song WHERE idAlbum >= ?', (first_missing,))
+    db.execute('DELETE FROM album_artist WHERE idAlbum >= ?', (first_missing,))
+    db.execute('DELETE FROM album WHERE idAlbum >= ?', (first_missing,))
+    # restano le cartelle degli artisti, spariscono quelle degli album mancanti
+    db.execute("DELETE FROM path WHERE idPath NOT IN (SELECT idPath FROM song) "
+               "AND (strPath LIKE '%]/' OR strPath GLOB '*/CD[0-9]/')")
+    changed = max(1, int(albums_count * drift))
+    changed_albums = rng.sample(range(1, first_missing), min(changed, first_missing - 1))
+    db.executemany("UPDATE art SET url = 'smb://old-nas/music/' || media_id || '/cover.jpg' "
+                   "WHERE media_type = 'album' AND type = 'thumb' AND media_id = ?",
+                   [(id_album,) for id_album in changed_albums[:len(changed_albums) // 2]])
+    db.executemany("DELETE FROM art WHERE media_type = 'album' AND type = 'fanart' AND media_id = ?",
+                   [(id_album,) for id_album in changed_albums[len(changed_albums) // 2:]])
+    db.executemany("INSERT INTO art (media_id, media_type, type, url) VALUES (?, 'album', 'banner', ?)",
+                   [(id_album, f'{artworker_base}/banner/{id_album}.jpg') for id_album in changed_albums[::5]])
+    db.executemany("DELETE FROM art WHERE media_type = 'song' AND media_id IN "
+                   "(SELECT idSong FROM song WHERE idAlbum = ?)",
+                   [(id_album,) for id_album in changed_albums[::3]])
+    (artists_count,) = db.execute('SELECT MAX(idArtist) FROM artist').fetchone()
+    changed_artists = rng.sample(range(1, artists_count + 1), max(1, int(artists_count * drift)))
+    db.executemany("UPDATE artist SET strBiography = 'Biografia da aggiornare', lastScraped = NULL "
+                   "WHERE idArtist = ?", [(id_artist,) for id_artist in changed_artists])
+    db.executemany("DELETE FROM discography WHERE idArtist = ?",
+                   [(id_artist,) for id_artist in changed_artists[::2]])
+    # id locali indipendenti dal centrale
+    _shift_ids(db)
+    db.commit()
+    db.execute('VACUUM')
+    db.close()
+
+
+def _shift_ids(db):
+    album_offset = local_id_offsets.get('album')
+    song_offset = local_id_offsets.get('song')
+    artist_offset = local_id_offsets.get('artist')
+    path_offset = local_id_offsets.get('path')
+    shifts = [
+        ('album', {'idAlbum': album_offset}),
+        ('song', {'idSong': song_offset, 'idAlbum': album_offset, 'idPath': path_offset}),
+        ('artist', {'idArtist': artist_offset}),
+        ('path', {'idPath': path_offset}),
+        ('album_artist', {'idAlbum': album_offset, 'idArtist': artist_offset}),
+        ('song_artist', {'idSong': song_offset, 'idArtist': artist_offset}),
+        ('song_genre', {'idSong': song_offset}),
+        ('discography', {'idArtist': artist_offset}),
+    ]
+    for (table, offsets) in shifts:
+        # prima in negativo e poi in positivo, così nessuna riga collide con le chiavi ancora da spostare
+        negated = ', '.join(f'{column} = -({column} + {offset})' for (column, offset) in offsets.items())
+        db.execute(f'UPDATE {table} SET {negated}')
+        db.execute(f"UPDATE {table} SET {', '.join(f'{column} = -{column}' for column in offsets)}")
+    db.execute("""UPDATE art SET media_id = media_id + CASE media_type WHEN 'album' THEN ? WHEN 'song' THEN ?
+                                                                      WHEN 'artist' THEN ? ELSE 0 END""",
+               (album_offset, song_offset, artist_offset))
+
+
+def generate_textures(textures_db_path, local_db_path, rng):
+    """Cache delle texture come dopo qualche mese d'uso: art correnti, miniature dei file, etichette e orfane"""
+    db = connect(textures_db_path, schema.textures_schema)
+    music_db = sqlite3.connect(local_db_path)
+    urls = {}
+    for (url,) in music_db.execute("SELECT DISTINCT url FROM art WHERE type LIKE 'thumb%' AND url IS NOT NULL"):
+        urls[kodi_image_url(url)] = None
+    first_tracks = '''SELECT strPath || strFileName FROM songview
+                      WHERE idSong IN (SELECT MIN(idSong) FROM song GROUP BY idPath)'''
+    for (full_path,) in music_db.execute(first_tracks):
+        if rng.random() < 0.8:
+            urls[kodi_image_url(full_path, 'image://music@{0}/')] = None
+    music_db.close()
+    orphans = max(10, len(urls) // 20)
+    for index in range(orphans):
+        urls[kodi_image_url(f'smb://old-nas/music/removed/{index}/folder.jpg')] = None
+    rows = []
+    for (id_texture, url) in enumerate(urls, 1):
+        cached_name = f'{id_texture:08x}'
+        rows.append((id_texture, url, f'{cached_name[0]}/{cached_name}.jpg', cached_name, '2025-05-01 10:00:00'))
+    db.executemany('INSERT INTO texture (id, url, cachedurl, imagehash, lasthashcheck) VALUES (?, ?, ?, ?, ?)', rows)
+    db.executemany('INSERT INTO sizes (idtexture, size, width, height, usecount, lastusetime) '
+                   'VALUES (?, 1, 500, 500, ?, ?)',
+                   [(row[0], rng.randint(1, 50), '2025-05-20 20:00:00') for row in rows])
+    db.commit()
+    db.close()
+    return len(rows)
+
+
+def generate_view_modes(view_modes_db_path):
+    db = connect(view_modes_db_path, schema.view_modes_schema)
+    db.execute("INSERT INTO view (window, path, viewMode, sortMethod, sortOrder, sortAttributes, skin) "
+               "VALUES (10502, 'musicdb://', 66036, 1, 1, 0, 'skin.confluence')")
+    db.commit()
+    db.close()
+
+
+def generate_share(share_root, kodi_userdata, labels, rng):
+    """Cartelle della condivisione: etichette (nodi xml e loghi) e playlist centrali, più le playlist locali"""
+    music_share = os.path.join(share_root, smb_host, 'music')
+    etichette = os.path.join(music_share, 'etichette')
+    os.makedirs(etichette, exist_ok=True)
+    with open(os.path.join(etichette, 'index.xml'), 'w', encoding='utf-8') as index:
+        index.write('<?xml version="1.0" encoding="UTF-8"?>\n<node order="80">\n    <label>Etichette</label>\n'
+                    '    <icon>DefaultMusicAlbums.png</icon>\n</node>\n')
+    for label in labels:
+        folder = os.path.join(etichette, label_folder(label))
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+            with open(os.path.join(folder, 'index.xml'), 'w', encoding='utf-8') as index:
+                index.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<node order="1">\n'
+                            f'    <label>{label_folder(label)}</label>\n</node>\n')
+        file_stem = label_filename(label)
+        icon = 'DefaultMusicAlbums.png'
+        if rng.random() < 0.8:
+            icon = f'special://masterprofile/library/music/etichette/{label_folder(label)}/{file_stem}.jpg'
+            with open(os.path.join(folder, f'{file_stem}.jpg'), 'wb') as logo:
+                logo.write(b'\xff\xd8\xff\xe0' + rng.randbytes(2048))
+        escaped_label = label.replace('&', '&amp;').replace('<', '&lt;')
+        with open(os.path.join(folder, f'{file_stem}.xml'), 'w', encoding='utf-8') as node:
+            node.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<node order="1" type="filter">\n'
+                       f'    <label>{escaped_label}</label>\n    <icon>{icon}</icon>\n    <content>albums</content>\n'
+                       f'    <rule field="label" operator="is">\n        <value>{escaped_label}</value>\n    </rule>\n'
+                       f'</node>\n')
+    central_playlists = os.path.join(music_share, 'playlists', 'music')
+    local_playlists = os.path.join(kodi_userdata, 'playlists', 'music')
+    os.makedirs(central_playlists, exist_ok=True)
+    os.makedirs(local_playlists, exist_ok=True)
+    for index in range(30):
+        playlist = (f'<?xml version="1.0" encoding="UTF-8"?>\n<smartplaylist type="songs">\n'
+                    f'    <name>Playlist {index}</name>\n    <match>all</match>\n'
+                    f'    <rule field="genre" operator="is"><value>{rng.choice(genres)}</value></rule>\n'
+                    f'</smartplaylist>\n')
+        with open(os.path.join(central_playlists, f'playlist{index:02d}.xsp'), 'w', encoding='utf-8') as f:
+            f.write(playlist)
+        if index < 20:
+            with open(os.path.join(local_playlists, f'playlist{index:02d}.xsp'), 'w', encoding='utf-8') as f:
+                f.write(playlist)
+    for index in range(3):
+        with open(os.path.join(local_playlists, f'obsoleta{index}.xsp'), 'w', encoding='utf-8') as f:
+            f.write('<smartplaylist type="songs"><name>Obsoleta</name></smartplaylist>\n')
+
+
+def write_central_settings(kodi_userdata):
+    settings = {
+        'host': 'bench-central',
+        'user': 'kodi',
+        'pass': 'kodi',
+        'port': 3306,
+        'serverhost': '127.0.0.1',
+        'rpcserveruser': 'kodi',
+        'rpcserverpass': 'kodi',
+        # impostata dal runner con la porta del finto Kodi centrale
+        'rpcserverport': 0,
+        'artworker': '',
+        'artworkerbasehost': artworker_base,
+        'sourcetype': 'samba',
+        'downloadfolder': '',
+        'scanserver': '',
+        'scanuser': '',
+        'scanpass': '',
+        'sambasource': smb_source_base,
+        'webdavsource': webdav_source_base,
+        'centralplaylist': 'true',
+    }
+    with open(os.path.join(kodi_userdata, 'centralsettings.json'), 'w', encoding='utf-8') as f:
+        json.dump(settings, f, indent=2)
+
+
+def generate(out_dir, albums_count, songs_per_album=10, drift=0.02, seed=default_seed):
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    central_dir = os.path.join(out_dir, 'central')
+    kodi_userdata = os.path.join(out_dir, 'kodi', 'userdata')
+    database_dir = os.path.join(kodi_userdata, 'Database')
+    share_root = os.path.join(out_dir, 'share')
+    for directory in (central_dir, database_dir, share_root, os.path.join(out_dir, 'kodi', 'temp')):
+        os.makedirs(directory)
+    central_db_path = os.path.join(central_dir, f'{schema.music_db_name}.db')
+    local_db_path = os.path.join(database_dir, f'{schema.music_db_name}.db')
+    log(f'Genero il db centrale con {albums_count} album')
+    info = generate_central(central_db_path, albums_count, songs_per_album, rng)
+    log('Derivo il db locale')
+    derive_local(central_db_path, local_db_path, drift, rng)
+    log('Genero cache delle texture, viste e condivisione')
+    info['textures'] = generate_textures(os.path.join(database_dir, f'{schema.textures_db_name}.db'),
+                                         local_db_path, rng)
+    generate_view_modes(os.path.join(database_dir, f'{schema.view_modes_db_name}.db'))
+    generate_share(share_root, kodi_userdata, info.get('labels'), rng)
+    write_central_settings(kodi_userdata)
+    info['labels'] = len(info.get('labels'))
+    info.update({'seed': seed, 'drift': drift, 'songs_per_album': songs_per_album,
+                 'music_db': schema.music_db_name, 'generated_in': round(time.perf_counter() - start, 1)})
+    with open(os.path.join(out_dir, 'dataset.json'), 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+    log(f'Dataset pronto in {out_dir}: {info}')
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', choices=sorted(sizes), help='dimensione predefinita (numero di album)')
+    parser.add_argument('--albums', type=int, help='numero di album, in alternativa a --size')
+    parser.add_argument('--songs-per-album', type=int, default=10)
+    parser.add_argument('--drift', type=float, default=0.02, help='quota di album e artisti diversi sul locale')
+    parser.add_argument('--seed', type=int, default=default_seed)
+    parser.add_argument('--out', help='cartella del dataset (predefinita benchmarks/data/<size>)')
+    args = parser.parse_args()
+    if not args.size and not args.albums:
+        parser.error('indicare --size o --albums')
+    albums_count = args.albums or sizes.get(args.size)
+    name = args.size or str(albums_count)
+    out_dir = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', name)
+    generate(out_dir, albums_count, args.songs_per_album, args.drift, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Regressione per get_album_path_by_id di service.autoexec.library.sync: la query con il raggruppamento per idPath
+deve restituire esattamente le righe della vecchia subquery correlata, sia sull'intera libreria sia a blocchi di id.
+
+    python benchmarks/regression/album_path_query.py
+    python benchmarks/regression/album_path_query.py --dataset benchmarks/data/10k
+
+Senza --dataset genera al volo una libreria da 1000 album in una cartella temporanea.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+benchmarks_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+repo_dir = os.path.join(os.path.dirname(benchmarks_dir), 'repo')
+addon_dir = os.path.join(repo_dir, 'service.autoexec.library.sync')
+sys.path[:0] = [benchmarks_dir, os.path.join(benchmarks_dir, 'stubs'), os.path.join(benchmarks_dir, 'sqlite_pymysql'),
+                os.path.join(repo_dir, 'script.module.zab.commons', 'lib'), addon_dir]
+
+import generate_library  # noqa: E402
+from benchlib import schema  # noqa: E402
+
+reference_query = '''
+            SELECT DISTINCT song.idAlbum,
+                            strPath,
+                            song.idPath
+            FROM song
+                     JOIN path ON song.idPath = path.idPath
+            WHERE song.idAlbum IN (%s)
+              AND (SELECT COUNT(DISTINCT (idAlbum))
+                   FROM song AS song2
+                   WHERE idPath = song.idPath) = 1
+            ORDER BY strPath ASC'''
+id_albums_subquery = 'SELECT idAlbum FROM album'
+chunk_size = 999
+
+
+def load_library_sync():
+    spec = importlib.util.spec_from_file_location('library_sync', os.path.join(addon_dir, 'default.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fetch(db, query, id_albums=None):
+    if id_albums is None:
+        return db.execute(query % id_albums_subquery).fetchall()
+    rows = []
+    for i in range(0, len(id_albums), chunk_size):
+        chunk = id_albums[i:i + chunk_size]
+        rows.extend(db.execute(query % ','.join(['?'] * len(chunk)), chunk).fetchall())
+    return rows
+
+
+def timed(db, query, id_albums=None):
+    start = time.perf_counter()
+    rows = fetch(db, query, id_albums)
+    return rows, time.perf_counter() - start
+
+
+def check_db(label, db_path, query, rng):
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    id_albums = [id_album for (id_album,) in db.execute('SELECT idAlbum FROM album')]
+    sample = rng.sample(id_albums, len(id_albums) // 3) + [max(id_albums) + 1000]
+    ok = True
+    for (mode, ids) in (('libreria intera', None), ('a blocchi', sample)):
+        (expected, reference_seconds) = timed(db, reference_query, ids)
+        (actual, seconds) = timed(db, query, ids)
+        shared = sum(1 for (count,) in db.execute(
+            'SELECT COUNT(DISTINCT idAlbum) FROM song GROUP BY idPath HAVING COUNT(DISTINCT idAlbum) > 1'))
+        same = expected == actual
+        ok = ok and same
+        print(f'{label:<9}{mode:<17}{len(actual):>8} righe  {"identiche" if same else "DIVERSE":<10}'
+              f'vecchia {reference_seconds:.3f}s  nuova {seconds:.3f}s  ({shared} percorsi con più album)')
+    db.close()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', help='cartella prodotta da generate_library.py')
+    parser.add_argument('--seed', type=int, default=generate_library.default_seed)
+    args = parser.parse_args()
+    dataset_dir = args.dataset
+    temp_dir = None
+    if not dataset_dir:
+        temp_dir = tempfile.mkdtemp(prefix='bench-regression-')
+        dataset_dir = os.path.join(temp_dir, 'dataset')
+        generate_library.generate(dataset_dir, 1000, seed=args.seed)
+    try:
+        query = load_library_sync().album_paths_query
+        rng = random.Random(args.seed)
+        databases = (('centrale', os.path.join(dataset_dir, 'central', f'{schema.music_db_name}.db')),
+                     ('locale', os.path.join(dataset_dir, 'kodi', 'userdata', 'Database',
+                                             f'{schema.music_db_name}.db')))
+        results = [check_db(label, db_path, query, rng) for (label, db_path) in databases]
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
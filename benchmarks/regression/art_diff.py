@@ -0,0 +1,150 @@
+"""
+Regressione per il confronto delle art dell'intera libreria di script.scanner.trigger: il motore SQL
+(diff_library_arts_in_sql) deve restituire gli stessi inserimenti, rimozioni e aggiornamenti del motore python
+(process_media_art_with_batching). Dopo la libreria generata il confronto viene ripetuto aggiungendo brani con
+titoli che si normalizzano nella stessa chiave sul centrale e sul locale, titoli locali che differiscono solo per
+maiuscole e art con url vuoto.
+
+    python benchmarks/regression/art_diff.py
+    python benchmarks/regression/art_diff.py --dataset benchmarks/data/10k
+
+Senza --dataset genera al volo una libreria da 1000 album in una cartella temporanea.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+benchmarks_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+repo_dir = os.path.join(os.path.dirname(benchmarks_dir), 'repo')
+addon_dir = os.path.join(repo_dir, 'script.scanner.trigger')
+sys.path[:0] = [benchmarks_dir, os.path.join(benchmarks_dir, 'stubs'), os.path.join(benchmarks_dir, 'sqlite_pymysql'),
+                os.path.join(repo_dir, 'script.module.zab.commons', 'lib'), addon_dir]
+
+import generate_library  # noqa: E402
+from benchlib import schema  # noqa: E402
+from run_benchmarks import prepare_workspace  # noqa: E402
+
+
+def load_scanner_trigger():
+    spec = importlib.util.spec_from_file_location('scanner_trigger', os.path.join(addon_dir, 'default.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def python_engine(scanner_trigger, db_params, music_db_name):
+    (_, central_album_arts, central_song_arts) = scanner_trigger._fetch_align_data(True, [], [], db_params,
+                                                                                    music_db_name, True, True)
+    (_, local_album_arts, local_song_arts) = scanner_trigger._fetch_align_data(False, [], [], db_params,
+                                                                                music_db_name, True, True)
+    return scanner_trigger.process_media_art_with_batching(db_params, music_db_name, central_album_arts,
+                                                           local_album_arts, central_song_arts, local_song_arts, {}, {})
+
+
+def check_case(label, scanner_trigger, db_params, music_db_name):
+    import db_scan
+    start = time.perf_counter()
+    expected = python_engine(scanner_trigger, db_params, music_db_name)
+    python_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = scanner_trigger.diff_library_arts_in_sql(db_params, music_db_name)
+    sql_seconds = time.perf_counter() - start
+    db_scan.close_local_dbs()
+    db_scan.close_central_db_pools()
+    same = True
+    counts = []
+    for key in ('arts_to_insert', 'arts_to_remove', 'arts_to_update'):
+        (expected_set, actual_set) = (set(expected.get(key)), set(actual.get(key)))
+        counts.append(len(expected_set))
+        if expected_set != actual_set:
+            same = False
+            print(f'  {key} solo python: {sorted(expected_set - actual_set, key=repr)[:10]}')
+            print(f'  {key} solo sql: {sorted(actual_set - expected_set, key=repr)[:10]}')
+    print(f'{label:<24}{counts[0]:>7} ins {counts[1]:>6} rim {counts[2]:>6} agg  {"identici" if same else "DIVERSI":<10}'
+          f'python {python_seconds:.3f}s  sql {sql_seconds:.3f}s')
+    return same
+
+
+def add_song_variants(db_path, id_songs, variant, arts):
+    """Copia i brani indicati con il titolo trasformato da variant e aggiunge alla copia le art indicate"""
+    db = sqlite3.connect(db_path)
+    for id_song in id_songs:
+        cursor = db.execute('INSERT INTO song (idAlbum, idPath, strTitle, strFileName) '
+                            'SELECT idAlbum, idPath, ?, strFileName || \'.dup\' FROM song WHERE idSong = ?',
+                            (variant(db.execute('SELECT strTitle FROM song WHERE idSong = ?',
+                                                (id_song,)).fetchone()[0]), id_song))
+        db.executemany("INSERT INTO art (media_id, media_type, type, url) VALUES (?, 'song', ?, ?)",
+                       [(cursor.lastrowid, art_type, url) for (art_type, url) in arts])
+    db.commit()
+    db.close()
+
+
+def sample_songs(db_path, rng, count):
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    id_songs = [id_song for (id_song,) in db.execute("SELECT idSong FROM song WHERE strTitle != '' ORDER BY idSong")]
+    db.close()
+    return rng.sample(id_songs, min(count, len(id_songs)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', help='cartella prodotta da generate_library.py')
+    parser.add_argument('--seed', type=int, default=generate_library.default_seed)
+    args = parser.parse_args()
+    temp_dir = tempfile.mkdtemp(prefix='bench-regression-')
+    dataset_dir = args.dataset
+    if not dataset_dir:
+        dataset_dir = os.path.join(temp_dir, 'dataset')
+        generate_library.generate(dataset_dir, 1000, seed=args.seed)
+    (workspace, kodi_home) = prepare_workspace(dataset_dir, {})
+    # i casi limite modificano anche il centrale: lavoro su una copia
+    central_dir = os.path.join(temp_dir, 'central')
+    shutil.copytree(os.path.join(dataset_dir, 'central'), central_dir)
+    os.environ.update(BENCH_KODI_HOME=kodi_home, BENCH_SHARE_ROOT=os.path.join(dataset_dir, 'share'),
+                      BENCH_CENTRAL_DB=central_dir, BENCH_ADDON_ID='script.scanner.trigger',
+                      BENCH_ADDON_PATH=addon_dir)
+    local_db_path = os.path.join(kodi_home, 'userdata', 'Database', f'{schema.music_db_name}.db')
+    central_db_path = os.path.join(central_dir, f'{schema.music_db_name}.db')
+    rng = random.Random(args.seed)
+    results = []
+    try:
+        import db_scan
+        scanner_trigger = load_scanner_trigger()
+        db_params = db_scan.get_db_params()
+        music_db_name = db_scan.get_latest_kodi_dbs().get('MyMusic')
+        results.append(check_case('libreria generata', scanner_trigger, db_params, music_db_name))
+        # sul centrale un secondo brano con la stessa chiave e art diverse: deve vincere l'ultimo, senza mescolarle
+        add_song_variants(central_db_path, sample_songs(central_db_path, rng, 30), lambda title: f' {title.upper()}  ',
+                          [('thumb', 'smb://bench-nas/music/variante.jpg'), ('fanart', 'smb://bench-nas/music/f.jpg')])
+        results.append(check_case('chiave doppia centrale', scanner_trigger, db_params, music_db_name))
+        # sul locale l'ultimo brano con la stessa chiave ha un titolo diverso da quello del centrale
+        add_song_variants(local_db_path, sample_songs(local_db_path, rng, 30), lambda title: title.upper(),
+                          [('thumb', 'smb://bench-nas/music/locale.jpg')])
+        results.append(check_case('chiave doppia locale', scanner_trigger, db_params, music_db_name))
+        # art con url vuoto da entrambe le parti
+        for (db_path, media_type) in ((central_db_path, 'song'), (local_db_path, 'song'),
+                                      (central_db_path, 'album'), (local_db_path, 'album')):
+            db = sqlite3.connect(db_path)
+            db.execute("UPDATE art SET url = '' WHERE media_type = ? AND art_id IN "
+                       "(SELECT art_id FROM art WHERE media_type = ? ORDER BY art_id LIMIT 20 OFFSET ?)",
+                       (media_type, media_type, rng.randrange(100)))
+            db.commit()
+            db.close()
+        results.append(check_case('url vuoti', scanner_trigger, db_params, music_db_name))
+    finally:
+        import db_scan
+        db_scan.close_local_dbs()
+        db_scan.close_central_db_pools()
+        shutil.rmtree(workspace, ignore_errors=True)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
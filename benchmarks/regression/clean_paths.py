@@ -0,0 +1,154 @@
+"""
+Regressione per clean_paths di script.scanner.trigger: la ricerca binaria sui path dei brani ordinati deve
+cancellare esattamente i path che cancellava la vecchia DELETE con NOT EXISTS e SUBSTR.
+Al MyMusic locale del dataset vengono aggiunti path senza brani con strPath NULL, vuoti, annidati, con caratteri
+unicode e prefissi non di cartella; il confronto viene poi ripetuto con un brano dall'idPath NULL.
+Ogni caso gira su due copie dello stesso db, una per la vecchia query e una per la nuova funzione.
+
+    python benchmarks/regression/clean_paths.py
+    python benchmarks/regression/clean_paths.py --dataset benchmarks/data/10k
+
+Senza --dataset genera al volo una libreria da 1000 album in una cartella temporanea.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+benchmarks_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+repo_dir = os.path.join(os.path.dirname(benchmarks_dir), 'repo')
+addon_dir = os.path.join(repo_dir, 'script.scanner.trigger')
+sys.path[:0] = [benchmarks_dir, os.path.join(benchmarks_dir, 'stubs'), os.path.join(benchmarks_dir, 'sqlite_pymysql'),
+                os.path.join(repo_dir, 'script.module.zab.commons', 'lib'), addon_dir]
+
+import generate_library  # noqa: E402
+from benchlib import schema  # noqa: E402
+from run_benchmarks import prepare_workspace  # noqa: E402
+
+reference_query = '''WITH song_paths AS (SELECT p.strPath
+                                   FROM path p
+                                   WHERE p.idPath IN (SELECT idPath FROM song))
+    DELETE
+    FROM path
+    WHERE idPath NOT IN (SELECT idPath FROM song)
+      AND NOT EXISTS (SELECT 1
+                      FROM song_paths sp
+                      WHERE SUBSTR(sp.strPath, 1, LENGTH(path.strPath)) = path.strPath)'''
+
+
+def load_scanner_trigger():
+    spec = importlib.util.spec_from_file_location('scanner_trigger', os.path.join(addon_dir, 'default.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parent_path(path):
+    return path[:path.rstrip('/').rfind('/') + 1]
+
+
+def edge_case_paths(db, rng, tag):
+    """Path senza brani da aggiungere al db: ognuno mette alla prova un caso del confronto per prefisso"""
+    song_paths = [path for (path,) in db.execute('SELECT DISTINCT strPath FROM path '
+                                                 'WHERE idPath IN (SELECT idPath FROM song) AND strPath IS NOT NULL '
+                                                 'ORDER BY strPath')]
+    unicode_paths = [path for path in song_paths if not path.isascii()] or song_paths
+    sample = rng.sample(song_paths, min(20, len(song_paths)))
+    paths = [None, None, '', 'smb://', 'smb://bench-nas/music/', f'smb://bench-nas/music/{tag} inesistente/',
+             f'smb://bench-nas/music/{tag} 50%_off/', f'smb://bench-nas/music/Ünicode {tag} inesistente/']
+    for path in sample:
+        paths.extend([parent_path(path), path[:-3], f'{path}{tag} annidato/', path.upper(), f'{path[:-1]} {tag}/'])
+    for path in rng.sample(unicode_paths, min(5, len(unicode_paths))):
+        paths.extend([parent_path(path), path[:len(path) // 2], path.casefold(), f'{path}Ålbum {tag}/'])
+    return paths
+
+
+def add_paths(db_path, paths):
+    db = sqlite3.connect(db_path)
+    db.executemany('INSERT OR IGNORE INTO path (strPath) VALUES (?)', [(path,) for path in paths])
+    db.commit()
+    db.close()
+
+
+def remaining_paths(db_path):
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    rows = db.execute('SELECT idPath, strPath FROM path ORDER BY idPath').fetchall()
+    db.close()
+    return rows
+
+
+def check_case(label, scanner_trigger, db_path, reference_path):
+    import db_scan
+    db_scan.close_local_dbs()
+    shutil.copyfile(db_path, reference_path)
+    before = len(remaining_paths(db_path))
+    reference_db = sqlite3.connect(reference_path)
+    start = time.perf_counter()
+    reference_db.execute(reference_query)
+    reference_db.commit()
+    reference_seconds = time.perf_counter() - start
+    reference_db.close()
+    start = time.perf_counter()
+    scanner_trigger.clean_paths()
+    seconds = time.perf_counter() - start
+    db_scan.close_local_dbs()
+    expected = remaining_paths(reference_path)
+    actual = remaining_paths(db_path)
+    same = expected == actual
+    print(f'{label:<22}{before - len(expected):>7} path rimossi  {"identici" if same else "DIVERSI":<10}'
+          f'vecchia {reference_seconds:.3f}s  nuova {seconds:.3f}s')
+    if not same:
+        print(f'  solo vecchia query: {sorted(set(expected) - set(actual), key=repr)[:10]}')
+        print(f'  solo nuova funzione: {sorted(set(actual) - set(expected), key=repr)[:10]}')
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', help='cartella prodotta da generate_library.py')
+    parser.add_argument('--seed', type=int, default=generate_library.default_seed)
+    args = parser.parse_args()
+    temp_dir = tempfile.mkdtemp(prefix='bench-regression-')
+    dataset_dir = args.dataset
+    if not dataset_dir:
+        dataset_dir = os.path.join(temp_dir, 'dataset')
+        generate_library.generate(dataset_dir, 1000, seed=args.seed)
+    (workspace, kodi_home) = prepare_workspace(dataset_dir, {})
+    os.environ.update(BENCH_KODI_HOME=kodi_home, BENCH_SHARE_ROOT=os.path.join(dataset_dir, 'share'),
+                      BENCH_CENTRAL_DB=os.path.join(dataset_dir, 'central'),
+                      BENCH_ADDON_ID='script.scanner.trigger', BENCH_ADDON_PATH=addon_dir)
+    db_path = os.path.join(kodi_home, 'userdata', 'Database', f'{schema.music_db_name}.db')
+    reference_path = os.path.join(temp_dir, 'reference.db')
+    rng = random.Random(args.seed)
+    results = []
+    try:
+        scanner_trigger = load_scanner_trigger()
+        results.append(check_case('libreria generata', scanner_trigger, db_path, reference_path))
+        db = sqlite3.connect(db_path)
+        paths = edge_case_paths(db, rng, 'base')
+        db.close()
+        add_paths(db_path, paths)
+        results.append(check_case('casi limite', scanner_trigger, db_path, reference_path))
+        # con un idPath NULL in song il NOT IN non è mai vero: nessun path va rimosso
+        db = sqlite3.connect(db_path)
+        paths = edge_case_paths(db, rng, 'null')
+        db.execute("INSERT INTO song (idAlbum, idPath, strTitle, strFileName) VALUES (NULL, NULL, 'orfano', 'x.flac')")
+        db.commit()
+        db.close()
+        add_paths(db_path, paths)
+        results.append(check_case('song.idPath NULL', scanner_trigger, db_path, reference_path))
+    finally:
+        import db_scan
+        db_scan.close_local_dbs()
+        shutil.rmtree(workspace, ignore_errors=True)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
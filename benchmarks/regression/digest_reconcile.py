@@ -0,0 +1,103 @@
+"""
+Regressione per il confronto per impronte di service.autoexec.library.sync: con reconcilemode 'digest'
+get_releases_to_align deve restituire gli stessi percorsi del confronto completo 'paths'.
+Riporta anche righe e byte (stimati sulla rappresentazione delle righe) letti dal db centrale nei due modi.
+
+    python benchmarks/regression/digest_reconcile.py
+    python benchmarks/regression/digest_reconcile.py --dataset benchmarks/data/100k
+"""
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+benchmarks_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+repo_dir = os.path.join(os.path.dirname(benchmarks_dir), 'repo')
+addon_dir = os.path.join(repo_dir, 'service.autoexec.library.sync')
+sys.path[:0] = [benchmarks_dir, os.path.join(benchmarks_dir, 'stubs'), os.path.join(benchmarks_dir, 'sqlite_pymysql'),
+                os.path.join(repo_dir, 'script.module.zab.commons', 'lib'), addon_dir]
+
+import generate_library  # noqa: E402
+from run_benchmarks import prepare_workspace  # noqa: E402
+
+transfer = {'rows': 0, 'bytes': 0}
+
+
+def count_transfer(cursor_class):
+    def counting(fetch):
+        def counting_fetch(self, *args):
+            rows = fetch(self, *args)
+            for row in (rows if isinstance(rows, list) else [rows] if rows is not None else []):
+                transfer['rows'] += 1
+                transfer['bytes'] += len(repr(row))
+            return rows
+        return counting_fetch
+    for name in ('fetchone', 'fetchmany', 'fetchall'):
+        setattr(cursor_class, name, counting(getattr(cursor_class, name)))
+
+
+def load_library_sync():
+    spec = importlib.util.spec_from_file_location('library_sync', os.path.join(addon_dir, 'default.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def reconcile(library_sync, db_params, music_db_name, mode):
+    db_params = dict(db_params, reconcilemode=mode)
+    transfer.update(rows=0, bytes=0)
+    start = time.perf_counter()
+    sources = library_sync.get_sources(db_params)
+    # percorsi e album dell'istantanea servono a entrambi i modi: li escludo dal conteggio
+    snapshot = library_sync.CentralSnapshot(db_params, music_db_name)
+    transfer.update(rows=0, bytes=0)
+    paths = library_sync.get_releases_to_align(db_params, music_db_name, sources, snapshot)
+    return set(paths), time.perf_counter() - start, dict(transfer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', help='cartella prodotta da generate_library.py')
+    parser.add_argument('--seed', type=int, default=generate_library.default_seed)
+    args = parser.parse_args()
+    temp_dir = tempfile.mkdtemp(prefix='bench-regression-')
+    dataset_dir = args.dataset
+    if not dataset_dir:
+        dataset_dir = os.path.join(temp_dir, 'dataset')
+        generate_library.generate(dataset_dir, 1000, seed=args.seed)
+    (workspace, kodi_home) = prepare_workspace(dataset_dir, {})
+    os.environ.update(BENCH_KODI_HOME=kodi_home, BENCH_SHARE_ROOT=os.path.join(dataset_dir, 'share'),
+                      BENCH_CENTRAL_DB=os.path.join(dataset_dir, 'central'),
+                      BENCH_ADDON_ID='service.autoexec.library.sync', BENCH_ADDON_PATH=addon_dir)
+    try:
+        import db_scan
+        from pymysql import cursors
+        count_transfer(cursors.Cursor)
+        library_sync = load_library_sync()
+        db_params = db_scan.get_db_params()
+        music_db_name = db_scan.get_latest_kodi_dbs().get('MyMusic')
+        (expected, paths_seconds, paths_transfer) = reconcile(library_sync, db_params, music_db_name, 'paths')
+        (actual, digest_seconds, digest_transfer) = reconcile(library_sync, db_params, music_db_name, 'digest')
+        db_scan.close_local_dbs()
+        db_scan.close_central_db_pools()
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    print(json.dumps({
+        'paths': {'seconds': round(paths_seconds, 3), **paths_transfer},
+        'digest': {'seconds': round(digest_seconds, 3), **digest_transfer},
+        'paths_to_scan': len(expected),
+        'identical': expected == actual,
+    }, indent=2))
+    if expected != actual:
+        print(f'solo confronto completo: {sorted(expected - actual)[:10]}')
+        print(f'solo impronte: {sorted(actual - expected)[:10]}')
+    sys.exit(0 if expected == actual else 1)
+
+
+if __name__ == '__main__':
+    main()
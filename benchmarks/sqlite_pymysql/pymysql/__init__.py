@@ -0,0 +1,153 @@
+"""
+Sostituto di pymysql per i benchmark: le connessioni al MariaDB centrale vengono aperte in sola lettura
+sul file SQLite indicato da BENCH_CENTRAL_DB (o, se è una cartella, su <cartella>/<database>.db).
+Le query MySQL degli add-on vengono adattate a SQLite da cursors.translate_query, le funzioni MySQL mancanti
+(MD5, CONCAT_WS, CONV, LEFT, BIT_XOR, GROUP_CONCAT con ordinamento e separatore) sono registrate sulla connessione.
+"""
+import hashlib
+import os
+import sqlite3
+
+from pymysql import cursors
+from pymysql.constants import CLIENT
+
+central_db_env = 'BENCH_CENTRAL_DB'
+version_info = (1, 2, 0, 'final', 0)
+__version__ = '1.2.0'
+
+
+class MySQLError(Exception):
+    pass
+
+
+class Error(MySQLError):
+    pass
+
+
+class OperationalError(Error):
+    pass
+
+
+class ProgrammingError(Error):
+    pass
+
+
+def _md5(value):
+    if value is None:
+        return None
+    return hashlib.md5(str(value).encode('utf-8')).hexdigest()
+
+
+def _concat_ws(separator, *values):
+    return separator.join(str(value) for value in values if value is not None)
+
+
+def _concat(*values):
+    if any(value is None for value in values):
+        return None
+    return ''.join(str(value) for value in values)
+
+
+def _conv(value, from_base, to_base):
+    if value is None:
+        return None
+    number = int(str(value), int(from_base))
+    if int(to_base) == 10:
+        return str(number)
+    return format(number, 'x' if int(to_base) == 16 else 'o' if int(to_base) == 8 else 'b').upper()
+
+
+def _left(value, length):
+    return None if value is None else str(value)[:length]
+
+
+class _SortedGroupConcat:
+    # l'ordine di GROUP_CONCAT(... ORDER BY ...) non è riproducibile su SQLite: ordino sui valori concatenati
+    def __init__(self):
+        self.values = []
+        self.separator = ','
+
+    def step(self, value, separator):
+        self.separator = separator
+        if value is not None:
+            self.values.append(str(value))
+
+    def finalize(self):
+        return self.separator.join(sorted(self.values)) if self.values else None
+
+
+class _BitXor:
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        if value is not None:
+            self.value ^= int(value)
+
+    def finalize(self):
+        return self.value
+
+
+def _resolve_db_path(database):
+    central_db = os.environ.get(central_db_env)
+    if not central_db:
+        raise OperationalError(f'{central_db_env} non impostata: nessun db centrale per i benchmark')
+    if os.path.isdir(central_db):
+        return os.path.join(central_db, f'{database}.db')
+    return central_db
+
+
+class Connection:
+    def __init__(self, host=None, user=None, password='', database=None, port=3306, cursorclass=cursors.Cursor,
+                 autocommit=False, client_flag=0, **kwargs):
+        self.host = host
+        # come MariaDB, più statement in una richiesta solo con CLIENT.MULTI_STATEMENTS
+        self.multi_statements = bool(client_flag & CLIENT.MULTI_STATEMENTS)
+        self.db = database
+        self.cursorclass = cursorclass
+        db_path = _resolve_db_path(database)
+        if not os.path.exists(db_path):
+            raise OperationalError(f'db centrale {db_path} inesistente')
+        self._db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, check_same_thread=False)
+        self._db.create_function('MD5', 1, _md5, deterministic=True)
+        self._db.create_function('CONCAT_WS', -1, _concat_ws, deterministic=True)
+        self._db.create_function('CONCAT', -1, _concat, deterministic=True)
+        self._db.create_function('bench_left', 2, _left, deterministic=True)
+        self._db.create_function('CONV', 3, _conv, deterministic=True)
+        self._db.create_aggregate('bench_group_concat', 2, _SortedGroupConcat)
+        self._db.create_aggregate('BIT_XOR', 1, _BitXor)
+        self.open = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def cursor(self, cursor=None):
+        return (cursor or self.cursorclass)(self)
+
+    def ping(self, reconnect=True):
+        if not self.open:
+            raise OperationalError('connessione chiusa')
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def select_db(self, db):
+        self.db = db
+
+    def close(self):
+        if self.open:
+            self._db.close()
+            self.open = False
+
+
+def connect(*args, **kwargs):
+    return Connection(*args, **kwargs)
+
+
+Connect = connect
@@ -0,0 +1,2 @@
+# flag di pymysql.constants.CLIENT usati dagli add-on, ignorati dalla connessione SQLite
+MULTI_STATEMENTS = 1 << 16
@@ -0,0 +1,166 @@
+import re
+
+# piccolo sottoinsieme del dialetto MySQL usato dalle query degli add-on, riscritto per SQLite
+_group_concat_pattern = re.compile(r"GROUP_CONCAT\((.*?)\s+ORDER BY\s+[^()]*?\s+SEPARATOR\s+'([^']*)'\)",
+                                   re.IGNORECASE | re.DOTALL)
+_separator_pattern = re.compile(r"GROUP_CONCAT\((.*?)\s+SEPARATOR\s+'([^']*)'\)", re.IGNORECASE | re.DOTALL)
+_left_function_pattern = re.compile(r'\bLEFT\s*\(', re.IGNORECASE)
+_named_param_pattern = re.compile(r'%\((\w+)\)s')
+# variabili di sessione MySQL (SET SESSION ...), senza equivalente su SQLite
+_set_session_pattern = re.compile(r'^\s*SET\s+(SESSION\s+)?\w+\s*=', re.IGNORECASE)
+
+
+def translate_query(query, args):
+    """Riscrive una query MySQL con parametri in stile pymysql in una query SQLite con parametri qmark"""
+    query = _group_concat_pattern.sub(r"bench_group_concat(\1, '\2')", query)
+    query = _separator_pattern.sub(r"bench_group_concat(\1, '\2')", query)
+    query = _left_function_pattern.sub('bench_left(', query)
+    if args is None:
+        return query, ()
+    if isinstance(args, dict):
+        query = _named_param_pattern.sub(r':\1', query)
+        return query.replace('%%', '%'), args
+    return query.replace('%s', '?').replace('%%', '%'), tuple(args)
+
+
+def _literal(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class Cursor:
+    """Cursore con risultati bufferizzati, righe come tuple"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._db.cursor()
+        self.description = None
+        self.rowcount = -1
+        self.lastrowid = None
+        self._pending_statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+
+    def mogrify(self, query, args=None):
+        if args is None:
+            return query
+        if isinstance(args, dict):
+            return query % {key: _literal(value) for key, value in args.items()}
+        return query % tuple(_literal(value) for value in args)
+
+    def execute(self, query, args=None):
+        (sqlite_query, sqlite_args) = translate_query(query, args)
+        # pymysql con CLIENT.MULTI_STATEMENTS accetta più statement: li eseguo uno alla volta con nextset
+        # i parametri di pymysql valgono per l'intera richiesta: a ogni statement vanno i suoi
+        statements = []
+        for statement in _split_statements(sqlite_query):
+            if statement.strip():
+                if isinstance(sqlite_args, dict):
+                    statements.append((statement, sqlite_args))
+                else:
+                    placeholders = _count_placeholders(statement)
+                    statements.append((statement, sqlite_args[:placeholders]))
+                    sqlite_args = sqlite_args[placeholders:]
+        if not statements:
+            statements = [(sqlite_query, sqlite_args)]
+        if len(statements) > 1 and not self.connection.multi_statements:
+            import pymysql
+            raise pymysql.ProgrammingError('più statement in una richiesta senza CLIENT.MULTI_STATEMENTS')
+        self._pending_statements = statements[1:]
+        self._execute_single(*statements[0])
+        return self.rowcount
+
+    def _execute_single(self, query, args=()):
+        if _set_session_pattern.match(query):
+            query, args = 'SELECT 1 WHERE 0', ()
+        self._cursor.execute(query, args)
+        self.description = self._cursor.description
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+
+    def executemany(self, query, args):
+        rowcount = 0
+        for single_args in args:
+            self.execute(query, single_args)
+            rowcount += max(self.rowcount, 0)
+        self.rowcount = rowcount
+        return rowcount
+
+    def nextset(self):
+        if not self._pending_statements:
+            return None
+        self._execute_single(*self._pending_statements.pop(0))
+        return True
+
+    def _convert(self, row):
+        return row
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return None if row is None else self._convert(row)
+
+    def fetchmany(self, size=None):
+        return [self._convert(row) for row in self._cursor.fetchmany(size or 1)]
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+
+class DictCursorMixin:
+    def _convert(self, row):
+        return dict(zip([column[0] for column in self.description], row))
+
+
+class DictCursor(DictCursorMixin, Cursor):
+    pass
+
+
+class SSCursor(Cursor):
+    """Con SQLite le righe vengono comunque lette a richiesta: il cursore lato server coincide con quello normale"""
+
+
+class SSDictCursor(DictCursorMixin, SSCursor):
+    pass
+
+
+def _split_statements(query):
+    # separo sui ; fuori dalle stringhe, sufficiente per le query degli add-on
+    statements = []
+    current = []
+    in_string = False
+    for char in query:
+        if char == "'":
+            in_string = not in_string
+        if char == ';' and not in_string:
+            statements.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+    statements.append(''.join(current))
+    return statements
+
+
+def _count_placeholders(statement):
+    count = 0
+    in_string = False
+    for char in statement:
+        if char == "'":
+            in_string = not in_string
+        elif char == '?' and not in_string:
+            count += 1
+    return count
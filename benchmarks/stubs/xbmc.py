@@ -0,0 +1,187 @@
+"""
+Stub del modulo xbmc per eseguire gli add-on fuori da Kodi.
+executeJSONRPC risponde con il LibraryRpc della libreria sintetica: se BENCH_LOCAL_RPC indica l'url di un server
+la richiesta passa di lì (fuori dal processo misurato, come in Kodi), altrimenti viene servita nel processo.
+Le notifiche (fine scansione, NotifyAll, fine degli add-on lanciati con RunAddon) restano in coda e vengono
+consegnate ai Monitor alla prima waitForAbort; un Monitor che aspetta senza nulla in coda risulta in abort,
+così le attese degli add-on non restano mai appese.
+"""
+import json
+import os
+import re
+import threading
+import time
+import urllib.request
+import weakref
+
+LOGDEBUG = 0
+LOGINFO = 1
+LOGWARNING = 2
+LOGERROR = 3
+LOGFATAL = 4
+LOGNONE = 5
+
+local_rpc_url_env = 'BENCH_LOCAL_RPC'
+debug_log_env = 'BENCH_DEBUG_LOG'
+log_file_env = 'BENCH_LOG_FILE'
+
+# notifica inviata quando termina un add-on lanciato con RunAddon, come fanno gli add-on del repository
+addon_finished_notifications = {
+    'script.scanner.trigger': 'Other.OnScanAndAlignFinished',
+    'script.texture.refresh': 'Other.OnTextureRefreshed',
+    'script.label.preloader': 'Other.OnLabelsPreloaded',
+    'script.texture.cache.cleaner': 'Other.OnTextureCacheCleaned',
+    'script.file.viewer': 'Other.OnViewSwitched',
+}
+
+# contatori consultati dal runner a fine esecuzione
+stats = {'log': 0, 'jsonrpc': 0, 'builtins': []}
+
+_monitors = weakref.WeakSet()
+_pending_notifications = []
+_notifications_lock = threading.Lock()
+_local_rpc = None
+_local_rpc_lock = threading.Lock()
+_log_file = None
+_builtin_pattern = re.compile(r'^(\w+)\((.*)\)$', re.DOTALL)
+
+
+def log(msg, level=LOGDEBUG):
+    global _log_file
+    stats['log'] += 1
+    log_file_path = os.environ.get(log_file_env)
+    if log_file_path:
+        if _log_file is None:
+            _log_file = open(log_file_path, 'a', encoding='utf-8')
+        _log_file.write(f'{time.strftime("%H:%M:%S")} {level} {msg}\n')
+
+
+def _get_local_rpc():
+    global _local_rpc
+    with _local_rpc_lock:
+        if _local_rpc is None:
+            from benchlib import library_rpc, workspace
+            database_path = workspace.translate_special('special://userdata/Database/')
+            db_files = sorted(os.listdir(database_path))
+            music_db = [f for f in db_files if f.startswith('MyMusic') and f.endswith('.db')][-1]
+            textures_db = [f for f in db_files if f.startswith('Textures') and f.endswith('.db')][-1]
+            _local_rpc = library_rpc.LibraryRpc(os.path.join(database_path, music_db),
+                                                os.path.join(database_path, textures_db))
+        return _local_rpc
+
+
+def executeJSONRPC(jsonrpccommand):
+    stats['jsonrpc'] += 1
+    local_rpc_url = os.environ.get(local_rpc_url_env)
+    if local_rpc_url:
+        request = urllib.request.Request(local_rpc_url, data=jsonrpccommand.encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            result = response.read().decode('utf-8')
+    else:
+        result = _get_local_rpc().handle(jsonrpccommand)
+    if '"AudioLibrary.Scan"' in jsonrpccommand:
+        _queue_notification('xbmc', 'AudioLibrary.OnScanFinished', None)
+    return result
+
+
+def executebuiltin(function, wait=False):
+    stats['builtins'].append(function)
+    builtin_match = _builtin_pattern.match(function.strip())
+    if not builtin_match:
+        return
+    (name, args) = builtin_match.groups()
+    if name == 'RunAddon':
+        addon_id = args.split(',', 1)[0].strip()
+        method = addon_finished_notifications.get(addon_id)
+        if method:
+            _queue_notification(addon_id, method, None)
+    elif name == 'NotifyAll':
+        (sender, _, message) = args.partition(',')
+        _queue_notification(sender.strip(), f'Other.{message.strip()}', None)
+
+
+def getCondVisibility(condition):
+    if condition == 'System.GetBool(debug.showloginfo)':
+        return os.environ.get(debug_log_env) == '1'
+    return False
+
+
+def getInfoLabel(cLine):
+    return ''
+
+
+def sleep(timemillis):
+    time.sleep(timemillis / 1000)
+
+
+def _queue_notification(sender, method, data):
+    with _notifications_lock:
+        _pending_notifications.append((sender, method, data))
+
+
+class Monitor:
+    def __init__(self):
+        self._starved = False
+        _monitors.add(self)
+
+    def abortRequested(self):
+        return self._starved
+
+    def waitForAbort(self, timeout=-1):
+        with _notifications_lock:
+            notifications = list(_pending_notifications)
+            _pending_notifications.clear()
+        if not notifications:
+            # nessuno manderà più nulla: per l'add-on è come uno spegnimento di Kodi
+            self._starved = True
+            return True
+        for monitor in list(_monitors):
+            monitor._starved = False
+            for (sender, method, data) in notifications:
+                if method == 'AudioLibrary.OnScanFinished':
+                    monitor.onScanFinished('music')
+                else:
+                    monitor.onNotification(sender, method, json.dumps(data))
+        return False
+
+    def onNotification(self, sender, method, data):
+        pass
+
+    def onScanStarted(self, library):
+        pass
+
+    def onScanFinished(self, library):
+        pass
+
+    def onSettingsChanged(self):
+        pass
+
+
+class Player:
+    def isPlaying(self):
+        return False
+
+    def play(self, item=None, listitem=None, windowed=False, startpos=-1):
+        pass
+
+    def stop(self):
+        pass
+
+
+class PlayList:
+    def __init__(self, playList):
+        self.items = []
+
+    def add(self, url, listitem=None, index=-1):
+        self.items.append(url)
+
+    def clear(self):
+        self.items = []
+
+    def size(self):
+        return len(self.items)
+
+
+PLAYLIST_MUSIC = 0
+PLAYLIST_VIDEO = 1
@@ -0,0 +1,50 @@
+"""
+Stub del modulo xbmcaddon: l'add-on corrente è quello indicato dal runner con BENCH_ADDON_ID e BENCH_ADDON_PATH,
+le impostazioni si possono passare in BENCH_ADDON_SETTINGS come JSON.
+"""
+import json
+import os
+
+addon_id_env = 'BENCH_ADDON_ID'
+addon_path_env = 'BENCH_ADDON_PATH'
+addon_settings_env = 'BENCH_ADDON_SETTINGS'
+
+
+class Addon:
+    def __init__(self, id=None):
+        self._id = id or os.environ.get(addon_id_env, 'script.benchmark')
+        addon_path = os.environ.get(addon_path_env, '')
+        if id and addon_path and os.path.basename(addon_path.rstrip(os.sep)) != id:
+            addon_path = os.path.join(os.path.dirname(addon_path.rstrip(os.sep)), id)
+        self._path = addon_path
+        self._settings = json.loads(os.environ.get(addon_settings_env) or '{}')
+
+    def getAddonInfo(self, id):
+        info = {
+            'id': self._id,
+            'name': self._id,
+            'path': self._path,
+            'profile': f'special://profile/addon_data/{self._id}/',
+            'version': '0.0.0',
+            'icon': os.path.join(self._path, 'icon.png'),
+            'author': 'benchmark',
+        }
+        return info.get(id, '')
+
+    def getSetting(self, id):
+        return str(self._settings.get(id, ''))
+
+    def getSettingBool(self, id):
+        return bool(self._settings.get(id, False))
+
+    def getSettingInt(self, id):
+        return int(self._settings.get(id, 0) or 0)
+
+    def getSettingString(self, id):
+        return self.getSetting(id)
+
+    def setSetting(self, id, value):
+        self._settings[id] = value
+
+    def getLocalizedString(self, id):
+        return str(id)
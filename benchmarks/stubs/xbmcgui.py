@@ -0,0 +1,62 @@
+"""Stub del modulo xbmcgui: finestre e dialoghi non mostrano nulla, i dialoghi di scelta restituiscono l'annullamento"""
+
+NOTIFICATION_INFO = 'info'
+NOTIFICATION_WARNING = 'warning'
+NOTIFICATION_ERROR = 'error'
+INPUT_ALPHANUM = 0
+INPUT_NUMERIC = 1
+
+
+class DialogProgressBG:
+    def create(self, heading, message=''):
+        self.finished = False
+
+    def update(self, percent=0, heading=None, message=None):
+        pass
+
+    def isFinished(self):
+        return getattr(self, 'finished', True)
+
+    def close(self):
+        self.finished = True
+
+
+class DialogProgress(DialogProgressBG):
+    def iscanceled(self):
+        return False
+
+
+class Dialog:
+    def notification(self, heading, message, icon='', time=5000, sound=True):
+        pass
+
+    def ok(self, heading, message):
+        return True
+
+    def yesno(self, heading, message, *args, **kwargs):
+        return False
+
+    def select(self, heading, list, *args, **kwargs):
+        return -1
+
+    def input(self, heading, defaultt='', type=INPUT_ALPHANUM, option=0, autoclose=0):
+        return ''
+
+
+class ListItem:
+    def __init__(self, label='', label2='', path='', offscreen=False):
+        self.label = label
+        self.path = path
+        self.properties = {}
+
+    def getLabel(self):
+        return self.label
+
+    def getPath(self):
+        return self.path
+
+    def getProperty(self, key):
+        return self.properties.get(key, '')
+
+    def setProperty(self, key, value):
+        self.properties[key] = value
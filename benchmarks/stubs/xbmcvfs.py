@@ -0,0 +1,149 @@
+"""
+Stub del modulo xbmcvfs: special:// viene risolto nella home Kodi del dataset, le condivisioni di rete
+(smb://, davs://, ...) nella cartella share del dataset. Gli url image:// sono sempre leggibili e vuoti,
+come una texture già in cache.
+"""
+import os
+import shutil
+
+from benchlib import workspace
+
+
+def translatePath(path):
+    return workspace.translate_special(path)
+
+
+def makeLegalFilename(filename):
+    return filename
+
+
+def validatePath(path):
+    return path
+
+
+def _local(path):
+    local_path = workspace.to_local_path(path)
+    if local_path is None:
+        raise OSError(f'percorso non gestito dallo stub: {path}')
+    return local_path
+
+
+def exists(path):
+    if path.startswith('image://'):
+        return True
+    local_path = workspace.to_local_path(path)
+    return bool(local_path) and os.path.exists(local_path)
+
+
+def mkdir(path):
+    return mkdirs(path)
+
+
+def mkdirs(path):
+    os.makedirs(_local(path), exist_ok=True)
+    return True
+
+
+def rmdir(path, force=False):
+    local_path = _local(path)
+    try:
+        if force:
+            shutil.rmtree(local_path)
+        else:
+            os.rmdir(local_path)
+    except OSError:
+        return False
+    return True
+
+
+def delete(file):
+    try:
+        os.remove(_local(file))
+    except OSError:
+        return False
+    return True
+
+
+def copy(strSource, strDestination):
+    try:
+        destination = _local(strDestination)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(_local(strSource), destination)
+    except OSError:
+        return False
+    return True
+
+
+def rename(file, newFile):
+    try:
+        os.replace(_local(file), _local(newFile))
+    except OSError:
+        return False
+    return True
+
+
+def listdir(path):
+    local_path = _local(path)
+    if not os.path.isdir(local_path):
+        return [], []
+    entries = sorted(os.scandir(local_path), key=lambda entry: entry.name)
+    return ([entry.name for entry in entries if entry.is_dir()],
+            [entry.name for entry in entries if not entry.is_dir()])
+
+
+class Stat:
+    def __init__(self, path):
+        self._stat = os.stat(_local(path))
+
+    def st_size(self):
+        return self._stat.st_size
+
+    def st_mtime(self):
+        return int(self._stat.st_mtime)
+
+
+class File:
+    def __init__(self, filepath, mode=None):
+        self._file = None
+        if filepath.startswith('image://'):
+            return
+        local_path = _local(filepath)
+        if mode == 'w':
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            self._file = open(local_path, 'w', encoding='utf-8')
+        else:
+            self._file = open(local_path, 'rb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, numBytes=-1):
+        if self._file is None:
+            return ''
+        return self._file.read(numBytes).decode('utf-8')
+
+    def readBytes(self, numBytes=-1):
+        if self._file is None:
+            return bytearray()
+        return bytearray(self._file.read(numBytes))
+
+    def write(self, buffer):
+        if self._file is None:
+            return False
+        if isinstance(buffer, (bytes, bytearray)):
+            buffer = buffer.decode('utf-8')
+        self._file.write(buffer)
+        return True
+
+    def size(self):
+        if self._file is None:
+            return 0
+        return os.fstat(self._file.fileno()).st_size
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
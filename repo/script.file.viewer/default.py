@@ -1,11 +1,11 @@
 import json
 import os
 import re
-import sqlite3
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import quote, unquote
 
+import db_bulk
 import db_scan
 import xbmc
 import xbmcaddon
@@ -16,10 +16,13 @@ audio_extensions = ['.mp3', '.wav', '.wma', '.aac', '.flac', '.ogg', '.m4a', '.a
                     '.au', '.mpc', '.tta', '.wv', '.opus']
 addon_name = xbmcaddon.Addon().getAddonInfo('name')
 addon_id = xbmcaddon.Addon().getAddonInfo('id')
+# limite fisso per le OR di LIKE di get_id_albums, che oltre crescono troppo in profondità
 sqlite_params_limit = 999
 # Semaforo per non sovraccaricare Kodi con troppe richieste simultanee
 _texture_semaphore = threading.Semaphore(4)
 confluence_skin_dir = 'skin.confluence'
+# cartelle inserite tra un aggiornamento e l'altro della progress bar
+view_records_per_progress_step = 200
 
 
 def log(msg):
@@ -47,8 +50,7 @@ def get_sources():
 
 def get_id_albums(paths):
     music_db_path = db_scan.get_music_db_path()
-    music_db = sqlite3.connect(music_db_path)
-    music_db.set_trace_callback(log)
+    music_db = db_scan.get_local_db(music_db_path)
     music_db_cursor = music_db.cursor()
     chunks = [paths[i:i + sqlite_params_limit] for i in range(0, len(paths), sqlite_params_limit)]
     results = []
@@ -61,7 +63,6 @@ def get_id_albums(paths):
                 ''' % placeholders
         results = music_db_cursor.execute(query, chunk).fetchall()
     music_db_cursor.close()
-    music_db.close()
     album_ids = [idAlbum for (idAlbum,) in results]
     return album_ids
 
@@ -70,16 +71,13 @@ def get_view_paths(paths):
     view_paths = set()
     query = "SELECT path FROM VIEW vista WHERE vista.path IN (%s)"
     view_mode_db_path = db_scan.get_view_modes_db_path()
-    view_mode_db = sqlite3.connect(view_mode_db_path)
-    view_mode_db.set_trace_callback(log)
+    view_mode_db = db_scan.get_local_db(view_mode_db_path)
     view_mode_db_cursor = view_mode_db.cursor()
-    chunks = [paths[i:i + sqlite_params_limit] for i in range(0, len(paths), sqlite_params_limit)]
     results = []
-    for chunk in chunks:
+    for chunk in db_bulk.chunk_rows(paths, 1, db_bulk.get_variable_limit(view_mode_db)):
         placeholders = ','.join(['?'] * len(chunk))
         results.extend(view_mode_db_cursor.execute(query % placeholders, chunk).fetchall())
     view_mode_db_cursor.close()
-    view_mode_db.close()
     for (path,) in results:
         view_paths.add(path)
     return view_paths
@@ -105,41 +103,47 @@ def get_scanned_albums_paths(id_albums, exec_mode):
                      JOIN path path ON song.idPath = path.idPath
             WHERE song.idAlbum IN (%s)'''
     music_db_path = db_scan.get_music_db_path()
-    music_db = sqlite3.connect(music_db_path)
-    music_db.set_trace_callback(log)
+    music_db = db_scan.get_local_db(music_db_path)
     music_db_cursor = music_db.cursor()
     if exec_mode == 'init':
         id_album_subquery = 'SELECT idAlbum FROM album'
         results.extend(music_db_cursor.execute(query % id_album_subquery).fetchall())
     elif id_albums:
-        chunks = [id_albums[i:i + sqlite_params_limit] for i in range(0, len(id_albums), sqlite_params_limit)]
-        for chunk in chunks:
+        for chunk in db_bulk.chunk_rows(id_albums, 1, db_bulk.get_variable_limit(music_db)):
             placeholders = ','.join(['?'] * len(chunk))
             results.extend(music_db_cursor.execute(query % placeholders, chunk).fetchall())
     music_db_cursor.close()
-    music_db.close()
     album_paths = [strPath for (strPath,) in results if strPath is not None]
     return album_paths
 
 
-def add_new_view_record(directory, view_mode, sort_method, exsisting_paths, skin_dir):
-    directory_to_add = directory not in exsisting_paths
-    if directory_to_add:
+def add_new_view_records(directories, view_mode, sort_method, exsisting_paths, skin_dir, progress=None):
+    """
+    Inserisce in un'unica transazione i record di vista per le cartelle che non ne hanno già uno.
+    Se viene passata una progress bar la aggiorna dopo ogni blocco inserito.
+    """
+    view_columns = ('window', 'path', 'viewMode', 'sortMethod', 'sortOrder', 'sortAttributes', 'skin')
+    view_records = [(10502, directory, view_mode, sort_method, 1, 0, skin_dir)
+                    for directory in dict.fromkeys(directories) if directory not in exsisting_paths]
+    if view_records:
         view_mode_db_path = db_scan.get_view_modes_db_path()
-        view_mode_db = sqlite3.connect(view_mode_db_path)
-        view_mode_db.set_trace_callback(log)
-        view_mode_db_cursor = view_mode_db.cursor()
-        # inserisco il record sul db delle view mode
-        insert_query = "INSERT INTO view (window, path, viewMode, sortMethod, sortOrder, sortAttributes, skin) VALUES (?,?,?,?,?,?,?)"
-        insert_values = (10502, directory, view_mode, sort_method, 1, 0, skin_dir,)
-        view_mode_db_cursor.execute(insert_query, insert_values)
-        view_mode_db.commit()
-        view_mode_db_cursor.close()
-        view_mode_db.close()
+        view_mode_db = db_scan.get_local_db(view_mode_db_path)
+        # inserisco i record sul db delle view mode un blocco alla volta per poter aggiornare la progress bar
+        try:
+            written = 0
+            for chunk in db_bulk.chunk_rows(view_records, 1, view_records_per_progress_step):
+                written += db_bulk.bulk_insert(view_mode_db, 'view', view_columns, chunk)
+                if progress:
+                    progress.update(message=chunk[-1][1], percent=int(written / len(view_records) * 100))
+            view_mode_db.commit()
+        except Exception:
+            view_mode_db.rollback()
+            raise
+    return len(view_records)
 
 
-def force_confluence_wall_view_for_files(directory, exsisting_paths):
-    add_new_view_record(directory, 66036, 1, exsisting_paths, confluence_skin_dir)
+def force_confluence_wall_view_for_files(directories, exsisting_paths, progress=None):
+    return add_new_view_records(directories, 66036, 1, exsisting_paths, confluence_skin_dir, progress)
 
 
 def get_paths_to_convert(albums_by_source):
@@ -167,8 +171,7 @@ def get_paths_to_convert(albums_by_source):
 
 def update_texture_path(dir_path, img_vfs_url):
     texture_db_path = db_scan.get_textures_db_path()
-    texture_db = sqlite3.connect(texture_db_path)
-    texture_db.set_trace_callback(log)
+    texture_db = db_scan.get_local_db(texture_db_path)
     texture_db_cursor = texture_db.cursor()
     find_id_query = "select id from path where url = ? and type = 'thumb'"
     update_query = "update path set texture= ? where id = ?"
@@ -182,22 +185,18 @@ def update_texture_path(dir_path, img_vfs_url):
         texture_db_cursor.execute(update_query, (img_vfs_url, id_texture_path,))
         texture_db.commit()
     texture_db_cursor.close()
-    texture_db.close()
 
 
 def clean_texture_path():
     music_db_path = db_scan.get_music_db_path()
-    music_db = sqlite3.connect(music_db_path)
-    music_db.set_trace_callback(log)
+    music_db = db_scan.get_local_db(music_db_path)
     music_db_cursor = music_db.cursor()
     query = "SELECT strPath FROM path"
     results = music_db_cursor.execute(query).fetchall()
     music_db_cursor.close()
-    music_db.close()
     valid_paths = set([strPath for (strPath,) in results if strPath is not None])
     texture_db_path = db_scan.get_textures_db_path()
-    texture_db = sqlite3.connect(texture_db_path)
-    texture_db.set_trace_callback(log)
+    texture_db = db_scan.get_local_db(texture_db_path)
     texture_db_cursor = texture_db.cursor()
     textures_paths_query = "SELECT url FROM path"
     textures_results = texture_db_cursor.execute(textures_paths_query).fetchall()
@@ -208,7 +207,6 @@ def clean_texture_path():
         texture_db_cursor.executemany(delete_query, paths_to_remove)
         texture_db.commit()
     texture_db_cursor.close()
-    texture_db.close()
 
 
 def convert_to_thumb_view(paths_to_convert, use_webdav, id_albums, exec_mode):
@@ -219,10 +217,8 @@ def convert_to_thumb_view(paths_to_convert, use_webdav, id_albums, exec_mode):
         progress.create(addon_name, message='Imposto la vista di default per i file')
         try:
             exsisting_paths = get_view_paths(paths_to_convert)
-            for (step, directory) in enumerate(paths_to_convert, 1):
-                force_confluence_wall_view_for_files(directory, exsisting_paths)
-                percentuale = (step / total_dirs_to_process) * 100
-                progress.update(message=directory, percent=int(percentuale))
+            added_views = force_confluence_wall_view_for_files(paths_to_convert, exsisting_paths, progress)
+            log(f'Viste impostate: {added_views} nuove su {total_dirs_to_process} cartelle')
         finally:
             progress.close()
         progress.create(addon_name, message='Precarico le miniature sui file')
@@ -252,9 +248,8 @@ def get_kodi_image_path(file_path):
 def get_thumbs_to_cache(id_albums, textures, use_webdav, exec_mode):
     thumbs_to_cache = {}
     translated_path = db_scan.get_music_db_path()
-    music_db = sqlite3.connect(translated_path)
+    music_db = db_scan.get_local_db(translated_path)
     music_db.create_function('decode', 1, decode_url, deterministic=True)
-    music_db.set_trace_callback(log)
     music_db_cursor = music_db.cursor()
     query = '''
             WITH decoded AS
@@ -283,7 +278,6 @@ def get_thumbs_to_cache(id_albums, textures, use_webdav, exec_mode):
             placeholders = ','.join(['?'] * len(chunk))
             results.extend(music_db_cursor.execute(query % placeholders, chunk).fetchall())
     music_db_cursor.close()
-    music_db.close()
     if results:
         for (full_path,) in results:
             encoded_image = get_kodi_image_path(full_path)
@@ -372,11 +366,7 @@ def convert_playlists_to_info_media_view():
     exsisting_playlists = get_view_paths(playlists_paths)
     progress.create(addon_name, message='Imposto la vista di default per le playlist')
     try:
-        for (step, playlist) in enumerate(playlists, 1):
-            playlist_path = f'special://profile/playlists/music/{playlist}/'
-            add_new_view_record(playlist_path, 66042, 22, exsisting_playlists, confluence_skin_dir)
-            percentuale = (step / len(playlists)) * 100
-            progress.update(message=playlist, percent=int(percentuale))
+        add_new_view_records(playlists_paths, 66042, 22, exsisting_playlists, confluence_skin_dir, progress)
     finally:
         progress.close()
 
@@ -286,38 +286,13 @@ def get_label_name(file_path):
     return file_name
 
 
-def get_id_albums_from_paths(id_albums, scanned_path):
-    get_directory_payload = {
-        "jsonrpc": "2.0",
-        "method": "Files.GetDirectory",
-        "id": "1",
-        "params": {
-            "directory": scanned_path,
-            "media": "music",
-            "properties": [
-                "albumid"
-            ]
-        }
-    }
-    json_result = json.loads(xbmc.executeJSONRPC(json.dumps(get_directory_payload, ensure_ascii=False))).get('result')
-    if json_result:
-        for file in json_result.get('files'):
-            if file.get('albumid') and file.get('albumid') not in id_albums:
-                id_albums.append(file.get('albumid'))
-            elif file.get('type') == 'unknown' and file.get('filetype') == 'directory':
-                get_id_albums_from_paths(id_albums, file.get('file'))
-
-
 def get_ids_to_refresh(paths, use_webdav):
     scanned_paths = []
-    id_albums = []
     for path in paths:
         path = db_scan.convert_from_smb_to_davs(path) if use_webdav else path
         if path not in scanned_paths:
             scanned_paths.append(path)
-    for scanned_path in scanned_paths:
-        get_id_albums_from_paths(id_albums, scanned_path)
-    return id_albums
+    return db_scan.get_id_albums_by_paths(scanned_paths)
 
 
 def get_labels():
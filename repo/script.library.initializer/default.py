@@ -1,7 +1,6 @@
 import sqlite3
 
 import db_scan
-import pymysql
 import xbmc
 import xbmcaddon
 
@@ -65,13 +64,8 @@ def get_paths_for_init(db_params):
             FROM ranked
             ORDER BY priority, strPath'''
     music_db_name = db_scan.get_latest_kodi_dbs().get('MyMusic')
-    host = db_params.get('host')
-    username = db_params.get('user')
-    password = db_params.get('pass')
     use_webdav = db_params.get('sourcetype') == 'webdav'
-    central_db = pymysql.connect(host=host, user=username, password=password, database=music_db_name, port=3306,
-                                 cursorclass=pymysql.cursors.DictCursor, connect_timeout=18000)
-    with central_db:
+    with db_scan.central_db_connection(db_params, music_db_name) as central_db:
         with central_db.cursor() as central_cursor:
             central_cursor.execute(query)
             log(central_cursor.mogrify(query))
@@ -0,0 +1,111 @@
+import sqlite3
+
+import xbmc
+
+# limite storico di SQLite, usato quando la versione di Python non permette di leggere quello reale
+default_variable_limit = 999
+
+
+def log(msg):
+    xbmc.log(str(msg), xbmc.LOGDEBUG)
+
+
+def get_variable_limit(db):
+    """Numero massimo di parametri per statement della connessione (getlimit è disponibile da Python 3.11)"""
+    try:
+        return db.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+    except AttributeError:
+        return default_variable_limit
+
+
+def chunk_rows(rows, values_per_row, variable_limit):
+    """Raggruppa le righe in blocchi che stanno in un solo statement senza superare il limite di parametri"""
+    rows_per_chunk = max(1, variable_limit // max(1, values_per_row))
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == rows_per_chunk:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _values_clause(rows_count, values_per_row):
+    row_placeholders = f"({','.join(['?'] * values_per_row)})"
+    return ','.join([row_placeholders] * rows_count)
+
+
+def _flatten(chunk):
+    return [value for row in chunk for value in row]
+
+
+def bulk_insert(db, table, columns, rows, or_replace=False):
+    """
+    Inserisce le righe con statement INSERT ... VALUES (...),(...) multi-riga.
+    Non fa commit: le scritture restano nella transazione del chiamante. Restituisce il numero di righe scritte.
+    """
+    verb = 'INSERT OR REPLACE' if or_replace else 'INSERT'
+    column_list = ', '.join(columns)
+    written = 0
+    cursor = db.cursor()
+    try:
+        for chunk in chunk_rows(rows, len(columns), get_variable_limit(db)):
+            query = f'{verb} INTO {table} ({column_list}) VALUES {_values_clause(len(chunk), len(columns))}'
+            cursor.execute(query, _flatten(chunk))
+            written += len(chunk)
+    finally:
+        cursor.close()
+    return written
+
+
+def bulk_update(db, table, key_column, columns, rows, extra_assignments=()):
+    """
+    Aggiorna le righe di table identificate da key_column con una CTE di VALUES in join sulla tabella.
+    Ogni riga è (chiave, *valori) nell'ordine di columns; extra_assignments sono assegnazioni SQL fisse
+    (ad esempio 'lastScraped=CURRENT_TIMESTAMP') applicate a tutte le righe aggiornate.
+    Non fa commit. Restituisce il numero di righe passate.
+    """
+    cte_columns = ', '.join([f'v_{column}' for column in (key_column, *columns)])
+    values_per_row = len(columns) + 1
+    written = 0
+    cursor = db.cursor()
+    try:
+        for chunk in chunk_rows(rows, values_per_row, get_variable_limit(db)):
+            cte = f'WITH v ({cte_columns}) AS (VALUES {_values_clause(len(chunk), values_per_row)})'
+            if columns and sqlite3.sqlite_version_info >= (3, 33, 0):
+                assignments = [f'{column} = v.v_{column}' for column in columns] + list(extra_assignments)
+                query = f'''
+                        {cte}
+                        UPDATE {table}
+                        SET {', '.join(assignments)}
+                        FROM v
+                        WHERE v.v_{key_column} = {table}.{key_column}'''
+            else:
+                # UPDATE ... FROM non disponibile sulle versioni più vecchie di SQLite
+                assignments = [f'{column} = (SELECT v.v_{column} FROM v WHERE v.v_{key_column} = {table}.{key_column})'
+                               for column in columns] + list(extra_assignments)
+                query = f'''
+                        {cte}
+                        UPDATE {table}
+                        SET {', '.join(assignments)}
+                        WHERE {key_column} IN (SELECT v_{key_column} FROM v)'''
+            cursor.execute(query, _flatten(chunk))
+            written += len(chunk)
+    finally:
+        cursor.close()
+    return written
+
+
+def bulk_delete(db, table, key_column, keys):
+    """Cancella le righe di table con key_column tra le chiavi indicate, a blocchi di IN (...). Non fa commit."""
+    written = 0
+    cursor = db.cursor()
+    try:
+        for chunk in chunk_rows(keys, 1, get_variable_limit(db)):
+            placeholders = ','.join(['?'] * len(chunk))
+            cursor.execute(f'DELETE FROM {table} WHERE {key_column} IN ({placeholders})', chunk)
+            written += len(chunk)
+    finally:
+        cursor.close()
+    return written
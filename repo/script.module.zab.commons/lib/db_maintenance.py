@@ -0,0 +1,153 @@
+import json
+import os
+import time
+from datetime import datetime
+
+import db_scan
+import xbmc
+import xbmcaddon
+import xbmcvfs
+
+# sotto questa soglia di pagine libere non conviene toccare il db
+min_freelist_pages = 2048
+# quota di pagine libere sul totale oltre la quale conviene riscrivere tutto il file con un VACUUM:
+# senza auto_vacuum incrementale decide insieme a min_freelist_pages, con 0 conta solo la soglia
+full_vacuum_freelist_ratio = 0.25
+# pagine restituite al massimo da un singolo incremental_vacuum
+incremental_vacuum_max_pages = 4096
+# ultimi report di manutenzione per ogni db, salvati nella cartella dati dell'add-on che la esegue
+maintenance_report_file_name = 'maintenance.json'
+maintenance_reports_kept = 10
+# valori di PRAGMA auto_vacuum
+_auto_vacuum_incremental = 2
+
+
+def log(msg):
+    xbmc.log(str(msg), xbmc.LOGDEBUG)
+
+
+def get_db_stats(db):
+    stats = {}
+    for pragma in ('page_count', 'freelist_count', 'page_size', 'auto_vacuum'):
+        (stats[pragma],) = db.execute(f'PRAGMA {pragma}').fetchone()
+    return stats
+
+
+def _get_number_option(db_params, key, default, cast):
+    value = db_params.get(key)
+    if value is None or value == '':
+        return default
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        log(f'{key} non valido: {value}')
+        return default
+
+
+def get_maintenance_options(db_params):
+    """
+    Opzioni della manutenzione da centralsettings.json: vacuumfreelistpages e vacuumfullratio sovrascrivono
+    min_freelist_pages e full_vacuum_freelist_ratio, vacuumincremental attiva l'auto_vacuum incrementale
+    """
+    return {'freelist_threshold': _get_number_option(db_params, 'vacuumfreelistpages', min_freelist_pages, int),
+            'full_vacuum_ratio': _get_number_option(db_params, 'vacuumfullratio', full_vacuum_freelist_ratio, float),
+            'enable_incremental': bool(db_params.get('vacuumincremental'))}
+
+
+def choose_vacuum_action(stats, freelist_threshold=min_freelist_pages, full_vacuum_ratio=full_vacuum_freelist_ratio,
+                         incremental_max_pages=incremental_vacuum_max_pages):
+    """Restituisce l'azione da fare ('none', 'incremental' o 'full') e le pagine da liberare con l'incrementale"""
+    freelist_count = stats.get('freelist_count')
+    if freelist_count <= freelist_threshold:
+        return 'none', 0
+    if stats.get('auto_vacuum') == _auto_vacuum_incremental:
+        return 'incremental', min(freelist_count, incremental_max_pages)
+    # senza auto_vacuum incrementale resta solo la riscrittura completa, la faccio solo se lo spreco è consistente
+    if freelist_count >= stats.get('page_count') * full_vacuum_ratio:
+        return 'full', 0
+    return 'none', 0
+
+
+def get_report_file_path():
+    profile_path = xbmcvfs.translatePath(xbmcaddon.Addon().getAddonInfo('profile'))
+    if not xbmcvfs.exists(profile_path):
+        xbmcvfs.mkdirs(profile_path)
+    return os.path.join(profile_path, maintenance_report_file_name)
+
+
+def load_reports():
+    """Report salvati da save_report, per percorso del db"""
+    file_path = get_report_file_path()
+    if not xbmcvfs.exists(file_path):
+        return {}
+    try:
+        with xbmcvfs.File(file_path) as f:
+            return json.load(f)
+    except ValueError as e:
+        log(f'{maintenance_report_file_name} illeggibile: {e}')
+        return {}
+
+
+def save_report(report):
+    reports = load_reports()
+    db_reports = reports.get(report.get('db')) or []
+    db_reports.append(report)
+    reports[report.get('db')] = db_reports[-maintenance_reports_kept:]
+    with xbmcvfs.File(get_report_file_path(), 'w') as f:
+        f.write(json.dumps(reports, indent=2))
+
+
+def maintain_db(db_path, freelist_threshold=min_freelist_pages, full_vacuum_ratio=full_vacuum_freelist_ratio,
+                incremental_max_pages=incremental_vacuum_max_pages, optimize=True, analyze=False,
+                enable_incremental=False):
+    """
+    Manutenzione di un db locale di Kodi: in base a freelist_count e page_count sceglie tra nessuna azione,
+    incremental_vacuum e VACUUM completo, poi eventualmente aggiorna le statistiche del planner.
+    Con enable_incremental (disattivato di default, cambia il formato su disco dei db di Kodi) il primo VACUUM
+    completo passa il db ad auto_vacuum incrementale, così le manutenzioni successive non riscrivono l'intero file.
+    Restituisce un report con quanto fatto e i tempi, salvato anche in maintenance.json con save_report.
+    """
+    start = time.perf_counter()
+    db = db_scan.get_local_db(db_path)
+    # VACUUM e incremental_vacuum non si possono eseguire dentro una transazione aperta
+    if db.in_transaction:
+        db.commit()
+    stats_before = get_db_stats(db)
+    action, pages = choose_vacuum_action(stats_before, freelist_threshold, full_vacuum_ratio, incremental_max_pages)
+    vacuum_start = time.perf_counter()
+    if action == 'incremental':
+        # incremental_vacuum restituisce una riga per pagina liberata, vanno consumate tutte
+        db.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+    elif action == 'full':
+        if enable_incremental and stats_before.get('auto_vacuum') != _auto_vacuum_incremental:
+            db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        db.execute('VACUUM')
+    vacuum_seconds = time.perf_counter() - vacuum_start
+    optimize_start = time.perf_counter()
+    if analyze:
+        db.execute('ANALYZE')
+    elif optimize:
+        db.execute('PRAGMA optimize')
+    optimize_seconds = time.perf_counter() - optimize_start
+    stats_after = get_db_stats(db)
+    report = {
+        'db': db_path,
+        'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'action': action,
+        'analyze': 'analyze' if analyze else 'optimize' if optimize else 'none',
+        'page_count_before': stats_before.get('page_count'),
+        'freelist_before': stats_before.get('freelist_count'),
+        'page_count_after': stats_after.get('page_count'),
+        'freelist_after': stats_after.get('freelist_count'),
+        'freed_bytes': (stats_before.get('page_count') - stats_after.get('page_count')) * stats_after.get('page_size'),
+        'vacuum_seconds': round(vacuum_seconds, 3),
+        'optimize_seconds': round(optimize_seconds, 3),
+        'total_seconds': round(time.perf_counter() - start, 3)
+    }
+    xbmc.log(f'Manutenzione db {db_path}: {report}', xbmc.LOGINFO)
+    try:
+        save_report(report)
+    except Exception as e:
+        # il report è solo informativo, la manutenzione è comunque riuscita
+        log(f'Impossibile salvare il report di manutenzione: {e}')
+    return report
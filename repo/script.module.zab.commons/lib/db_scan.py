@@ -1,15 +1,63 @@
+import atexit
+import functools
 import json
 import os
 import re
+import sqlite3
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from urllib.parse import unquote, quote, parse_qs
 
+import pymysql
 import requests
 import xbmc
 import xbmcvfs
+from pymysql.constants import CLIENT
 from requests import auth
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 kodi_local_db_path = xbmcvfs.translatePath('special://userdata/Database/')
+central_db_pool_size = 4
+# secondi di attesa massima per una connessione libera: oltre, meglio fallire che bloccare Kodi per sempre
+central_db_acquire_timeout = 60
+# secondi dopo i quali una connessione inutilizzata viene chiusa
+central_db_idle_timeout = 300
+_central_db_pools = {}
+_central_db_pools_lock = threading.Lock()
+# righe lette per volta dai cursori lato server
+central_stream_batch_size = 2000
+# secondi entro i quali impostazioni e versioni dei db in cache non vengono ricontrollate su disco
+cache_revalidate_interval = 5
+_settings_cache = {}
+_db_versions_cache = {}
+_cache_lock = threading.Lock()
+_db_version_pattern = re.compile(r"(\d+)\.db$")
+_percent_escape_pattern = re.compile(r'%[0-9A-F]{2}')
+path_translator_memo_size = 65536
+json_rpc_batch_max_size = 40960
+# timeout di connessione e di lettura verso il webserver del Kodi centrale
+central_rpc_timeout = (10, 600)
+central_rpc_retries = 3
+central_rpc_backoff_factor = 0.5
+central_rpc_pool_size = 8
+central_rpc_max_parallel = 4
+# cartelle richieste al massimo in un singolo batch di Files.GetDirectory
+directory_batch_max_items = 50
+_central_rpc_sessions = {}
+_central_rpc_sessions_lock = threading.Lock()
+_path_translator = None
+# cache delle pagine in KiB (valore negativo per SQLite) e dimensione della mappatura in memoria dei db locali
+local_db_cache_size = -65536
+local_db_mmap_size = 268435456
+# connessioni ai db locali, una per thread e per file, tutte tracciate per chiuderle a fine esecuzione
+_local_dbs = threading.local()
+_local_db_connections = []
+_local_db_connections_lock = threading.Lock()
 
 
 def log(msg):
@@ -17,53 +65,125 @@ def log(msg):
 
 
 def convert_from_davs_to_smb(davs_path):
-    db_params = get_db_params()
-    smb_source_base = db_params.get('sambasource')
-    webdav_source_base = db_params.get('webdavsource')
-    unquoted_davs = unquote(davs_path)
-    smb_path = unquoted_davs.replace(webdav_source_base, smb_source_base)
-    return smb_path
+    return get_path_translator().to_smb(davs_path)
 
 
-# Funzione per dividere in chunk
-def split_json(data, max_size=40960):
-    chunks = []
-    current_chunk = []
-    current_size = 0
-
-    for item in data:
-        item_size = len(json.dumps(item).encode('utf-8'))
-        if current_size + item_size >= max_size:
-            chunks.append(current_chunk)
-            current_chunk = []
-            current_size = 0
-        current_chunk.append(item)
-        current_size += item_size
-
-    if current_chunk:
-        chunks.append(current_chunk)
+class JsonRpcBatchBuilder:
+    """
+    Accumula richieste JSON-RPC serializzandole una volta sola e restituisce payload batch
+    già pronti da inviare, entro un budget in byte e un numero massimo di richieste.
+    """
 
-    return chunks
+    def __init__(self, max_size=json_rpc_batch_max_size, max_items=None):
+        self.max_size = max_size
+        self.max_items = max_items
+        self._parts = []
+        # le parentesi quadre dell'array
+        self._size = 2
+
+    def add(self, request):
+        """Aggiunge una richiesta, restituisce il batch precedente se questa non ci stava più"""
+        # con ensure_ascii attivo la lunghezza della stringa coincide con quella in byte
+        encoded_request = json.dumps(request, separators=(',', ':'))
+        payload = None
+        if self._parts:
+            is_full = self.max_items and len(self._parts) >= self.max_items
+            if is_full or self._size + 1 + len(encoded_request) > self.max_size:
+                payload = self.flush()
+        # il separatore serve solo dal secondo elemento in poi
+        self._size += len(encoded_request) + (1 if self._parts else 0)
+        self._parts.append(encoded_request)
+        return payload
+
+    def flush(self):
+        """Restituisce il batch in corso, None se vuoto"""
+        if not self._parts:
+            return None
+        payload = f'[{",".join(self._parts)}]'
+        self._parts = []
+        self._size = 2
+        return payload
+
+
+def build_json_rpc_batches(rpc_requests, max_size=json_rpc_batch_max_size, max_items=None):
+    """Generatore di payload batch serializzati, una richiesta più grande del budget viaggia da sola"""
+    builder = JsonRpcBatchBuilder(max_size, max_items)
+    for rpc_request in rpc_requests:
+        payload = builder.add(rpc_request)
+        if payload:
+            yield payload
+    payload = builder.flush()
+    if payload:
+        yield payload
 
 
 # fa l'encoding di una stringa nel modo che piace a Kodi
 # considerando lo slash come carattere da codificare a differenza di () e !
 # inoltre i parametri di codifica degli uri devono essere in minuscolo
 def encode_string(string_to_encode, safe_chars='()=!$,*+:@/&\''):
-    encoded_string = re.sub(r'%[0-9A-F]{2}', lambda mo: mo.group().lower(), quote(string_to_encode, safe_chars))
+    encoded_string = _lower_percent_escapes(quote(string_to_encode, safe_chars))
     # Sostituisci manualmente il carattere `~` con la sua codifica
     # encoded_string = encoded_string.replace('~', '%7e')
     return encoded_string
 
 
+def _lower_percent_escapes(encoded_string):
+    if '%' not in encoded_string:
+        return encoded_string
+    return _percent_escape_pattern.sub(_lower_match, encoded_string)
+
+
+def _lower_match(match):
+    return match.group().lower()
+
+
 def convert_from_smb_to_davs(smb_path):
-    db_params = get_db_params()
-    smb_source_base = db_params.get('sambasource')
-    webdav_source_base = db_params.get('webdavsource')
-    path_without_prefix = smb_path.replace(smb_source_base, '')
-    dav_path = encode_string(path_without_prefix)
-    dav_path = f'{webdav_source_base}{dav_path}'
-    return dav_path
+    return get_path_translator().to_davs(smb_path)
+
+
+class PathTranslator:
+    """
+    Converte i path tra la sorgente samba e quella webdav del server centrale.
+    I prefissi vengono fissati alla creazione e ogni conversione già fatta viene ricordata
+    in una memo LRU per direzione, dato che le stesse cartelle vengono convertite di continuo.
+    """
+
+    def __init__(self, smb_source_base, webdav_source_base, memo_size=path_translator_memo_size):
+        self.smb_source_base = smb_source_base or ''
+        self.webdav_source_base = webdav_source_base or ''
+        self._smb_prefix_length = len(self.smb_source_base)
+        self._webdav_prefix_length = len(self.webdav_source_base)
+        self.to_davs = functools.lru_cache(maxsize=memo_size)(self._to_davs)
+        self.to_smb = functools.lru_cache(maxsize=memo_size)(self._to_smb)
+
+    def _to_davs(self, smb_path):
+        path_without_prefix = smb_path
+        if smb_path.startswith(self.smb_source_base):
+            path_without_prefix = smb_path[self._smb_prefix_length:]
+        dav_path = encode_string(path_without_prefix)
+        return f'{self.webdav_source_base}{dav_path}'
+
+    def _to_smb(self, davs_path):
+        unquoted_davs = unquote(davs_path)
+        if unquoted_davs.startswith(self.webdav_source_base):
+            return f'{self.smb_source_base}{unquoted_davs[self._webdav_prefix_length:]}'
+        return unquoted_davs
+
+    def translate_many(self, paths, to_davs=True):
+        translate = self.to_davs if to_davs else self.to_smb
+        return [translate(path) for path in paths]
+
+
+def get_path_translator(db_params=None):
+    global _path_translator
+    if db_params is None:
+        db_params = get_db_params()
+    sources = (db_params.get('sambasource'), db_params.get('webdavsource'))
+    path_translator = _path_translator
+    if path_translator is None or (path_translator.smb_source_base, path_translator.webdav_source_base) != sources:
+        path_translator = PathTranslator(*sources)
+        _path_translator = path_translator
+    return path_translator
 
 
 def read_params():
@@ -96,53 +216,195 @@ def get_paths_from_params():
     return paths_from_params
 
 
+def _create_central_rpc_session(db_params):
+    session = requests.Session()
+    session.headers.update({'content-type': 'application/json;'})
+    session.auth = auth.HTTPBasicAuth(db_params.get('rpcserveruser'), db_params.get('rpcserverpass'))
+    # le chiamate JSON-RPC fatte al Kodi centrale sono tutte letture, si possono ripetere anche in POST
+    retries = Retry(total=central_rpc_retries, backoff_factor=central_rpc_backoff_factor,
+                    status_forcelist=(502, 503, 504), allowed_methods=None)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=central_rpc_pool_size, max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_central_rpc_session(db_params):
+    """Sessione HTTP keep-alive verso il Kodi centrale, condivisa da tutto il processo"""
+    session_key = (db_params.get('serverhost'), db_params.get('rpcserverport'), db_params.get('rpcserveruser'),
+                   db_params.get('rpcserverpass'))
+    with _central_rpc_sessions_lock:
+        session = _central_rpc_sessions.get(session_key)
+        if not session:
+            session = _create_central_rpc_session(db_params)
+            _central_rpc_sessions[session_key] = session
+    return session
+
+
+def close_central_rpc_sessions():
+    with _central_rpc_sessions_lock:
+        sessions = list(_central_rpc_sessions.values())
+        _central_rpc_sessions.clear()
+    for session in sessions:
+        session.close()
+
+
 def execute_from_central_kodi_webserver(db_params, payload):
-    headers = {
-        'content-type': 'application/json;',
-    }
     central_kodi_host = db_params.get('serverhost')
     central_kodi_server_port = db_params.get('rpcserverport')
-    central_kodi_server_user = db_params.get('rpcserveruser')
-    central_kodi_server_password = db_params.get('rpcserverpass')
-    basic_auth = auth.HTTPBasicAuth(central_kodi_server_user, central_kodi_server_password)
     kodi_instance = f'http://{central_kodi_host}:{central_kodi_server_port}/jsonrpc'
-    response = requests.post(kodi_instance, headers=headers, json=payload, auth=basic_auth)
+    session = get_central_rpc_session(db_params)
+    if isinstance(payload, str):
+        # payload già serializzato, ad esempio da build_json_rpc_batches
+        response = session.post(kodi_instance, data=payload.encode('utf-8'), timeout=central_rpc_timeout)
+    else:
+        response = session.post(kodi_instance, json=payload, timeout=central_rpc_timeout)
     response.raise_for_status()
     return response.json()
 
 
-def get_db_params():
+def execute_many_from_central_kodi_webserver(db_params, payloads, max_workers=central_rpc_max_parallel):
+    """
+    Invia al Kodi centrale richieste indipendenti tra loro (tipicamente batch) in parallelo
+    su un pool di al massimo max_workers thread, le risposte tornano nell'ordine dei payload
+    """
+    payloads = list(payloads)
+    if max_workers <= 1 or len(payloads) <= 1:
+        return [execute_from_central_kodi_webserver(db_params, payload) for payload in payloads]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(payloads))) as executor:
+        return list(executor.map(lambda payload: execute_from_central_kodi_webserver(db_params, payload), payloads))
+
+
+def execute_json_rpc_batches(batch_payloads, call_central=False, db_params=None, max_parallel_batches=1):
+    """Esegue payload batch già serializzati sul Kodi centrale o locale, le risposte tornano in ordine"""
+    if call_central:
+        return execute_many_from_central_kodi_webserver(db_params, batch_payloads, max_parallel_batches)
+    batch_payloads = list(batch_payloads)
+    if max_parallel_batches <= 1 or len(batch_payloads) <= 1:
+        return [json.loads(xbmc.executeJSONRPC(batch_payload)) for batch_payload in batch_payloads]
+    with ThreadPoolExecutor(max_workers=min(max_parallel_batches, len(batch_payloads))) as executor:
+        return [json.loads(response) for response in executor.map(xbmc.executeJSONRPC, batch_payloads)]
+
+
+def is_directory_to_walk(directory_entry):
+    # le cartelle che Kodi non riconosce come album o artisti vanno esplorate
+    return directory_entry.get('filetype') == 'directory' and directory_entry.get('type') == 'unknown'
+
+
+def walk_music_directories(paths, properties, call_central=False, db_params=None, sort_method=None,
+                           max_parallel_batches=1, should_descend=is_directory_to_walk,
+                           batch_max_items=directory_batch_max_items):
+    """
+    Visita in ampiezza le cartelle musicali con Files.GetDirectory: le cartelle di ogni livello
+    vengono richieste con un unico batch JSON-RPC (spezzato oltre batch_max_items cartelle)
+    invece che con una chiamata per cartella.
+
+    :return: lista delle voci restituite da tutte le cartelle visitate
+    """
+    directory_entries = []
+    frontier = list(dict.fromkeys(path for path in paths if path))
+    visited = set(frontier)
+    while frontier:
+        params = {"media": "music", "properties": properties}
+        if sort_method:
+            params["sort"] = {"method": sort_method}
+        rpc_requests = ({"jsonrpc": "2.0", "method": "Files.GetDirectory", "id": id_rpc,
+                         "params": dict(params, directory=directory)}
+                        for (id_rpc, directory) in enumerate(frontier, 1))
+        batch_payloads = build_json_rpc_batches(rpc_requests, max_items=batch_max_items)
+        responses = execute_json_rpc_batches(batch_payloads, call_central, db_params, max_parallel_batches)
+        next_frontier = []
+        for response in responses:
+            # in caso di errore Kodi risponde con un oggetto singolo invece che con un array
+            rpc_responses = response if isinstance(response, list) else [response]
+            for rpc_response in rpc_responses:
+                result = rpc_response.get('result')
+                if not result or not result.get('files'):
+                    continue
+                for directory_entry in result.get('files'):
+                    directory_entries.append(directory_entry)
+                    directory = directory_entry.get('file')
+                    if should_descend(directory_entry) and directory not in visited:
+                        visited.add(directory)
+                        next_frontier.append(directory)
+        frontier = next_frontier
+    return directory_entries
+
+
+def get_id_albums_by_paths(paths):
+    """Id degli album trovati visitando le cartelle indicate, senza duplicati e nell'ordine in cui compaiono"""
+    id_albums = {}
+    for directory_entry in walk_music_directories(paths, ["albumid"]):
+        if directory_entry.get('albumid'):
+            id_albums[directory_entry.get('albumid')] = None
+    return list(id_albums)
+
+
+def _get_validated_cache(cache, path, loader):
+    """
+    Restituisce il valore in cache finché il mtime di path non cambia.
+    Il mtime viene ricontrollato al massimo ogni cache_revalidate_interval secondi,
+    così le chiamate ravvicinate non toccano il filesystem.
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        if cache and now - cache['checked_at'] < cache_revalidate_interval:
+            return cache['value']
+    mtime = os.stat(path).st_mtime_ns
+    with _cache_lock:
+        if cache and cache['mtime'] == mtime:
+            cache['checked_at'] = now
+            return cache['value']
+    value = loader()
+    with _cache_lock:
+        cache.update(mtime=mtime, checked_at=now, value=value)
+    return value
+
+
+def _load_db_params():
     central_settings_path = xbmcvfs.translatePath('special://userdata/centralsettings.json')
     with xbmcvfs.File(central_settings_path) as f:
         central_settings = json.load(f)
     return central_settings
 
 
-def get_latest_kodi_dbs():
-    """
-    Restituisce i database più aggiornati di Kodi presenti nella cartella Database.
+def get_db_params():
+    # il dict restituito è condiviso da tutto il processo: va solo letto
+    central_settings_path = xbmcvfs.translatePath('special://userdata/centralsettings.json')
+    return _get_validated_cache(_settings_cache, central_settings_path, _load_db_params)
 
-    :return: dict con {Db: Nome db aggiornato}
-    """
+
+def _load_latest_kodi_dbs():
     # prefissi noti dei database Kodi
     prefixes = ["Addons", "Epg", "MyMusic", "MyVideos", "Textures", "TV", "ViewModes"]
     results = {}
+    db_files = [f for f in os.listdir(kodi_local_db_path) if f.endswith(".db")]
 
     for prefix in prefixes:
-        db_files = [f for f in os.listdir(kodi_local_db_path) if f.startswith(prefix) and f.endswith(".db")]
-        if not db_files:
+        prefix_db_files = [f for f in db_files if f.startswith(prefix)]
+        if not prefix_db_files:
             continue
 
         # estrai numero finale e ordina
-        db_files.sort(
-            key=lambda x: int(re.search(r"(\d+)\.db$", x).group(1)),
+        prefix_db_files.sort(
+            key=lambda x: int(_db_version_pattern.search(x).group(1)),
             reverse=True
         )
-        results[prefix] = db_files[0].replace(".db", "")
+        results[prefix] = prefix_db_files[0].replace(".db", "")
 
     return results
 
 
+def get_latest_kodi_dbs():
+    """
+    Restituisce i database più aggiornati di Kodi presenti nella cartella Database.
+    Il risultato resta in cache finché non cambia il mtime della cartella.
+
+    :return: dict con {Db: Nome db aggiornato}
+    """
+    return dict(_get_validated_cache(_db_versions_cache, kodi_local_db_path, _load_latest_kodi_dbs))
+
+
 def get_db_path(db_name):
     db_versions = get_latest_kodi_dbs()
     db_name = db_versions.get(db_name)
@@ -160,3 +422,224 @@ def get_textures_db_path():
 
 def get_view_modes_db_path():
     return get_db_path('ViewModes')
+
+
+def is_debug_logging_enabled():
+    return xbmc.getCondVisibility('System.GetBool(debug.showloginfo)')
+
+
+def is_local_wal_enabled(db_path):
+    """
+    Il WAL va chiesto con localwal in centralsettings.json e vale solo per MyMusic: il journal_mode resta scritto nel
+    file e cambierebbe per Kodi e per chiunque altro apra Textures e ViewModes
+    """
+    return bool(get_db_params().get('localwal')) and db_path == get_music_db_path()
+
+
+def _connect_local_db(db_path):
+    # check_same_thread disattivato solo per poterle chiudere tutte dal thread principale, ogni thread usa la sua
+    local_db = sqlite3.connect(db_path, check_same_thread=False)
+    # il trace formatta ogni statement, lo aggancio solo se il log di debug è attivo
+    if is_debug_logging_enabled():
+        local_db.set_trace_callback(log)
+    if is_local_wal_enabled(db_path):
+        try:
+            local_db.execute('PRAGMA journal_mode=WAL')
+            # synchronous=NORMAL è sicuro solo con il WAL, con il journal classico resta il default di Kodi
+            local_db.execute('PRAGMA synchronous=NORMAL')
+        except sqlite3.OperationalError as e:
+            # se Kodi tiene il db occupato resto sul journal corrente
+            log(f'Impossibile attivare il WAL su {db_path}: {e}')
+    local_db.execute(f'PRAGMA cache_size={int(local_db_cache_size)}')
+    local_db.execute(f'PRAGMA mmap_size={int(local_db_mmap_size)}')
+    return local_db
+
+
+def get_local_db(db_path=None):
+    """
+    Restituisce la connessione persistente al db locale indicato (MyMusic se non specificato), aperta una volta sola
+    per thread e riutilizzata per tutta l'esecuzione. Non va chiusa dal chiamante: ci pensa close_local_dbs all'uscita.
+    """
+    if db_path is None:
+        db_path = get_music_db_path()
+    connections = getattr(_local_dbs, 'connections', None)
+    if connections is None:
+        connections = _local_dbs.connections = {}
+    local_db = connections.get(db_path)
+    if local_db is None:
+        local_db = _connect_local_db(db_path)
+        connections[db_path] = local_db
+        with _local_db_connections_lock:
+            _local_db_connections.append(local_db)
+    return local_db
+
+
+def close_local_dbs():
+    with _local_db_connections_lock:
+        connections = list(_local_db_connections)
+        _local_db_connections.clear()
+    for local_db in connections:
+        try:
+            local_db.close()
+        except Exception as e:
+            log(f'Errore in chiusura della connessione al db locale: {e}')
+    _local_dbs.connections = {}
+
+
+class CentralDbPool:
+    """
+    Pool di connessioni verso il MariaDB centrale, riutilizzate per tutta la durata del processo.
+    Le connessioni inattive da più di idle_timeout secondi vengono chiuse, quelle riprese dal pool
+    vengono verificate con un ping prima dell'uso. Se per acquire_timeout secondi non si libera nessuna
+    connessione, acquire solleva TimeoutError invece di restare in attesa.
+    """
+
+    def __init__(self, db_params, database, max_size=central_db_pool_size, idle_timeout=central_db_idle_timeout,
+                 multi_statements=False, acquire_timeout=central_db_acquire_timeout):
+        self.multi_statements = multi_statements
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.host = db_params.get('host')
+        self.user = db_params.get('user')
+        self.password = db_params.get('pass')
+        self.database = database
+        self.idle_timeout = idle_timeout
+        # coppie (connessione, istante del rilascio), le più recenti in fondo
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _connect(self):
+        # autocommit per non restare inchiodati allo snapshot della transazione tra una query e l'altra,
+        # MULTI_STATEMENTS solo nel pool di fetch_central_result_sets: le altre connessioni restano a statement singolo
+        client_flag = CLIENT.MULTI_STATEMENTS if self.multi_statements else 0
+        return pymysql.connect(host=self.host, user=self.user, password=self.password, database=self.database,
+                               port=3306, cursorclass=pymysql.cursors.DictCursor, connect_timeout=18000,
+                               autocommit=True, client_flag=client_flag)
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            connection, _ = self._idle.popleft()
+            _close_quietly(connection)
+
+    def acquire(self):
+        # ogni generatore di stream_central_query tiene la sua connessione finché non viene esaurito o chiuso
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise TimeoutError(f'Nessuna connessione libera verso {self.host}/{self.database} dopo '
+                               f'{self.acquire_timeout} secondi: tutte le {self.max_size} del pool sono in uso')
+        try:
+            with self._lock:
+                self._evict_idle()
+                connection = self._idle.pop()[0] if self._idle else None
+            if connection is None:
+                connection = self._connect()
+            else:
+                connection.ping(reconnect=True)
+            return connection
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, connection, discard=False):
+        try:
+            if discard or not connection.open:
+                _close_quietly(connection)
+            else:
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except Exception:
+            # dopo un errore lo stato della connessione non è affidabile
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard)
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                connection, _ = self._idle.popleft()
+                _close_quietly(connection)
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception as e:
+        log(f'Errore in chiusura della connessione al db centrale: {e}')
+
+
+def get_central_db_pool(db_params, music_db_name, multi_statements=False):
+    pool_key = (db_params.get('host'), db_params.get('user'), db_params.get('pass'), music_db_name, multi_statements)
+    with _central_db_pools_lock:
+        pool = _central_db_pools.get(pool_key)
+        if not pool:
+            pool = CentralDbPool(db_params, music_db_name, multi_statements=multi_statements)
+            _central_db_pools[pool_key] = pool
+    return pool
+
+
+@contextmanager
+def central_db_connection(db_params, music_db_name):
+    """Presta una connessione al db centrale dal pool di processo, da usare come context manager"""
+    with get_central_db_pool(db_params, music_db_name).connection() as central_db:
+        yield central_db
+
+
+def stream_central_query(db_params, music_db_name, query, args=None, batch_size=central_stream_batch_size,
+                         as_tuples=False):
+    """
+    Generatore che esegue la query sul db centrale con un cursore lato server (SSDictCursor) e restituisce
+    le righe una alla volta, leggendole a blocchi invece di caricare l'intero risultato in memoria.
+    Con as_tuples le righe arrivano come tuple (SSCursor), senza costruire un dict per riga.
+    La connessione resta impegnata finché il generatore non viene esaurito o chiuso.
+    """
+    cursor_class = pymysql.cursors.SSCursor if as_tuples else pymysql.cursors.SSDictCursor
+    with central_db_connection(db_params, music_db_name) as central_db:
+        with central_db.cursor(cursor_class) as central_cursor:
+            log(central_cursor.mogrify(query, args))
+            central_cursor.execute(query, args)
+            rows = central_cursor.fetchmany(batch_size)
+            while rows:
+                yield from rows
+                rows = central_cursor.fetchmany(batch_size)
+
+
+def fetch_central_result_sets(db_params, music_db_name, queries, args=None, as_tuples=False):
+    """
+    Esegue le query sul db centrale come un'unica richiesta multi-statement e restituisce la lista
+    dei risultati, uno per query e nello stesso ordine. I parametri di args valgono per l'intera richiesta.
+    Usa un pool a parte, l'unico con connessioni aperte con CLIENT.MULTI_STATEMENTS.
+    """
+    query = ';\n'.join(queries)
+    result_sets = []
+    with get_central_db_pool(db_params, music_db_name, multi_statements=True).connection() as central_db:
+        with central_db.cursor(pymysql.cursors.Cursor if as_tuples else None) as central_cursor:
+            log(central_cursor.mogrify(query, args))
+            central_cursor.execute(query, args)
+            result_sets.append(central_cursor.fetchall())
+            while central_cursor.nextset():
+                result_sets.append(central_cursor.fetchall())
+    return result_sets
+
+
+def close_central_db_pools():
+    with _central_db_pools_lock:
+        pools = list(_central_db_pools.values())
+        _central_db_pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_central_db_pools)
+atexit.register(close_central_rpc_sessions)
+atexit.register(close_local_dbs)
@@ -0,0 +1,101 @@
+import hashlib
+import os
+
+import db_scan
+import xbmc
+import xbmcaddon
+import xbmcvfs
+
+fingerprint_db_name = 'fingerprints.db'
+
+
+def log(msg):
+    xbmc.log(str(msg), xbmc.LOGDEBUG)
+
+
+def fingerprint_row(*values):
+    # repr distingue i NULL dalle stringhe vuote e i tipi dei valori
+    return hashlib.md5(repr(values).encode('utf-8')).hexdigest()
+
+
+class FingerprintSet:
+    """Aggregato SQLite che combina le impronte delle righe indipendentemente dal loro ordine"""
+
+    def __init__(self):
+        self.fingerprints = []
+
+    def step(self, fingerprint):
+        self.fingerprints.append(fingerprint or '')
+
+    def finalize(self):
+        if not self.fingerprints:
+            return None
+        return hashlib.md5(','.join(sorted(self.fingerprints)).encode('utf-8')).hexdigest()
+
+
+def register_fingerprint_functions(db):
+    """Registra fp_row e fp_set su una connessione SQLite per calcolare le impronte direttamente in SQL"""
+    db.create_function('fp_row', -1, fingerprint_row, deterministic=True)
+    db.create_aggregate('fp_set', 1, FingerprintSet)
+
+
+def combine_by_mbid(fingerprints_by_id):
+    """Da {id: (mbid, impronta)} a {mbid: impronta}, più id con lo stesso mbid vengono combinati"""
+    grouped = {}
+    for mbid, fingerprint in fingerprints_by_id.values():
+        if mbid:
+            grouped.setdefault(mbid, []).append(fingerprint or '')
+    return {mbid: ','.join(sorted(fingerprints)) for mbid, fingerprints in grouped.items()}
+
+
+class FingerprintStore:
+    """
+    Sidecar SQLite con le impronte (centrale, locale) di ogni entità registrate all'ultimo allineamento riuscito.
+    Se entrambe le impronte correnti coincidono con quelle salvate l'entità non è cambiata da nessuna delle due parti.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.db = db_scan.get_local_db(db_path)
+        self.db.execute('''
+                        CREATE TABLE IF NOT EXISTS fingerprint
+                        (
+                            entity  TEXT NOT NULL,
+                            mbid    TEXT NOT NULL,
+                            central TEXT,
+                            local   TEXT,
+                            PRIMARY KEY (entity, mbid)
+                        ) WITHOUT ROWID''')
+        self.db.commit()
+
+    def get_all(self, entity):
+        query = 'SELECT mbid, central, local FROM fingerprint WHERE entity = ?'
+        return {mbid: (central, local) for (mbid, central, local) in self.db.execute(query, (entity,))}
+
+    def get_unchanged(self, entity, central_by_mbid, local_by_mbid):
+        """Restituisce gli mbid le cui impronte correnti coincidono con quelle dell'ultimo allineamento"""
+        stored = self.get_all(entity)
+        return {mbid for mbid, central in central_by_mbid.items()
+                if stored.get(mbid) == (central, local_by_mbid.get(mbid))}
+
+    def save(self, entity, central_by_mbid, local_by_mbid):
+        query = 'INSERT OR REPLACE INTO fingerprint (entity, mbid, central, local) VALUES (?, ?, ?, ?)'
+        self.db.executemany(query, ((entity, mbid, central, local_by_mbid.get(mbid))
+                                    for mbid, central in central_by_mbid.items()))
+        self.db.commit()
+
+    def clear(self, entity=None):
+        if entity:
+            self.db.execute('DELETE FROM fingerprint WHERE entity = ?', (entity,))
+        else:
+            self.db.execute('DELETE FROM fingerprint')
+        self.db.commit()
+
+
+def get_fingerprint_store(addon_id=None):
+    """Store delle impronte nella cartella dati dell'add-on indicato (quello corrente se non specificato)"""
+    addon = xbmcaddon.Addon(addon_id) if addon_id else xbmcaddon.Addon()
+    profile_path = xbmcvfs.translatePath(addon.getAddonInfo('profile'))
+    if not xbmcvfs.exists(profile_path):
+        xbmcvfs.mkdirs(profile_path)
+    return FingerprintStore(os.path.join(profile_path, fingerprint_db_name))
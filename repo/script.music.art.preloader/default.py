@@ -314,42 +314,18 @@ def cache_medias_textures(entities_by_type):
         progress.close()
 
 
-def get_id_albums_by_paths(id_albums, scanned_path):
-    get_directory_payload = {
-        "jsonrpc": "2.0",
-        "method": "Files.GetDirectory",
-        "id": "1",
-        "params": {
-            "directory": scanned_path,
-            "media": "music",
-            "properties": [
-                "albumid"
-            ]
-        }
-    }
-    json_result = json.loads(xbmc.executeJSONRPC(json.dumps(get_directory_payload, ensure_ascii=False))).get('result')
-    if json_result:
-        for file in json_result.get('files'):
-            if file.get('albumid') and file.get('albumid') not in id_albums:
-                id_albums.append(file.get('albumid'))
-            elif file.get('type') == 'unknown' and file.get('filetype') == 'directory':
-                get_id_albums_by_paths(id_albums, file.get('file'))
-
-
 def preload_on_texture_cache():
     db_params = db_scan.get_db_params()
     paths_from_params = db_scan.get_paths_from_params()
     use_webdav = db_params.get('sourcetype') == 'webdav'
     textures = get_textures()
     added_paths = []
-    id_albums = []
     if paths_from_params:
         for path in paths_from_params:
             path = db_scan.convert_from_smb_to_davs(path) if use_webdav else path
             if path not in added_paths:
                 added_paths.append(path)
-    for added_path in added_paths:
-        get_id_albums_by_paths(id_albums, added_path)
+    id_albums = db_scan.get_id_albums_by_paths(added_paths)
     entities_by_type = build_entity_map(id_albums, textures)
     cache_medias_textures(entities_by_type)
     execute_addon_with_rpc("script.texture.cache.cleaner")
@@ -1,14 +1,50 @@
+import bisect
 import json
 import sqlite3
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
+import db_bulk
+import db_maintenance
 import db_scan
-import pymysql
+import fingerprints
 import xbmc
 import xbmcaddon
 import xbmcgui
 
 addon_name = xbmcaddon.Addon().getAddonInfo('name')
 addon_id = xbmcaddon.Addon().getAddonInfo('id')
+# limite di GROUP_CONCAT per le impronte sul centrale: con quello predefinito di MySQL (1024 byte) gli album con molte
+# art verrebbero troncati in silenzio e una modifica oltre il taglio lascerebbe l'impronta invariata
+central_group_concat_max_len = 16 * 1024 * 1024
+# campi dell'artista confrontati in fase di allineamento, entrano nella sua impronta
+artist_fingerprint_columns = ('strArtist', 'strMusicBrainzArtistID', 'strType', 'strGender', 'strDisambiguation',
+                              'strBorn', 'strFormed', 'strGenres', 'strMoods', 'strStyles', 'strInstruments',
+                              'strBiography', 'strDied', 'strDisbanded', 'strYearsActive')
+# campi dell'artista riscritti dall'allineamento, nell'ordine dei valori passati a update_artist_records
+artist_update_columns = ('strArtist', 'strDisambiguation', 'strGenres', 'strBiography', 'strType', 'strGender',
+                         'strBorn', 'strFormed', 'strMoods', 'strStyles', 'strInstruments', 'strDied', 'strDisbanded',
+                         'strYearsActive', 'strImage')
+# righe compatte per le mappe di aggregazione dell'intera libreria, al posto di un dict per album o brano
+AggregatedAlbum = namedtuple('AggregatedAlbum', ('id', 'localid', 'mbid'))
+AggregatedSong = namedtuple('AggregatedSong', ('id', 'localid', 'title', 'album_mbid'))
+# album e brani abbinati tra centrale e locale sull'intera libreria, le stesse per il motore python e per quello SQL
+aggregated_album_query = '''
+                         SELECT album.idAlbum,
+                                album.strMusicBrainzAlbumID as mbid
+                         FROM album
+                         WHERE album.strMusicBrainzAlbumID IS NOT NULL'''
+aggregated_song_query = '''
+                        SELECT song.idSong,
+                               song.strTitle,
+                               album.strMusicBrainzAlbumID as album_mbid
+                        FROM song
+                                 JOIN album ON album.idAlbum = song.idAlbum
+                        WHERE album.strMusicBrainzAlbumID IS NOT NULL'''
+# motore per il confronto delle art dell'intera libreria: 'python' (dizionari in memoria) o 'sql' (tabelle temporanee)
+# si può scegliere anche per singola esecuzione col parametro artdiff
+art_diff_engine = 'python'
 
 
 class ScanMonitor(xbmc.Monitor):
@@ -82,46 +118,17 @@ def get_song_by_file(id_albums, call_central, db_params):
     return song_by_file
 
 
-def get_directory(path, call_central, db_params):
-    get_directory_payload = {
-        "jsonrpc": "2.0",
-        "method": "Files.GetDirectory",
-        "id": "1",
-        "params": {
-            "directory": path,
-            "media": "music",
-            "properties": [
-                "albumid",
-                "artistid",
-                "albumartistid",
-                "musicbrainzalbumid"
-            ],
-            "sort": {
-                "method": "file"
-            }
-        }
-    }
-    if call_central:
-        get_directory_response = db_scan.execute_from_central_kodi_webserver(db_params, get_directory_payload).get(
-            'result')
-    else:
-        get_directory_response = json.loads(
-            xbmc.executeJSONRPC(json.dumps(get_directory_payload, ensure_ascii=False))).get('result')
-    return get_directory_response
-
-
-def get_media_paths_to_process(media_details_by_filename, path, call_central, db_params):
-    directory_response = get_directory(path, call_central, db_params)
-    if directory_response:
-        for file_response in directory_response.get('files'):
-            if file_response.get('filetype') == 'directory':
-                if file_response.get('type') == 'unknown':
-                    get_media_paths_to_process(media_details_by_filename, file_response.get('file'), call_central,
-                                               db_params)
-                else:
-                    media_details_by_filename[file_response.get('file')] = file_response
-            elif file_response.get('type') == 'song':
+def get_media_paths_to_process(media_details_by_filename, paths, call_central, db_params):
+    directory_properties = ["albumid", "artistid", "albumartistid", "musicbrainzalbumid"]
+    max_parallel_batches = db_scan.central_rpc_max_parallel if call_central else 1
+    file_responses = db_scan.walk_music_directories(paths, directory_properties, call_central, db_params, 'file',
+                                                    max_parallel_batches)
+    for file_response in file_responses:
+        if file_response.get('filetype') == 'directory':
+            if file_response.get('type') != 'unknown':
                 media_details_by_filename[file_response.get('file')] = file_response
+        elif file_response.get('type') == 'song':
+            media_details_by_filename[file_response.get('file')] = file_response
 
     return media_details_by_filename
 
@@ -142,134 +149,50 @@ def get_all_medias(media_type, db_params, music_db_name):
 
 def _get_albums_aggregated(db_params, music_db_name):
     """Aggrega album usando MusicBrainz Album ID"""
-    album_query = '''
-                  SELECT album.idAlbum,
-                         album.strMusicBrainzAlbumID as mbid
-                  FROM album
-                  WHERE album.strMusicBrainzAlbumID IS NOT NULL'''
-
-    # Recupera dati centrali
-    central_albums = {}
-    central_results = []
-    host = db_params.get('host')
-    username = db_params.get('user')
-    password = db_params.get('pass')
-    central_db = pymysql.connect(host=host, user=username, password=password, database=music_db_name, port=3306,
-                                 cursorclass=pymysql.cursors.DictCursor, connect_timeout=18000)
-    with central_db:
-        with central_db.cursor() as central_cursor:
-            central_cursor.execute(album_query)
-            log(central_cursor.mogrify(album_query))
-            central_results.extend(central_cursor.fetchall())
-    if central_results:
-        central_albums = {row.get('mbid'): row.get('idAlbum') for row in central_results}
+    # Recupera dati centrali, le righe arrivano in streaming come tuple direttamente nel dizionario
+    central_albums = {sys.intern(mbid): id_album for (id_album, mbid) in
+                      db_scan.stream_central_query(db_params, music_db_name, aggregated_album_query,
+                                                   as_tuples=True)}
 
     # Recupera dati locali
-    local_albums = {}
-    local_results = []
     music_db_path = db_scan.get_music_db_path()
-    music_db = sqlite3.connect(music_db_path)
-    music_db.row_factory = sqlite3.Row
-    music_db.set_trace_callback(log)
+    music_db = db_scan.get_local_db(music_db_path)
     music_db_cursor = music_db.cursor()
-    music_db_cursor.execute(album_query)
-    local_results.extend(music_db_cursor.fetchall())
+    local_albums = {mbid: id_album for (id_album, mbid) in music_db_cursor.execute(aggregated_album_query)}
     music_db_cursor.close()
-    music_db.close()
-    if local_results:
-        local_albums = {row['mbid']: row['idAlbum'] for row in local_results}
 
     # Aggrega risultati
-    aggregated_albums = []
-    for mbid in central_albums.keys():
-        album_data = {
-            'id': central_albums[mbid],
-            'localid': local_albums.get(mbid),
-            'mbid': mbid
-        }
-        aggregated_albums.append(album_data)
-
-    return aggregated_albums
+    return [AggregatedAlbum(id_album, local_albums.get(mbid), mbid) for mbid, id_album in central_albums.items()]
 
 
 def _get_songs_aggregated(db_params, music_db_name):
     """
     Aggrega brani usando tupla (titolo normalizzato, album MBID) come chiave univoca
     """
-    song_query = '''
-                 SELECT song.idSong,
-                        song.strTitle,
-                        album.strMusicBrainzAlbumID as album_mbid
-                 FROM song
-                          JOIN album ON album.idAlbum = song.idAlbum
-                 WHERE album.strMusicBrainzAlbumID IS NOT NULL'''
-
-    # Recupera dati centrali
+    # Recupera dati centrali, le righe arrivano in streaming come tuple senza materializzare l'intero risultato
+    # gli mbid degli album si ripetono per ogni brano: internati occupano memoria una volta sola
     central_songs = {}
-    central_results = []
-    host = db_params.get('host')
-    username = db_params.get('user')
-    password = db_params.get('pass')
-    central_db = pymysql.connect(host=host, user=username, password=password, database=music_db_name, port=3306,
-                                 cursorclass=pymysql.cursors.DictCursor, connect_timeout=18000)
-    with central_db:
-        with central_db.cursor() as central_cursor:
-            central_cursor.execute(song_query)
-            log(central_cursor.mogrify(song_query))
-            central_results.extend(central_cursor.fetchall())
-    if central_results:
-        for row in central_results:
-            title = row.get('strTitle')
-            album_mbid = row.get('album_mbid')
-            if title and album_mbid:
-                # Crea chiave univoca: titolo normalizzato + album MBID
-                key = _create_song_key(title, album_mbid)
-                central_songs[key] = {
-                    'id': row.get('idSong'),
-                    'title': title,
-                    'album_mbid': album_mbid
-                }
-
-    # Recupera dati locali
+    central_rows = db_scan.stream_central_query(db_params, music_db_name, aggregated_song_query, as_tuples=True)
+    for (id_song, title, album_mbid) in central_rows:
+        if title and album_mbid:
+            album_mbid = sys.intern(album_mbid)
+            # Crea chiave univoca: titolo normalizzato + album MBID
+            central_songs[_create_song_key(title, album_mbid)] = (id_song, title, album_mbid)
+
+    # Recupera dati locali, del brano locale serve solo l'id
     local_songs = {}
-    local_results = []
     music_db_path = db_scan.get_music_db_path()
-    music_db = sqlite3.connect(music_db_path)
-    music_db.row_factory = sqlite3.Row
-    music_db.set_trace_callback(log)
+    music_db = db_scan.get_local_db(music_db_path)
     music_db_cursor = music_db.cursor()
-    music_db_cursor.execute(song_query)
-    local_results.extend(music_db_cursor.fetchall())
+    for (id_song, title, album_mbid) in music_db_cursor.execute(aggregated_song_query):
+        if title and album_mbid:
+            # Crea chiave univoca: titolo normalizzato + album MBID
+            local_songs[_create_song_key(title, album_mbid)] = id_song
     music_db_cursor.close()
-    music_db.close()
-    if local_results:
-        for row in local_results:
-            title = row['strTitle']
-            album_mbid = row['album_mbid']
-
-            if title and album_mbid:
-                # Crea chiave univoca: titolo normalizzato + album MBID
-                key = _create_song_key(title, album_mbid)
-                local_songs[key] = {
-                    'id': row['idSong'],
-                    'title': title,
-                    'album_mbid': album_mbid
-                }
 
     # Aggrega risultati
-    aggregated_songs = []
-    for key, central_song in central_songs.items():
-        local_song = local_songs.get(key)
-
-        song_data = {
-            'id': central_song['id'],
-            'localid': local_song['id'] if local_song else None,
-            'title': central_song['title'],
-            'album_mbid': central_song['album_mbid']
-        }
-        aggregated_songs.append(song_data)
-
-    return aggregated_songs
+    return [AggregatedSong(id_song, local_songs.get(key), title, album_mbid)
+            for key, (id_song, title, album_mbid) in central_songs.items()]
 
 
 def _create_song_key(title, album_mbid):
@@ -296,46 +219,49 @@ def get_media_details_from_directory(scanned_paths, scanned_paths_local, db_para
     local_response_by_filename = {}
     media_details_by_id = {}
     use_webdav = db_params.get('sourcetype') == 'webdav'
-    for scanned_path in scanned_paths:
-        get_media_paths_to_process(central_response_by_filename, scanned_path, True, db_params)
-    for local_path in scanned_paths_local:
-        get_media_paths_to_process(local_response_by_filename, local_path, False, db_params)
+    path_translator = db_scan.get_path_translator(db_params)
+    get_media_paths_to_process(central_response_by_filename, scanned_paths, True, db_params)
+    get_media_paths_to_process(local_response_by_filename, scanned_paths_local, False, db_params)
 
     central_ids = []
     local_ids = []
-    for file in central_response_by_filename.keys():
-        local_key = db_scan.convert_from_smb_to_davs(file) if use_webdav else file
-        central_file = central_response_by_filename.get(file)
+    # chiave locale calcolata una volta sola per ogni media del centrale
+    local_key_by_file = {}
+    for file, central_file in central_response_by_filename.items():
+        local_key = path_translator.to_davs(file) if use_webdav else file
+        local_key_by_file[file] = local_key
         local_file = local_response_by_filename.get(local_key)
         if central_file:
             central_ids.append(central_file.get('albumid'))
         if local_file:
             local_ids.append(local_file.get('albumid'))
 
-    central_songs_by_file = get_song_by_file(central_ids, True, db_params)
+    # indice albumid -> brani del centrale, così ogni album legge solo i propri brani
+    central_songs_by_id_album = get_songs_by_albums(central_ids, True, db_params)
+    central_songs_by_file = {}
+    local_song_path_by_file = {}
+    for album_songs in central_songs_by_id_album.values():
+        for central_song in album_songs:
+            central_song_path = central_song.get('file')
+            central_songs_by_file[central_song_path] = central_song
+            local_song_path_by_file[central_song_path] = path_translator.to_davs(
+                central_song_path) if use_webdav else central_song_path
     local_songs_by_file = get_song_by_file(local_ids, False, db_params)
 
-    for file in central_response_by_filename.keys():
-        local_key = db_scan.convert_from_smb_to_davs(file) if use_webdav else file
-        central_file = central_response_by_filename.get(file)
-        local_file = local_response_by_filename.get(local_key)
+    for file, central_file in central_response_by_filename.items():
+        local_file = local_response_by_filename.get(local_key_by_file[file])
         if central_file and local_file:
             if central_file.get('type') == 'album':
-                songs = []
-                central_file_album_id = central_file.get('albumid')
+                songs_by_file = {}
                 if central_songs_by_file and local_songs_by_file:
-                    for central_song_path in central_songs_by_file.keys():
-                        central_song = central_songs_by_file.get(central_song_path)
-                        if central_song.get('albumid') == central_file_album_id:
-                            local_song_path = db_scan.convert_from_smb_to_davs(
-                                central_song_path) if use_webdav else central_song_path
-                            local_song = local_songs_by_file.get(local_song_path)
-                            if local_song:
-                                central_song['localsongid'] = local_song.get('songid')
-                                central_song['localartistid'] = local_song.get('artistid')
-                            if central_song not in songs:
-                                songs.append(central_song)
-                central_file['songs'] = songs
+                    for central_song in central_songs_by_id_album.get(central_file.get('albumid'), ()):
+                        central_song_path = central_song.get('file')
+                        local_song = local_songs_by_file.get(local_song_path_by_file[central_song_path])
+                        if local_song:
+                            central_song['localsongid'] = local_song.get('songid')
+                            central_song['localartistid'] = local_song.get('artistid')
+                        songs_by_file[central_song_path] = central_song
+                central_file['songs'] = list(songs_by_file.values())
             central_file['localalbumid'] = local_file.get('albumid')
             # per gli artisti mi servono gli id di entrambe le istanze
             central_file['localartistid'] = local_file.get('artistid')
@@ -370,13 +296,13 @@ def get_songs_by_albums(id_albums, call_central, db_params):
             }
         }
         json_payloads.append(json_payload)
-    splitted_requests = db_scan.split_json(json_payloads)
-    for splitted_request in splitted_requests:
-        if call_central:
-            response_get_songs = db_scan.execute_from_central_kodi_webserver(db_params, splitted_request)
-        else:
-            response_get_songs = json.loads(xbmc.executeJSONRPC(json.dumps(splitted_request, ensure_ascii=False)))
-
+    batch_payloads = db_scan.build_json_rpc_batches(json_payloads)
+    if call_central:
+        # i batch sono indipendenti tra loro, verso il centrale li mando in parallelo
+        responses_get_songs = db_scan.execute_many_from_central_kodi_webserver(db_params, batch_payloads)
+    else:
+        responses_get_songs = (json.loads(xbmc.executeJSONRPC(batch_payload)) for batch_payload in batch_payloads)
+    for response_get_songs in responses_get_songs:
         for json_response in response_get_songs:
             result = json_response.get('result')
             album_songs = result.get('songs')
@@ -417,43 +343,28 @@ def get_artworks_by_key(id_albums, media_type, db_params, call_central, music_db
         query += album_in_condition
 
     if call_central:
-        host = db_params.get('host')
-        username = db_params.get('user')
-        password = db_params.get('pass')
-        central_db = pymysql.connect(host=host, user=username, password=password, database=music_db_name, port=3306,
-                                     cursorclass=pymysql.cursors.DictCursor, connect_timeout=18000)
-        with central_db:
-            with central_db.cursor() as central_cursor:
-                if id_albums:
+        if id_albums:
+            with db_scan.central_db_connection(db_params, music_db_name) as central_db:
+                with central_db.cursor() as central_cursor:
                     chunks = [id_albums[i:i + 1000] for i in range(0, len(id_albums), 1000)]
                     for chunk in chunks:
                         placeholders = ','.join(['%s'] * len(chunk))
                         central_cursor.execute(query % placeholders, chunk)
                         log(central_cursor.mogrify(query % placeholders, chunk))
                         art_results.extend(central_cursor.fetchall())
-                else:
-                    central_cursor.execute(query)
-                    log(central_cursor.mogrify(query))
-                    art_results.extend(central_cursor.fetchall())
-        if art_results:
-            for art_result in art_results:
-                key = (art_result.get('idAlbum'),
-                       art_result.get('strMusicBrainzAlbumID')) if media_type == 'album' else (
-                    art_result.get('idSong'), art_result.get('strMusicBrainzAlbumID'), art_result.get('strTitle'))
-                art_info = artworks_by_key.get(key)
-                if not art_info:
-                    art_info = {
-                        art_result.get('type'): art_result.get('url')
-                    }
-                else:
-                    art_info[art_result.get('type')] = art_result.get('url')
-                artworks_by_key[key] = art_info
+        else:
+            # tutta la libreria: le righe arrivano in streaming invece di essere caricate tutte insieme
+            art_results = db_scan.stream_central_query(db_params, music_db_name, query)
+        for art_result in art_results:
+            mbid = _intern(art_result.get('strMusicBrainzAlbumID'))
+            key = (art_result.get('idAlbum'), mbid) if media_type == 'album' else (
+                art_result.get('idSong'), mbid, art_result.get('strTitle'))
+            artworks_by_key.setdefault(key, {})[_intern(art_result.get('type'))] = art_result.get('url')
     else:
         music_db_path = db_scan.get_music_db_path()
-        music_db = sqlite3.connect(music_db_path)
-        music_db.row_factory = sqlite3.Row
-        music_db.set_trace_callback(log)
+        music_db = db_scan.get_local_db(music_db_path)
         music_db_cursor = music_db.cursor()
+        music_db_cursor.row_factory = sqlite3.Row
         if id_albums:
             chunks = [id_albums[i:i + 999] for i in range(0, len(id_albums), 999)]
             for chunk in chunks:
@@ -461,28 +372,25 @@ def get_artworks_by_key(id_albums, media_type, db_params, call_central, music_db
                 music_db_cursor.execute(query % placeholders, chunk)
                 art_results.extend(music_db_cursor.fetchall())
         else:
-            music_db_cursor.execute(query)
-            art_results.extend(music_db_cursor.fetchall())
+            art_results = music_db_cursor.execute(query)
+        for art_result in art_results:
+            mbid = _intern(art_result['strMusicBrainzAlbumID'])
+            key = (art_result['idAlbum'], mbid) if media_type == 'album' else (
+                art_result['idSong'], mbid, art_result['strTitle'])
+            artworks_by_key.setdefault(key, {})[_intern(art_result['type'])] = art_result['url']
         music_db_cursor.close()
-        music_db.close()
-        if art_results:
-            for art_result in art_results:
-                key = (art_result['idAlbum'], art_result['strMusicBrainzAlbumID']) if media_type == 'album' else (
-                    art_result['idSong'], art_result['strMusicBrainzAlbumID'], art_result['strTitle'])
-                art_info = artworks_by_key.get(key)
-                if not art_info:
-                    art_info = {
-                        art_result['type']: art_result['url']
-                    }
-                else:
-                    art_info[art_result['type']] = art_result['url']
-                artworks_by_key[key] = art_info
     return artworks_by_key
 
 
+def _intern(value):
+    # mbid e tipi di art si ripetono su migliaia di righe, internati vengono tenuti in memoria una volta sola
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 def get_artists_data(id_artists_set, db_params, call_central, music_db_name):
     id_artists = []
-    artists_data = []
+    # indicizzo per (idArtist, url): le altre colonne dipendono dall'artista, le righe doppie vengono dalla join su art
+    artists_data = {}
     discography_by_artist = {}
     artist_results = []
     artist_discography_results = []
@@ -516,12 +424,7 @@ def get_artists_data(id_artists_set, db_params, call_central, music_db_name):
         artist_discography_query += artist_in_condition
 
     if call_central:
-        host = db_params.get('host')
-        username = db_params.get('user')
-        password = db_params.get('pass')
-        central_db = pymysql.connect(host=host, user=username, password=password, database=music_db_name, port=3306,
-                                     cursorclass=pymysql.cursors.DictCursor, connect_timeout=18000)
-        with central_db:
+        with db_scan.central_db_connection(db_params, music_db_name) as central_db:
             with central_db.cursor() as central_cursor:
                 if id_artists:
                     chunks = [id_artists[i:i + 1000] for i in range(0, len(id_artists), 1000)]
@@ -542,18 +445,15 @@ def get_artists_data(id_artists_set, db_params, call_central, music_db_name):
                     artist_discography_results.extend(central_cursor.fetchall())
         if artist_discography_results:
             for artist_discography_result in artist_discography_results:
-                discography = discography_by_artist.get(artist_discography_result.get('idArtist'))
-                if not discography:
-                    discography = []
+                # uscite indicizzate per (album, anno, mbid) per scartare i doppioni
+                discography = discography_by_artist.setdefault(artist_discography_result.get('idArtist'), {})
                 if artist_discography_result.get('strAlbum') and artist_discography_result.get('strYear'):
                     discography_info = {
                         'album': artist_discography_result.get('strAlbum'),
                         'year': artist_discography_result.get('strYear'),
                         'mbid': artist_discography_result.get('strReleaseGroupMBID')
                     }
-                    if discography_info not in discography:
-                        discography.append(discography_info)
-                discography_by_artist[artist_discography_result.get('idArtist')] = discography
+                    discography.setdefault(tuple(discography_info.values()), discography_info)
         if artist_results:
             for artist in artist_results:
                 artist_info = {
@@ -575,17 +475,15 @@ def get_artists_data(id_artists_set, db_params, call_central, music_db_name):
                     'disbanded': artist.get('strDisbanded'),
                     'art_url': artist.get('url')
                 }
-                artist_discography = discography_by_artist.get(artist.get('idArtist'))
+                artist_discography = list(discography_by_artist.get(artist.get('idArtist'), {}).values())
                 if artist_discography:
                     artist_info['discography'] = artist_discography
-                if artist_info not in artists_data:
-                    artists_data.append(artist_info)
+                artists_data.setdefault((artist.get('idArtist'), artist.get('url')), artist_info)
     else:
         music_db_path = db_scan.get_music_db_path()
-        music_db = sqlite3.connect(music_db_path)
-        music_db.row_factory = sqlite3.Row
-        music_db.set_trace_callback(log)
+        music_db = db_scan.get_local_db(music_db_path)
         music_db_cursor = music_db.cursor()
+        music_db_cursor.row_factory = sqlite3.Row
         if id_artists:
             chunks = [id_artists[i:i + 999] for i in range(0, len(id_artists), 999)]
             for chunk in chunks:
@@ -600,21 +498,17 @@ def get_artists_data(id_artists_set, db_params, call_central, music_db_name):
             music_db_cursor.execute(artist_discography_query)
             artist_discography_results.extend(music_db_cursor.fetchall())
         music_db_cursor.close()
-        music_db.close()
         if artist_discography_results:
             for artist_discography_result in artist_discography_results:
-                discography = discography_by_artist.get(artist_discography_result['idArtist'])
-                if not discography:
-                    discography = []
+                # uscite indicizzate per (album, anno, mbid) per scartare i doppioni
+                discography = discography_by_artist.setdefault(artist_discography_result['idArtist'], {})
                 if artist_discography_result['strAlbum'] and artist_discography_result['strYear']:
                     discography_info = {
                         'album': artist_discography_result['strAlbum'],
                         'year': artist_discography_result['strYear'],
                         'mbid': artist_discography_result['strReleaseGroupMBID']
                     }
-                    if discography_info not in discography:
-                        discography.append(discography_info)
-                discography_by_artist[artist_discography_result['idArtist']] = discography
+                    discography.setdefault(tuple(discography_info.values()), discography_info)
         if artist_results:
             for artist_result in artist_results:
                 artist_info = {
@@ -636,76 +530,217 @@ def get_artists_data(id_artists_set, db_params, call_central, music_db_name):
                     'disbanded': artist_result['strDisbanded'],
                     'art_url': artist_result['url']
                 }
-                artist_discography = discography_by_artist.get(artist_result['idArtist'])
+                artist_discography = list(discography_by_artist.get(artist_result['idArtist'], {}).values())
                 if artist_discography:
                     artist_info['discography'] = artist_discography
-                if artist_info not in artists_data:
-                    artists_data.append(artist_info)
-    return artists_data
+                artists_data.setdefault((artist_result['idArtist'], artist_result['url']), artist_info)
+    return list(artists_data.values())
+
+
+def _get_fingerprints(central_query, local_query, ids, call_central, db_params, music_db_name):
+    """Esegue a blocchi la query d'impronta sul db indicato e restituisce {id: (mbid, impronta)}"""
+    fingerprints_by_id = {}
+    if not ids:
+        return fingerprints_by_id
+    ids = list(ids)
+    if call_central:
+        with db_scan.central_db_connection(db_params, music_db_name) as central_db:
+            with central_db.cursor() as central_cursor:
+                central_cursor.execute('SET SESSION group_concat_max_len = %s', (central_group_concat_max_len,))
+                for i in range(0, len(ids), 1000):
+                    chunk = ids[i:i + 1000]
+                    placeholders = ','.join(['%s'] * len(chunk))
+                    central_cursor.execute(central_query % placeholders, chunk)
+                    for row in central_cursor.fetchall():
+                        fingerprints_by_id[row.get('id')] = (row.get('mbid'), row.get('fingerprint'))
+    else:
+        music_db = db_scan.get_local_db(db_scan.get_music_db_path())
+        fingerprints.register_fingerprint_functions(music_db)
+        music_db_cursor = music_db.cursor()
+        for i in range(0, len(ids), 999):
+            chunk = ids[i:i + 999]
+            placeholders = ','.join(['?'] * len(chunk))
+            for (id_media, mbid, fingerprint) in music_db_cursor.execute(local_query % placeholders, chunk):
+                fingerprints_by_id[id_media] = (mbid, fingerprint)
+        music_db_cursor.close()
+    return fingerprints_by_id
+
+
+def get_artist_fingerprints(id_artists, call_central, db_params, music_db_name):
+    """Impronta per artista di campi anagrafici, art e discografia"""
+    central_columns = ', '.join(f'IFNULL(artist.{column}, CHAR(0))' for column in artist_fingerprint_columns)
+    local_columns = ', '.join(f'artist.{column}' for column in artist_fingerprint_columns)
+    central_query = f'''
+                    SELECT artist.idArtist AS id,
+                           artist.strMusicBrainzArtistID AS mbid,
+                           MD5(CONCAT_WS('|',
+                                         MD5(CONCAT_WS(CHAR(31), {central_columns})),
+                                         IFNULL((SELECT GROUP_CONCAT(MD5(CONCAT_WS(CHAR(31), art.type, art.url))
+                                                                     ORDER BY art.type, art.url SEPARATOR ',')
+                                                 FROM art
+                                                 WHERE art.media_id = artist.idArtist
+                                                   AND art.media_type = 'artist'), ''),
+                                         IFNULL((SELECT GROUP_CONCAT(MD5(CONCAT_WS(CHAR(31), d.strAlbum, d.strYear,
+                                                                                   d.strReleaseGroupMBID))
+                                                                     ORDER BY d.strAlbum, d.strYear, d.strReleaseGroupMBID
+                                                                     SEPARATOR ',')
+                                                 FROM discography d
+                                                 WHERE d.idArtist = artist.idArtist), ''))) AS fingerprint
+                    FROM artist
+                    WHERE artist.idArtist IN (%s)'''
+    local_query = f'''
+                  SELECT artist.idArtist,
+                         artist.strMusicBrainzArtistID,
+                         fp_row({local_columns},
+                                (SELECT fp_set(fp_row(art.type, art.url))
+                                 FROM art
+                                 WHERE art.media_id = artist.idArtist
+                                   AND art.media_type = 'artist'),
+                                (SELECT fp_set(fp_row(d.strAlbum, d.strYear, d.strReleaseGroupMBID))
+                                 FROM discography d
+                                 WHERE d.idArtist = artist.idArtist))
+                  FROM artist
+                  WHERE artist.idArtist IN (%s)'''
+    return _get_fingerprints(central_query, local_query, id_artists, call_central, db_params, music_db_name)
+
+
+def get_album_fingerprints(id_albums, call_central, db_params, music_db_name):
+    """Impronta per album delle art dell'album e dei suoi brani"""
+    central_query = '''
+                    SELECT album.idAlbum AS id,
+                           album.strMusicBrainzAlbumID AS mbid,
+                           MD5(CONCAT_WS('|',
+                                         IFNULL((SELECT GROUP_CONCAT(MD5(CONCAT_WS(CHAR(31), art.type, art.url))
+                                                                     ORDER BY art.type, art.url SEPARATOR ',')
+                                                 FROM art
+                                                 WHERE art.media_id = album.idAlbum
+                                                   AND art.media_type = 'album'), ''),
+                                         IFNULL((SELECT GROUP_CONCAT(MD5(CONCAT_WS(CHAR(31), song.idSong, song.strTitle,
+                                                                                   art.type, art.url))
+                                                                     ORDER BY song.idSong, art.type, art.url
+                                                                     SEPARATOR ',')
+                                                 FROM song
+                                                          JOIN art ON art.media_id = song.idSong
+                                                     AND art.media_type = 'song'
+                                                 WHERE song.idAlbum = album.idAlbum), ''))) AS fingerprint
+                    FROM album
+                    WHERE album.idAlbum IN (%s)'''
+    local_query = '''
+                  SELECT album.idAlbum,
+                         album.strMusicBrainzAlbumID,
+                         fp_row((SELECT fp_set(fp_row(art.type, art.url))
+                                 FROM art
+                                 WHERE art.media_id = album.idAlbum
+                                   AND art.media_type = 'album'),
+                                (SELECT fp_set(fp_row(song.idSong, song.strTitle, art.type, art.url))
+                                 FROM song
+                                          JOIN art ON art.media_id = song.idSong
+                                     AND art.media_type = 'song'
+                                 WHERE song.idAlbum = album.idAlbum))
+                  FROM album
+                  WHERE album.idAlbum IN (%s)'''
+    return _get_fingerprints(central_query, local_query, id_albums, call_central, db_params, music_db_name)
+
+
+def _without_unchanged(ids, fingerprints_by_id, unchanged_mbids):
+    return {id_media: None for id_media in ids
+            if fingerprints_by_id.get(id_media, (None, None))[0] not in unchanged_mbids}
 
 
 def update_arts(arts_to_insert, arts_to_update, arts_to_remove):
-    music_db_path = db_scan.get_music_db_path()
-    music_db = sqlite3.connect(music_db_path)
-    music_db.set_trace_callback(log)
+    """
+    Applica inserimenti, rimozioni e aggiornamenti delle art in un'unica transazione:
+    le differenze passano da una tabella temporanea e vengono scritte con statement set-based.
+    """
+    if not arts_to_insert and not arts_to_update and not arts_to_remove:
+        return
+    music_db = db_scan.get_local_db(db_scan.get_music_db_path())
     music_db_cursor = music_db.cursor()
-    if arts_to_insert:
-        query = '''INSERT INTO art (media_id, media_type, type, url)
-                   VALUES (?, ?, ?, ?)'''
-        music_db_cursor.executemany(query, arts_to_insert)
-        music_db.commit()
-    if arts_to_remove:
-        query = '''
-                DELETE
-                FROM art
-                WHERE media_id = ?
-                  AND media_type = ?
-                  AND type = ?'''
-        music_db_cursor.executemany(query, arts_to_remove)
-        music_db.commit()
-    if arts_to_update:
-        query = '''
-                UPDATE art
-                SET url = ?
-                WHERE media_id = ?
-                  AND media_type = ?
-                  AND type = ?'''
-        music_db_cursor.executemany(query, arts_to_update)
+    try:
+        music_db_cursor.execute('BEGIN')
+        music_db_cursor.execute('''
+                                CREATE TEMP TABLE art_sync
+                                (
+                                    op         TEXT,
+                                    media_id   INTEGER,
+                                    media_type TEXT,
+                                    type       TEXT,
+                                    url        TEXT
+                                )''')
+        music_db_cursor.execute('CREATE INDEX temp.ix_art_sync ON art_sync (media_id, media_type, type, op)')
+        staging_columns = ('op', 'media_id', 'media_type', 'type', 'url')
+        db_bulk.bulk_insert(music_db, 'temp.art_sync', staging_columns,
+                            (('I', media_id, media_type, art_type, url)
+                             for (media_id, media_type, art_type, url) in arts_to_insert))
+        db_bulk.bulk_insert(music_db, 'temp.art_sync', staging_columns,
+                            (('D', media_id, media_type, art_type, None)
+                             for (media_id, media_type, art_type) in arts_to_remove))
+        db_bulk.bulk_insert(music_db, 'temp.art_sync', staging_columns,
+                            (('U', media_id, media_type, art_type, url)
+                             for (url, media_id, media_type, art_type) in arts_to_update))
+        # l'ordine resta quello storico, inserimenti, rimozioni e poi aggiornamenti: una chiave presente sia
+        # tra gli inserimenti sia tra le rimozioni finisce rimossa
+        music_db_cursor.execute('''
+                                INSERT INTO art (media_id, media_type, type, url)
+                                SELECT s.media_id, s.media_type, s.type, s.url
+                                FROM temp.art_sync s
+                                WHERE s.op = 'I'
+                                ''')
+        music_db_cursor.execute('''
+                                DELETE
+                                FROM art
+                                WHERE EXISTS (SELECT 1
+                                              FROM temp.art_sync s
+                                              WHERE s.media_id = art.media_id
+                                                AND s.media_type = art.media_type
+                                                AND s.type = art.type
+                                                AND s.op = 'D')''')
+        if sqlite3.sqlite_version_info >= (3, 33, 0):
+            update_query = '''
+                           UPDATE art
+                           SET url = s.url
+                           FROM temp.art_sync s
+                           WHERE s.op = 'U'
+                             AND s.media_id = art.media_id
+                             AND s.media_type = art.media_type
+                             AND s.type = art.type'''
+        else:
+            # UPDATE ... FROM non disponibile sulle versioni più vecchie di SQLite
+            update_query = '''
+                           UPDATE art
+                           SET url = (SELECT s.url
+                                      FROM temp.art_sync s
+                                      WHERE s.media_id = art.media_id
+                                        AND s.media_type = art.media_type
+                                        AND s.type = art.type
+                                        AND s.op = 'U')
+                           WHERE EXISTS (SELECT 1
+                                         FROM temp.art_sync s
+                                         WHERE s.media_id = art.media_id
+                                           AND s.media_type = art.media_type
+                                           AND s.type = art.type
+                                           AND s.op = 'U')'''
+        music_db_cursor.execute(update_query)
+        music_db_cursor.execute('DROP TABLE temp.art_sync')
         music_db.commit()
-    music_db_cursor.close()
-    music_db.close()
+    except Exception:
+        # la tabella temporanea sparisce insieme al rollback
+        music_db.rollback()
+        raise
+    finally:
+        music_db_cursor.close()
 
 
 def update_artist_records(central_artists, local_artists, artists_to_update):
     music_db_path = db_scan.get_music_db_path()
-    music_db = sqlite3.connect(music_db_path)
-    music_db.set_trace_callback(log)
-    music_db_cursor = music_db.cursor()
-    update_query = '''
-                   UPDATE artist
-                   SET strArtist=?,
-                       strDisambiguation=?,
-                       strGenres=?,
-                       strBiography=?,
-                       strType=?,
-                       strGender=?,
-                       strBorn=?,
-                       strFormed=?,
-                       strMoods=?,
-                       strStyles=?,
-                       strInstruments=?,
-                       strDied=?,
-                       strDisbanded=?,
-                       strYearsActive=?,
-                       strImage=?,
-                       lastScraped=CURRENT_TIMESTAMP
-                   WHERE idArtist = ?'''
-    artists_value_to_set = []
+    music_db = db_scan.get_local_db(music_db_path)
+    artists_value_to_set = {}
     for central_mbid in artists_to_update:
         artist_to_set = central_artists.get(central_mbid)
         local_artist = local_artists.get(central_mbid)
         if artist_to_set and local_artist:
             artist_values_to_set = (
+                local_artist.get('id'),
                 artist_to_set.get('name'),
                 artist_to_set.get('disambiguation'),
                 artist_to_set.get('genres'),
@@ -720,72 +755,76 @@ def update_artist_records(central_artists, local_artists, artists_to_update):
                 artist_to_set.get('died'),
                 artist_to_set.get('disbanded'),
                 artist_to_set.get('years_active'),
-                '',
-                local_artist.get('id')
+                ''
             )
-            if artist_values_to_set not in artists_value_to_set:
-                artists_value_to_set.append(artist_values_to_set)
-    if artists_value_to_set:
-        music_db_cursor.executemany(update_query, artists_value_to_set)
-        music_db.commit()
-    releases_to_set = []
-    discography_delete_query = 'DELETE FROM discography WHERE idArtist = ?'
-    discography_insert_query = '''INSERT INTO discography (idArtist, strAlbum, strYear, strReleaseGroupMBID)
-                                  VALUES (?, ?, ?, ?)'''
-    artists_to_reset = []
+            artists_value_to_set[artist_values_to_set] = None
+    releases_to_set = {}
+    artists_to_reset = {}
     for central_mbid in artists_to_update:
         local_artist = local_artists.get(central_mbid)
         central_artist = central_artists.get(central_mbid)
         if central_artist.get('discography'):
-            artists_to_reset.append((local_artist.get('id'),))
+            artists_to_reset[local_artist.get('id')] = None
             for release in central_artist.get('discography'):
                 release_to_set = (local_artist.get('id'), release.get('album'), release.get('year'),
                                   release.get('mbid'))
-                if release_to_set not in releases_to_set:
-                    releases_to_set.append(release_to_set)
+                releases_to_set[release_to_set] = None
         elif local_artist.get('discography') and not central_artist.get('discography'):
-            artists_to_reset.append((local_artist.get('id'),))
-    if releases_to_set or artists_to_reset:
-        music_db_cursor.executemany(discography_delete_query, artists_to_reset)
-        music_db.commit()
-    if releases_to_set:
-        music_db_cursor.executemany(discography_insert_query, releases_to_set)
+            artists_to_reset[local_artist.get('id')] = None
+    if not artists_value_to_set and not artists_to_reset:
+        return
+    # artisti e discografie scritti con statement multi-riga in un'unica transazione
+    try:
+        db_bulk.bulk_update(music_db, 'artist', 'idArtist', artist_update_columns, artists_value_to_set,
+                            extra_assignments=('lastScraped=CURRENT_TIMESTAMP',))
+        db_bulk.bulk_delete(music_db, 'discography', 'idArtist', artists_to_reset)
+        db_bulk.bulk_insert(music_db, 'discography', ('idArtist', 'strAlbum', 'strYear', 'strReleaseGroupMBID'),
+                            releases_to_set)
         music_db.commit()
-    music_db_cursor.close()
-    music_db.close()
+    except Exception:
+        music_db.rollback()
+        raise
 
 
-# una bella compattata al db non guasta dopo tutto questo smarmellaio
+# una bella compattata al db non guasta dopo tutto questo smarmellaio, ma solo quando serve davvero
 def compact_db():
-    music_db_path = db_scan.get_music_db_path()
-    music_db = sqlite3.connect(music_db_path)
-    music_db.set_trace_callback(log)
-    music_db_cursor = music_db.cursor()
-    query = '''VACUUM'''
-    music_db_cursor.execute(query)
-    music_db_cursor.close()
-    music_db.close()
+    options = db_maintenance.get_maintenance_options(db_scan.get_db_params())
+    return db_maintenance.maintain_db(db_scan.get_music_db_path(), **options)
 
 
 def clean_paths():
-    query = '''WITH song_paths AS (SELECT p.strPath
-                                   FROM path p
-                                   WHERE p.idPath IN (SELECT idPath FROM song))
-    DELETE
-    FROM path
-    WHERE idPath NOT IN (SELECT idPath FROM song)
-      AND NOT EXISTS (SELECT 1
-                      FROM song_paths sp
-                      WHERE SUBSTR(sp.strPath, 1, LENGTH(path.strPath)) = path.strPath)'''
+    """
+    Rimuove i path senza brani che non sono nemmeno prefisso del path di un brano.
+    I path dei brani vengono ordinati una volta sola e per ogni candidato basta una ricerca binaria:
+    il primo path >= del prefisso è l'unico che può iniziare con esso.
+    """
+    # has_songs vale NULL se song contiene idPath nulli: come per il NOT IN originale quei path non si toccano
+    query = '''
+            SELECT path.idPath, path.strPath, path.idPath IN (SELECT idPath FROM song) AS has_songs
+            FROM path'''
     music_db_path = db_scan.get_music_db_path()
-    music_db = sqlite3.connect(music_db_path)
-    music_db.row_factory = sqlite3.Row
-    music_db.set_trace_callback(log)
+    music_db = db_scan.get_local_db(music_db_path)
     music_db_cursor = music_db.cursor()
-    music_db_cursor.execute(query)
-    music_db.commit()
+    song_paths = []
+    candidate_paths = []
+    for (id_path, str_path, has_songs) in music_db_cursor.execute(query):
+        if has_songs == 1:
+            if str_path is not None:
+                song_paths.append(str_path)
+        elif has_songs == 0:
+            candidate_paths.append((id_path, str_path))
+    song_paths.sort()
+    paths_to_remove = []
+    for (id_path, str_path) in candidate_paths:
+        if str_path is not None:
+            position = bisect.bisect_left(song_paths, str_path)
+            if position < len(song_paths) and song_paths[position].startswith(str_path):
+                continue
+        paths_to_remove.append((id_path,))
+    if paths_to_remove:
+        music_db_cursor.executemany('DELETE FROM path WHERE idPath = ?', paths_to_remove)
+        music_db.commit()
     music_db_cursor.close()
-    music_db.close()
 
 
 def force_path_rescan(paths_to_scan):
@@ -797,32 +836,48 @@ def force_path_rescan(paths_to_scan):
             WHERE song.idAlbum IS NULL
               AND path.strPath IN (%s)
             '''
-    query_results = []
-    music_db = sqlite3.connect(music_db_path)
-    music_db.row_factory = sqlite3.Row
-    music_db.set_trace_callback(log)
+    ids_to_force = []
+    music_db = db_scan.get_local_db(music_db_path)
     music_db_cursor = music_db.cursor()
-    chunks = [paths_to_scan[i:i + 999] for i in range(0, len(paths_to_scan), 999)]
-    for chunk in chunks:
+    for chunk in db_bulk.chunk_rows(paths_to_scan, 1, db_bulk.get_variable_limit(music_db)):
         placeholders = ','.join(['?'] * len(chunk))
-        music_db_cursor.execute(query % placeholders, chunk)
-        query_results.extend(music_db_cursor.fetchall())
+        ids_to_force.extend(id_path for (id_path,) in music_db_cursor.execute(query % placeholders, chunk))
     music_db_cursor.close()
-    music_db.close()
-    ids_to_force = [result['idPath'] for result in query_results]
     if ids_to_force:
-        paths_to_force = []
-        for id_to_force in ids_to_force:
-            paths_to_force.append((id_to_force,))
-        update_query = 'UPDATE path SET strHash=\'\' WHERE idPath=?'
-        music_db = sqlite3.connect(music_db_path)
-        music_db.row_factory = sqlite3.Row
-        music_db.set_trace_callback(log)
-        music_db_cursor = music_db.cursor()
-        music_db_cursor.executemany(update_query, paths_to_force)
+        db_bulk.bulk_update(music_db, 'path', 'idPath', (), ((id_to_force,) for id_to_force in ids_to_force),
+                            extra_assignments=("strHash=''",))
         music_db.commit()
-        music_db_cursor.close()
-        music_db.close()
+
+
+def _run_central_and_local(fetch, central_ids, local_ids, *args):
+    """
+    Esegue la stessa lettura sul centrale e sul locale in parallelo: la parte centrale aspetta la rete
+    e gira su un thread a parte con una connessione del pool, quella locale resta sul thread corrente
+    e riusa la sua connessione SQLite, così il tempo totale si avvicina a quello della più lenta.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        central_future = executor.submit(fetch, True, *central_ids, *args)
+        local_result = fetch(False, *local_ids, *args)
+        return central_future.result(), local_result
+
+
+def _fetch_fingerprints(call_central, id_artists, id_albums, db_params, music_db_name):
+    return (get_artist_fingerprints(id_artists, call_central, db_params, music_db_name),
+            get_album_fingerprints(id_albums, call_central, db_params, music_db_name))
+
+
+def _fetch_align_data(call_central, id_artists, id_albums, db_params, music_db_name, fetch_whole_library,
+                      fetch_whole_library_arts):
+    """Dati artista e art di album e brani di una delle due istanze, id vuoti significano tutta la libreria"""
+    artists_data = []
+    album_arts = {}
+    song_arts = {}
+    if id_artists or fetch_whole_library:
+        artists_data = get_artists_data(id_artists, db_params, call_central, music_db_name)
+    if id_albums or fetch_whole_library_arts:
+        album_arts = get_artworks_by_key(id_albums, 'album', db_params, call_central, music_db_name)
+        song_arts = get_artworks_by_key(id_albums, 'song', db_params, call_central, music_db_name)
+    return artists_data, album_arts, song_arts
 
 
 def align_media_to_central_db(paths, local_paths, exec_mode, db_params):
@@ -830,10 +885,11 @@ def align_media_to_central_db(paths, local_paths, exec_mode, db_params):
     try:
         media_by_id = get_media_details_from_directory(paths, local_paths, db_params)
         music_db_name = db_scan.get_latest_kodi_dbs().get('MyMusic')
-        albums_id_central = []
-        albums_id_local = []
-        songs_id_central = []
-        songs_id_local = []
+        # dict usati come insiemi ordinati
+        albums_id_central = {}
+        albums_id_local = {}
+        songs_id_central = {}
+        songs_id_local = {}
         artists_id_central = set()
         artists_id_local = set()
         arts_to_insert = set()
@@ -843,25 +899,24 @@ def align_media_to_central_db(paths, local_paths, exec_mode, db_params):
         for media_id in media_by_id:
             # id per album e brani
             media = media_by_id.get(media_id)
-            if media.get('albumid') and media.get('albumid') not in albums_id_central:
-                albums_id_central.append(media.get('albumid'))
-            if media.get('localalbumid') and media.get('localalbumid') not in albums_id_local:
-                albums_id_local.append(media.get('localalbumid'))
+            if media.get('albumid'):
+                albums_id_central[media.get('albumid')] = None
+            if media.get('localalbumid'):
+                albums_id_local[media.get('localalbumid')] = None
             if media.get('type') == 'album' and media.get('songs'):
                 for song in media.get('songs'):
-                    if song.get('songid') and song.get('songid') not in songs_id_central:
-                        songs_id_central.append(song.get('songid'))
-                    if song.get('localsongid') and song.get('localsongid') not in songs_id_local:
-                        songs_id_local.append(song.get('localsongid'))
+                    if song.get('songid'):
+                        songs_id_central[song.get('songid')] = None
+                    if song.get('localsongid'):
+                        songs_id_local[song.get('localsongid')] = None
                     if song.get('artistid'):
                         artists_id_central.update(song.get('artistid'))
                     if song.get('localartistid'):
                         artists_id_local.update(song.get('localartistid'))
             else:
-                if media.get('type') == 'song' and media.get('id') not in songs_id_central:
-                    songs_id_central.append(media.get('id'))
-                if media.get('type') == 'song' and media_id not in songs_id_local:
-                    songs_id_local.append(media_id)
+                if media.get('type') == 'song':
+                    songs_id_central[media.get('id')] = None
+                    songs_id_local[media_id] = None
             # id per gli artisti
             artists_id_central.update(media.get('artistid'))
             if media.get('albumartistid'):
@@ -872,8 +927,36 @@ def align_media_to_central_db(paths, local_paths, exec_mode, db_params):
 
         # Allineo i dati degli artisti col db centrale
         progress.create(addon_name, message='Allineo i dati artista')
-        central_artists_data = get_artists_data(artists_id_central, db_params, True, music_db_name)
-        local_artists_data = get_artists_data(artists_id_local, db_params, False, music_db_name)
+        fingerprint_store = None
+        if media_by_id:
+            # confronto prima le impronte: i dati completi li scarico solo per quanto cambiato dall'ultimo allineamento
+            fingerprint_store = fingerprints.get_fingerprint_store()
+            ((central_artist_fingerprints, central_album_fingerprints),
+             (local_artist_fingerprints, local_album_fingerprints)) = _run_central_and_local(
+                _fetch_fingerprints, (artists_id_central, albums_id_central), (artists_id_local, albums_id_local),
+                db_params, music_db_name)
+            central_artist_fingerprints_by_mbid = fingerprints.combine_by_mbid(central_artist_fingerprints)
+            unchanged_artists = fingerprint_store.get_unchanged('artist', central_artist_fingerprints_by_mbid,
+                                                                fingerprints.combine_by_mbid(local_artist_fingerprints))
+            artists_id_central = _without_unchanged(artists_id_central, central_artist_fingerprints, unchanged_artists)
+            artists_id_local = _without_unchanged(artists_id_local, local_artist_fingerprints, unchanged_artists)
+            central_album_fingerprints_by_mbid = fingerprints.combine_by_mbid(central_album_fingerprints)
+            unchanged_albums = fingerprint_store.get_unchanged('album', central_album_fingerprints_by_mbid,
+                                                               fingerprints.combine_by_mbid(local_album_fingerprints))
+            albums_id_central = _without_unchanged(albums_id_central, central_album_fingerprints, unchanged_albums)
+            albums_id_local = _without_unchanged(albums_id_local, local_album_fingerprints, unchanged_albums)
+            log(f'Impronte invariate: {len(unchanged_artists)} artisti, {len(unchanged_albums)} album')
+        # senza media gli id vuoti significano tutta la libreria, con i media invece non c'è nulla da scaricare
+        fetch_whole_library = not media_by_id
+        # col motore SQL le art dell'intera libreria non passano dai dizionari in memoria
+        use_sql_art_diff = fetch_whole_library and get_art_diff_engine() == 'sql'
+        albums_id_central = list(albums_id_central)
+        albums_id_local = list(albums_id_local)
+        # dati artista e art del centrale (rete) e del locale (disco) letti in parallelo
+        ((central_artists_data, central_album_arts, central_song_arts),
+         (local_artists_data, local_album_arts, local_song_arts)) = _run_central_and_local(
+            _fetch_align_data, (artists_id_central, albums_id_central), (artists_id_local, albums_id_local),
+            db_params, music_db_name, fetch_whole_library, fetch_whole_library and not use_sql_art_diff)
         central_artists_by_mbid = {artist.get('mbid'): artist for artist in central_artists_data}
         local_artists_by_mbid = {artist.get('mbid'): artist for artist in local_artists_data}
         artists_to_update = []
@@ -890,57 +973,48 @@ def align_media_to_central_db(paths, local_paths, exec_mode, db_params):
         update_artist_records(central_artists_by_mbid, local_artists_by_mbid, artists_to_update)
 
         progress.update(message='Allineo gli artwork')
-        central_album_arts = get_artworks_by_key(albums_id_central, 'album', db_params, True, music_db_name)
-        local_album_arts = get_artworks_by_key(albums_id_local, 'album', db_params, False, music_db_name)
-        central_song_arts = get_artworks_by_key(albums_id_central, 'song', db_params, True, music_db_name)
-        local_song_arts = get_artworks_by_key(albums_id_local, 'song', db_params, False, music_db_name)
 
         if media_by_id:
-            for media_id in media_by_id:
-                media = media_by_id.get(media_id)
-                if media and media.get('localalbumid'):
+            # album e brani in un solo passaggio sui media
+            for media_id, media in media_by_id.items():
+                if not media:
+                    continue
+                if media.get('localalbumid'):
                     central_album_art = central_album_arts.get((media.get('albumid'), media.get('musicbrainzalbumid')))
                     local_album_art = local_album_arts.get((media.get('localalbumid'), media.get('musicbrainzalbumid')))
                     _prepare_art_tuples_optimized(arts_to_insert, arts_to_remove, arts_to_update, central_album_art,
                                                   local_album_art,
                                                   media.get('localalbumid'), 'album')
-            for media_id in media_by_id:
-                media_details = media_by_id.get(media_id)
-                if media_details:
-                    id_song = media_id
-                    if media_details.get('type') == 'album' and media_details.get('songs'):
-                        for song in media_details.get('songs'):
-                            id_song = song.get('localsongid')
-                            central_key = (song.get('songid'), song.get('musicbrainzalbumid'), song.get('label'))
-                            local_key = (id_song, song.get('musicbrainzalbumid'), song.get('label'))
-                            central_song_art = central_song_arts.get(central_key)
-                            local_song_art = local_song_arts.get(local_key)
-                            _prepare_art_tuples_optimized(arts_to_insert, arts_to_remove, arts_to_update, central_song_art,
-                                                          local_song_art,
-                                                          id_song, 'song')
-                    else:
-                        central_key = (media_details.get('id'), media_details.get('musicbrainzalbumid'),
-                                       media_details.get('label'))
+                if media.get('type') == 'album' and media.get('songs'):
+                    for song in media.get('songs'):
+                        id_song = song.get('localsongid')
+                        central_key = (song.get('songid'), song.get('musicbrainzalbumid'), song.get('label'))
+                        local_key = (id_song, song.get('musicbrainzalbumid'), song.get('label'))
                         central_song_art = central_song_arts.get(central_key)
-                        local_key = (id_song, media_details.get('musicbrainzalbumid'), media_details.get('label'))
                         local_song_art = local_song_arts.get(local_key)
                         _prepare_art_tuples_optimized(arts_to_insert, arts_to_remove, arts_to_update, central_song_art,
                                                       local_song_art,
                                                       id_song, 'song')
-
-                    for central_mbid in central_artists_by_mbid.keys():
-                        central_artist_info = central_artists_by_mbid.get(central_mbid)
-                        local_artist_info = local_artists_by_mbid.get(central_mbid)
-                        if central_artist_info and local_artist_info:
-                            central_artist_art = {'thumb': central_artist_info.get('art_url')} if central_artist_info.get(
-                                'art_url') else None
-                            local_artist_art = {'thumb': local_artist_info.get('art_url')} if local_artist_info.get(
-                                'art_url') else None
-                            central_artist_info['id'] = local_artist_info.get('id')
-                            _prepare_art_tuples_optimized(arts_to_insert, arts_to_remove, arts_to_update,
-                                                          central_artist_art,
-                                                          local_artist_art,
-                                                          local_artist_info.get('id'), 'artist')
+                else:
+                    central_key = (media.get('id'), media.get('musicbrainzalbumid'), media.get('label'))
+                    central_song_art = central_song_arts.get(central_key)
+                    local_key = (media_id, media.get('musicbrainzalbumid'), media.get('label'))
+                    local_song_art = local_song_arts.get(local_key)
+                    _prepare_art_tuples_optimized(arts_to_insert, arts_to_remove, arts_to_update, central_song_art,
+                                                  local_song_art,
+                                                  media_id, 'song')
+
+            # l'art degli artisti non dipende dai media: la confronto una volta sola
+            artist_results = _process_artists(central_artists_by_mbid, local_artists_by_mbid)
+            arts_to_insert.update(artist_results['insert'])
+            arts_to_remove.update(artist_results['remove'])
+            arts_to_update.update(artist_results['update'])
+        elif use_sql_art_diff:
+            processed_arts = diff_library_arts_in_sql(db_params, music_db_name)
+            artist_results = _process_artists(central_artists_by_mbid, local_artists_by_mbid)
+            arts_to_insert = processed_arts.get('arts_to_insert') | artist_results['insert']
+            arts_to_remove = processed_arts.get('arts_to_remove') | artist_results['remove']
+            arts_to_update = processed_arts.get('arts_to_update') | artist_results['update']
         else:
             processed_arts = process_media_art_with_batching(db_params, music_db_name, central_album_arts, local_album_arts,
                                                              central_song_arts, local_song_arts, central_artists_by_mbid,
@@ -950,6 +1024,19 @@ def align_media_to_central_db(paths, local_paths, exec_mode, db_params):
             arts_to_update = processed_arts.get('arts_to_update')
 
         update_arts(list(arts_to_insert), list(arts_to_update), list(arts_to_remove))
+
+        if fingerprint_store:
+            # a scritture concluse salvo le impronte di quanto riallineato, quelle locali ricalcolate dopo le modifiche
+            fingerprint_store.save('artist', {mbid: fingerprint for mbid, fingerprint in
+                                              central_artist_fingerprints_by_mbid.items()
+                                              if mbid not in unchanged_artists},
+                                   fingerprints.combine_by_mbid(
+                                       get_artist_fingerprints(artists_id_local, False, db_params, music_db_name)))
+            fingerprint_store.save('album', {mbid: fingerprint for mbid, fingerprint in
+                                             central_album_fingerprints_by_mbid.items()
+                                             if mbid not in unchanged_albums},
+                                   fingerprints.combine_by_mbid(
+                                       get_album_fingerprints(albums_id_local, False, db_params, music_db_name)))
     finally:
         progress.close()
     compact_db()
@@ -984,6 +1071,133 @@ def _prepare_art_tuples_optimized(arts_to_insert, arts_to_remove, arts_to_update
                 arts_to_update.add((central_url, media_id, media_type, art_type))
 
 
+def get_art_diff_engine():
+    engine = db_scan.read_params().get('artdiff')
+    return engine[0] if engine else art_diff_engine
+
+
+def _album_media_rows(album_rows):
+    return (('album', mbid, id_album, '') for (id_album, mbid) in album_rows)
+
+
+def _song_media_rows(song_rows):
+    # i brani senza titolo o mbid restano fuori come in _get_songs_aggregated
+    return (('song', _create_song_key(title, album_mbid), id_song, title)
+            for (id_song, title, album_mbid) in song_rows if title and album_mbid)
+
+
+def diff_library_arts_in_sql(db_params, music_db_name):
+    """
+    Confronto delle art di album e brani dell'intera libreria fatto in SQL sul db locale, con lo stesso risultato
+    di process_media_art_with_batching. Album e brani di centrale e locale arrivano dalle query degli aggregati in
+    temp.central_media e temp.local_media: a parità di chiave (mbid dell'album o chiave del titolo) vince l'ultimo
+    come nei dizionari. Le art del centrale arrivano in streaming in temp.central_art per id del media centrale,
+    così quelle di due brani con la stessa chiave non si mescolano. Inserimenti, rimozioni e aggiornamenti escono
+    da tre query set-based, nello stesso formato del motore python.
+    """
+    central_art_query = '''
+                        SELECT art.media_type, art.media_id, art.type, art.url
+                        FROM art
+                        WHERE art.media_type IN ('album', 'song')'''
+    media_tables = '''
+                   CREATE TEMP TABLE %s
+                   (
+                       media_type TEXT,
+                       media_key  TEXT,
+                       media_id   INTEGER,
+                       title      TEXT,
+                       PRIMARY KEY (media_type, media_key)
+                   )'''
+    insert_media = 'INSERT OR REPLACE INTO temp.%s VALUES (?, ?, ?, ?)'
+    # come nel motore python le art del brano locale contano solo se il suo titolo è identico a quello del centrale
+    local_media_arts = '''
+                       FROM temp.central_media cm
+                                JOIN temp.local_media lm
+                                     ON lm.media_type = cm.media_type
+                                         AND lm.media_key = cm.media_key
+                                         AND lm.title = cm.title
+                                JOIN art a ON a.media_id = lm.media_id
+                           AND a.media_type = lm.media_type'''
+    music_db = db_scan.get_local_db(db_scan.get_music_db_path())
+    music_db_cursor = music_db.cursor()
+    local_cursor = music_db.cursor()
+    try:
+        for temp_table in ('central_art', 'central_media', 'local_media'):
+            music_db_cursor.execute(f'DROP TABLE IF EXISTS temp.{temp_table}')
+        music_db_cursor.execute(media_tables % 'central_media')
+        music_db_cursor.execute(media_tables % 'local_media')
+        music_db_cursor.execute('''
+                                CREATE TEMP TABLE central_art
+                                (
+                                    media_type TEXT,
+                                    media_id   INTEGER,
+                                    type       TEXT,
+                                    url        TEXT,
+                                    PRIMARY KEY (media_type, media_id, type)
+                                )''')
+
+        music_db_cursor.executemany(insert_media % 'central_media', _album_media_rows(
+            db_scan.stream_central_query(db_params, music_db_name, aggregated_album_query, as_tuples=True)))
+        music_db_cursor.executemany(insert_media % 'central_media', _song_media_rows(
+            db_scan.stream_central_query(db_params, music_db_name, aggregated_song_query, as_tuples=True)))
+        music_db_cursor.executemany('INSERT OR REPLACE INTO temp.central_art VALUES (?, ?, ?, ?)',
+                                    db_scan.stream_central_query(db_params, music_db_name, central_art_query,
+                                                                 as_tuples=True))
+        music_db_cursor.executemany(insert_media % 'local_media',
+                                    _album_media_rows(local_cursor.execute(aggregated_album_query)))
+        music_db_cursor.executemany(insert_media % 'local_media',
+                                    _song_media_rows(local_cursor.execute(aggregated_song_query)))
+
+        # art del centrale che mancano (o sono vuote) sul media locale
+        arts_to_insert = set(music_db_cursor.execute('''
+                                                     SELECT lm.media_id, cm.media_type, ca.type, ca.url
+                                                     FROM temp.central_media cm
+                                                              JOIN temp.local_media lm
+                                                                   ON lm.media_type = cm.media_type
+                                                                       AND lm.media_key = cm.media_key
+                                                              JOIN temp.central_art ca
+                                                                   ON ca.media_type = cm.media_type
+                                                                       AND ca.media_id = cm.media_id
+                                                     WHERE NOT EXISTS (SELECT 1
+                                                                       FROM art a
+                                                                       WHERE a.media_id = lm.media_id
+                                                                         AND a.media_type = lm.media_type
+                                                                         AND lm.title = cm.title
+                                                                         AND a.type = ca.type
+                                                                         AND a.url IS NOT NULL
+                                                                         AND a.url != '')'''))
+        # art locali di media presenti sul centrale dove quel tipo non c'è (o è vuoto)
+        arts_to_remove = set(music_db_cursor.execute(f'''
+                                                     SELECT lm.media_id, a.media_type, a.type
+                                                     {local_media_arts}
+                                                     WHERE NOT EXISTS (SELECT 1
+                                                                       FROM temp.central_art ca
+                                                                       WHERE ca.media_type = cm.media_type
+                                                                         AND ca.media_id = cm.media_id
+                                                                         AND ca.type = a.type
+                                                                         AND ca.url IS NOT NULL
+                                                                         AND ca.url != '')'''))
+        # art presenti su entrambi con url diverso
+        arts_to_update = set(music_db_cursor.execute(f'''
+                                                     SELECT ca.url, lm.media_id, a.media_type, a.type
+                                                     {local_media_arts}
+                                                              JOIN temp.central_art ca
+                                                                   ON ca.media_type = cm.media_type
+                                                                       AND ca.media_id = cm.media_id
+                                                                       AND ca.type = a.type
+                                                     WHERE ca.url IS NOT NULL
+                                                       AND ca.url != ''
+                                                       AND a.url IS NOT ca.url'''))
+    finally:
+        local_cursor.close()
+        for temp_table in ('central_art', 'central_media', 'local_media'):
+            music_db_cursor.execute(f'DROP TABLE IF EXISTS temp.{temp_table}')
+        music_db.commit()
+        music_db_cursor.close()
+
+    return {'arts_to_insert': arts_to_insert, 'arts_to_remove': arts_to_remove, 'arts_to_update': arts_to_update}
+
+
 def process_media_art_with_batching(db_params, music_db_name, central_album_arts, local_album_arts,
                                     central_song_arts, local_song_arts, central_artists_by_mbid, local_artists_by_mbid,
                                     batch_size=1759):
@@ -1010,7 +1224,8 @@ def process_media_art_with_batching(db_params, music_db_name, central_album_arts
 
         batch_results = _process_album_batch(batch, central_album_arts, local_album_arts)
 
-        log(batch_results)
+        log(f"Album: {len(batch_results['insert'])} art da inserire, {len(batch_results['remove'])} da rimuovere, "
+            f"{len(batch_results['update'])} da aggiornare")
 
         all_arts_to_insert.update(batch_results['insert'])
         all_arts_to_remove.update(batch_results['remove'])
@@ -1025,7 +1240,8 @@ def process_media_art_with_batching(db_params, music_db_name, central_album_arts
             batch, central_song_arts, local_song_arts
         )
 
-        log(batch_results)
+        log(f"Brani: {len(batch_results['insert'])} art da inserire, {len(batch_results['remove'])} da rimuovere, "
+            f"{len(batch_results['update'])} da aggiornare")
 
         all_arts_to_insert.update(batch_results['insert'])
         all_arts_to_remove.update(batch_results['remove'])
@@ -1052,11 +1268,7 @@ def _process_album_batch(album_batch, central_album_arts, local_album_arts):
     arts_to_remove = set()
     arts_to_update = set()
 
-    for album in album_batch:
-        album_id = album.get('id')
-        album_mbid = album.get('mbid')
-        local_id = album.get('localid')
-
+    for (album_id, local_id, album_mbid) in album_batch:
         central_key = (album_id, album_mbid)
         central_album_art = central_album_arts.get(central_key)
 
@@ -1079,15 +1291,10 @@ def _process_song_batch(song_batch, central_song_arts, local_song_arts):
     arts_to_remove = set()
     arts_to_update = set()
 
-    for song in song_batch:
-        local_id = song.get('localid')
+    for (song_id, local_id, title, album_mbid) in song_batch:
         if not local_id:
             continue
 
-        song_id = song.get('id')
-        album_mbid = song.get('album_mbid')
-        title = song.get('title')
-
         central_key = (song_id, album_mbid, title)
         local_key = (local_id, album_mbid, title)
         central_song_art = central_song_arts.get(central_key)
@@ -1,12 +1,12 @@
 import json
 import re
-import sqlite3
 from urllib.parse import quote, unquote
 
 import xbmc
 import xbmcaddon
 import xbmcgui
 import xbmcvfs
+import db_maintenance
 import db_scan
 
 
@@ -96,29 +96,25 @@ def get_files_thumbs(use_webdav):
             FROM ranked
             WHERE row_num = 1'''
     translated_path = db_scan.get_music_db_path()
-    music_db = sqlite3.connect(translated_path)
+    music_db = db_scan.get_local_db(translated_path)
     if use_webdav:
         music_db.create_function('decode', 1, decode_url, deterministic=True)
-    music_db.set_trace_callback(log)
     music_db_cursor = music_db.cursor()
     first_tracks_res = music_db_cursor.execute(query)
     results = first_tracks_res.fetchall()
     music_db_cursor.close()
-    music_db.close()
     file_thumbs = [encode_to_kodi_image_url(full_path, 'image://music@{0}/') for (full_path,) in results]
     return file_thumbs
 
 
 def get_arts():
     translated_path = db_scan.get_music_db_path()
-    music_db = sqlite3.connect(translated_path)
+    music_db = db_scan.get_local_db(translated_path)
     query = '''SELECT MEDIA_ID, MEDIA_TYPE, URL AS art_url FROM art WHERE TYPE LIKE 'thumb%' '''
-    music_db.set_trace_callback(log)
     music_db_cursor = music_db.cursor()
     arts_res = music_db_cursor.execute(query)
     results = arts_res.fetchall()
     music_db_cursor.close()
-    music_db.close()
 
     arts = [encode_to_kodi_image_url(art_url, 'image://{0}/') for (media_id, media_type, art_url) in results if art_url is not None]
     return arts
@@ -136,16 +132,10 @@ def remove_textures(id_textures):
     return json_result
 
 
-# una bella compattata al db non guasta dopo tutto questo smarmellaio
+# una bella compattata al db non guasta dopo tutto questo smarmellaio, ma solo quando serve davvero
 def compact_db():
-    db_path = db_scan.get_textures_db_path()
-    db = sqlite3.connect(db_path)
-    db.set_trace_callback(log)
-    db_cursor = db.cursor()
-    query = '''VACUUM'''
-    db_cursor.execute(query)
-    db_cursor.close()
-    db.close()
+    options = db_maintenance.get_maintenance_options(db_scan.get_db_params())
+    return db_maintenance.maintain_db(db_scan.get_textures_db_path(), **options)
 
 
 def clean_texture_cache():
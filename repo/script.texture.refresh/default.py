@@ -64,15 +64,10 @@ def execute_addon_with_builtin(addon_id, params=None):
 
 
 def remove_textures(id_textures):
-    textures_requests = []
-    for (id_rpc, id_texture) in enumerate(id_textures, 1):
-        json_texture_remove_payload = {"jsonrpc": "2.0", "method": "Textures.RemoveTexture", "id": id_rpc,
-                                       "params": {"textureid": id_texture}}
-        if json_texture_remove_payload not in textures_requests:
-            textures_requests.append(json_texture_remove_payload)
-    splitted_requests = db_scan.split_json(textures_requests)
-    for splitted_request in splitted_requests:
-        xbmc.executeJSONRPC(json.dumps(splitted_request))
+    textures_requests = ({"jsonrpc": "2.0", "method": "Textures.RemoveTexture", "id": id_rpc,
+                          "params": {"textureid": id_texture}} for (id_rpc, id_texture) in enumerate(id_textures, 1))
+    for batch_payload in db_scan.build_json_rpc_batches(textures_requests):
+        xbmc.executeJSONRPC(batch_payload)
 
 
 def get_textures():
@@ -288,28 +283,6 @@ def get_albums_by_ids(id_albums):
     return albums
 
 
-def get_id_albums_by_paths(id_albums, scanned_path):
-    get_directory_payload = {
-        "jsonrpc": "2.0",
-        "method": "Files.GetDirectory",
-        "id": "1",
-        "params": {
-            "directory": scanned_path,
-            "media": "music",
-            "properties": [
-                "albumid"
-            ]
-        }
-    }
-    json_result = json.loads(xbmc.executeJSONRPC(json.dumps(get_directory_payload, ensure_ascii=False))).get('result')
-    if json_result:
-        for file in json_result.get('files'):
-            if file.get('albumid') and file.get('albumid') not in id_albums:
-                id_albums.append(file.get('albumid'))
-            elif file.get('type') == 'unknown' and file.get('filetype') == 'directory':
-                get_id_albums_by_paths(id_albums, file.get('file'))
-
-
 def build_entity_map(textures, id_albums_added):
     entities_by_type = {}
     id_artists = set()
@@ -398,9 +371,7 @@ def get_labels_to_refresh(recently_added_albums):
 
 def refresh_textures(paths, exec_mode, paths_from_params):
     textures = get_textures()
-    id_albums = []
-    for added_path in paths:
-        get_id_albums_by_paths(id_albums, added_path)
+    id_albums = db_scan.get_id_albums_by_paths(paths)
     entities_by_type = build_entity_map(textures, id_albums)
     file_views_textures_to_refresh = get_thumbs_to_refresh_by_id_album(id_albums, textures)
 
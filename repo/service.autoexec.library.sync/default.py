@@ -1,10 +1,12 @@
+import hashlib
 import json
 import os.path
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from decimal import Decimal
 
 import db_scan
-import pymysql
 import requests
 import xbmc
 import xbmcaddon
@@ -12,6 +14,211 @@ import xbmcgui
 import xbmcvfs
 
 addon_name = xbmcaddon.Addon().getAddonInfo('name')
+# percorsi con brani di un solo album: il raggruppamento per idPath, limitato ai percorsi degli album richiesti,
+# è calcolato una volta sola e unito ai brani invece di contare gli album con una subquery correlata per ogni riga.
+# Un percorso con un solo album contiene soltanto brani di quell'album, quindi non serve filtrare di nuovo gli id
+album_paths_query = '''
+            SELECT DISTINCT song.idAlbum,
+                            strPath,
+                            song.idPath
+            FROM (SELECT idPath
+                  FROM song
+                  WHERE idPath IN (SELECT idPath FROM song WHERE idAlbum IN (%s))
+                  GROUP BY idPath
+                  HAVING COUNT(DISTINCT idAlbum) = 1) AS single_album_path
+                     JOIN song ON song.idPath = single_album_path.idPath
+                     JOIN path ON song.idPath = path.idPath
+            ORDER BY strPath ASC'''
+watermark_file_name = 'sync_watermark.json'
+watermark_date_format = '%Y-%m-%d %H:%M:%S'
+# ore tra due riallineamenti completi, sovrascrivibili con fullreconcilehours in centralsettings.json
+full_reconcile_interval_hours = 24
+# dimensione e data di modifica delle playlist centrali all'ultima copia riuscita
+playlist_manifest_file_name = 'playlists_manifest.json'
+playlist_copy_workers = 4
+# confronto completo delle librerie: 'paths' confronta i percorsi di tutti gli album, 'digest' scambia un'impronta
+# per ogni bucket di mbid e scende nel dettaglio solo dove le impronte differiscono (reconcilemode in centralsettings)
+default_reconcile_mode = 'paths'
+# fino a questo numero di album i bucket sono i primi 2 caratteri esadecimali dell'MD5 dell'mbid (256), poi 3 (4096)
+digest_small_library_albums = 30000
+# coppie distinte (mbid, percorso) degli album, limitate ai percorsi con un solo album come in album_paths_query
+album_path_pairs_query = '''
+            SELECT DISTINCT COALESCE(album.strMusicBrainzAlbumID, '') AS mbid,
+                            path.strPath
+            FROM (SELECT idPath
+                  FROM song
+                  GROUP BY idPath
+                  HAVING COUNT(DISTINCT idAlbum) = 1) AS single_album_path
+                     JOIN song ON song.idPath = single_album_path.idPath
+                     JOIN album ON album.idAlbum = song.idAlbum
+                     JOIN path ON path.idPath = song.idPath'''
+# riepilogo della libreria: la stessa query sul db locale e, dentro l'istantanea, sul centrale
+library_summary_query = '''
+            SELECT COUNT(*)                       AS albums,
+                   MAX(idAlbum)                   AS maxIdAlbum,
+                   SUM(idAlbum)                   AS albumIdsSum,
+                   MAX(dateAdded)                 AS maxDateAdded,
+                   MAX(lastScraped)               AS maxLastScraped,
+                   (SELECT COUNT(*) FROM path)    AS paths,
+                   (SELECT MAX(idPath) FROM path) AS maxIdPath,
+                   (SELECT SUM(idPath) FROM path) AS pathIdsSum
+            FROM album'''
+library_summary_columns = ('albums', 'maxIdAlbum', 'albumIdsSum', 'maxDateAdded', 'maxLastScraped', 'paths',
+                           'maxIdPath', 'pathIdsSum')
+# album e percorsi aggiunti sul centrale dopo gli id massimi del watermark, con la somma dei loro id
+central_growth_query = '''
+            SELECT (SELECT COUNT(*) FROM album WHERE idAlbum > %s)                  AS albums,
+                   (SELECT COALESCE(SUM(idAlbum), 0) FROM album WHERE idAlbum > %s) AS albumIdsSum,
+                   (SELECT COUNT(*) FROM path WHERE idPath > %s)                    AS paths,
+                   (SELECT COALESCE(SUM(idPath), 0) FROM path WHERE idPath > %s)    AS pathIdsSum'''
+central_growth_columns = ('albums', 'albumIdsSum', 'paths', 'pathIdsSum')
+# istantanea del centrale: riepilogo, album, percorsi e percorsi degli album arrivano con un'unica richiesta
+# multi-statement. Le tabelle intere solo per il confronto completo, altrimenti le righe dopo il watermark
+snapshot_paths_query = 'SELECT idPath, strPath FROM path'
+snapshot_albums_query = 'SELECT idAlbum, strMusicBrainzAlbumID, dateAdded, lastScraped FROM album'
+known_paths_query = 'SELECT strPath FROM path WHERE strPath IN (%s)'
+
+
+class CentralSnapshot:
+    """
+    Istantanea del db centrale letta con un'unica richiesta multi-statement. Riepilogo e crescita dopo il watermark
+    sono aggregati calcolati dal MariaDB. Senza watermark, quando serve il confronto completo, arrivano tutti i
+    percorsi e tutti gli album; con il watermark solo gli album nella finestra di sincronizzazione o cambiati dopo il
+    watermark e i percorsi nuovi. Arrivano anche i percorsi degli album caricati (di tutti con all_album_paths).
+    Le differenze della sincronizzazione vengono calcolate da qui in memoria.
+    """
+
+    def __init__(self, db_params, music_db_name, sync_window=None, central_watermark=None, all_album_paths=False):
+        self.db_params = db_params
+        self.music_db_name = music_db_name
+        self.sync_window = sync_window
+        self.central_watermark = central_watermark
+        self.is_full = central_watermark is None
+        # i percorsi di tutti gli album servono solo al confronto completo
+        self.all_album_paths = all_album_paths and self.is_full
+        queries = [library_summary_query]
+        args = []
+        if self.is_full:
+            queries.extend([snapshot_paths_query, snapshot_albums_query])
+            if self.all_album_paths:
+                queries.append(album_paths_query % 'SELECT idAlbum FROM album')
+            elif sync_window:
+                queries.append(album_paths_query % 'SELECT idAlbum FROM album WHERE dateAdded BETWEEN %s AND %s')
+                args.extend(sync_window)
+        else:
+            album_args = list(self._watermark_bounds())
+            max_id_album = album_args[0]
+            max_id_path = central_watermark.get('maxIdPath') or 0
+            conditions = ['idAlbum > %s OR dateAdded > %s OR lastScraped > %s']
+            if sync_window:
+                conditions.append('dateAdded BETWEEN %s AND %s')
+                album_args.extend(sync_window)
+            album_condition = ' OR '.join(f'({condition})' for condition in conditions)
+            queries.extend([central_growth_query, f'{snapshot_paths_query} WHERE idPath > %s',
+                            f'{snapshot_albums_query} WHERE {album_condition}',
+                            album_paths_query % f'SELECT idAlbum FROM album WHERE {album_condition}'])
+            args.extend([max_id_album, max_id_album, max_id_path, max_id_path, max_id_path, *album_args, *album_args])
+        result_sets = db_scan.fetch_central_result_sets(db_params, music_db_name, queries, tuple(args) or None,
+                                                        as_tuples=True)
+        self.summary = {key: _summary_value(value) for key, value in zip(library_summary_columns, result_sets[0][0])}
+        result_sets = result_sets[1:]
+        self.growth = None
+        if not self.is_full:
+            self.growth = {key: _summary_value(value) for key, value in zip(central_growth_columns, result_sets[0][0])}
+            result_sets = result_sets[1:]
+        # percorsi noti sul centrale: tutti nel confronto completo, altrimenti quelli nuovi più quelli già cercati
+        self.central_paths = {path for (id_path, path) in result_sets[0]}
+        self.missing_paths = set()
+        # (idAlbum, mbid, dateAdded, lastScraped) con le date come stringhe, come nel db locale
+        self.albums = [(id_album, mbid, _summary_value(date_added), _summary_value(last_scraped))
+                       for (id_album, mbid, date_added, last_scraped) in result_sets[1]]
+        if self.all_album_paths:
+            self.loaded_album_ids = None
+        else:
+            self.loaded_album_ids = {album[0] for album in self.albums
+                                     if self.is_in_sync_window(album) or self.is_after_watermark(album)}
+        self.album_paths = {}
+        if len(result_sets) > 2:
+            self._add_album_paths(result_sets[2])
+        log(f'Istantanea del centrale{" completa" if self.is_full else ""}: {len(self.central_paths)} percorsi, '
+            f'{len(self.albums)} album, percorsi di {len(self.album_paths)} album')
+
+    def _watermark_bounds(self):
+        return (self.central_watermark.get('maxIdAlbum') or 0, self.central_watermark.get('maxDateAdded') or '',
+                self.central_watermark.get('maxLastScraped') or '')
+
+    def _add_album_paths(self, rows):
+        for (id_album, path, id_path) in rows:
+            self.album_paths.setdefault(id_album, []).append(path)
+            # i percorsi degli album vengono dalla tabella path del centrale
+            self.central_paths.add(path)
+
+    def is_in_sync_window(self, album):
+        if not self.sync_window or not album[2]:
+            return False
+        (from_date, to_date) = self.sync_window
+        return from_date <= album[2] <= to_date
+
+    def is_after_watermark(self, album):
+        if self.central_watermark is None:
+            return False
+        (max_id_album, max_date_added, max_last_scraped) = self._watermark_bounds()
+        # come in SQL, le date NULL non superano mai il watermark
+        return (album[0] > max_id_album or (album[2] is not None and album[2] > max_date_added)
+                or (album[3] is not None and album[3] > max_last_scraped))
+
+    def get_album_paths(self, id_albums=None):
+        """
+        Coppie (idAlbum, percorso) degli album indicati (di tutti con None). I percorsi che non sono
+        nell'istantanea vengono letti dal centrale con un'altra richiesta multi-statement.
+        """
+        if id_albums is None:
+            if not self.all_album_paths:
+                (rows,) = db_scan.fetch_central_result_sets(self.db_params, self.music_db_name,
+                                                            [album_paths_query % 'SELECT idAlbum FROM album'],
+                                                            as_tuples=True)
+                self.album_paths = {}
+                self._add_album_paths(rows)
+                self.all_album_paths = True
+                self.loaded_album_ids = None
+            id_albums = self.album_paths.keys()
+        elif self.loaded_album_ids is not None:
+            missing = list(dict.fromkeys(id_album for id_album in id_albums
+                                         if id_album not in self.loaded_album_ids))
+            if missing:
+                chunks = [missing[i:i + 1000] for i in range(0, len(missing), 1000)]
+                queries = [album_paths_query % ','.join(['%s'] * len(chunk)) for chunk in chunks]
+                for rows in db_scan.fetch_central_result_sets(self.db_params, self.music_db_name, queries,
+                                                              tuple(missing), as_tuples=True):
+                    self._add_album_paths(rows)
+                self.loaded_album_ids.update(missing)
+        return [(id_album, path) for id_album in id_albums for path in self.album_paths.get(id_album, [])]
+
+    def get_known_paths(self, paths):
+        """
+        I percorsi indicati che esistono sul centrale. Nel confronto completo ci sono già tutti, altrimenti quelli
+        mai visti vengono cercati con un'unica richiesta multi-statement e il risultato resta in memoria.
+        """
+        if not self.is_full:
+            unknown = [path for path in dict.fromkeys(paths)
+                       if path not in self.central_paths and path not in self.missing_paths]
+            if unknown:
+                chunks = [unknown[i:i + 1000] for i in range(0, len(unknown), 1000)]
+                queries = [known_paths_query % ','.join(['%s'] * len(chunk)) for chunk in chunks]
+                for rows in db_scan.fetch_central_result_sets(self.db_params, self.music_db_name, queries,
+                                                              tuple(unknown), as_tuples=True):
+                    self.central_paths.update(path for (path,) in rows)
+                # il confronto resta esatto anche se la collation del centrale ignora maiuscole e minuscole
+                self.missing_paths.update(path for path in unknown if path not in self.central_paths)
+        return {path for path in paths if path in self.central_paths}
+
+    def get_summary(self):
+        """Lo stesso riepilogo di get_local_library_summary, calcolato dal centrale"""
+        return self.summary
+
+    def get_growth(self):
+        """Album e percorsi aggiunti sul centrale dopo il watermark, con la somma dei loro id"""
+        return self.growth
 
 
 class ScanMonitor(xbmc.Monitor):
@@ -44,7 +251,11 @@ def get_central_playlists(smb_path, db_params):
         "method": "Files.GetDirectory",
         "id": "1",
         "params": {
-            "directory": smb_path
+            "directory": smb_path,
+            "properties": [
+                "size",
+                "lastmodified"
+            ]
         }
     }
     return db_scan.execute_from_central_kodi_webserver(db_params, json_get_directory_payload).get('result')
@@ -73,78 +284,99 @@ def get_properties(call_central, db_params):
     return props
 
 
-def get_central_paths(db_params, music_db_name):
-    query = 'SELECT strPath FROM path'
-    query_results = []
-    host = db_params.get('host')
-    username = db_params.get('user')
-    password = db_params.get('pass')
-    central_db = pymysql.connect(host=host, user=username, password=password, database=music_db_name, port=3306,
-                                 cursorclass=pymysql.cursors.DictCursor, connect_timeout=18000)
-    with central_db:
-        with central_db.cursor() as central_cursor:
-            central_cursor.execute(query)
-            log(central_cursor.mogrify(query))
-            query_results.extend(central_cursor.fetchall())
-    paths = {result['strPath'] for result in query_results}
-    return paths
+def get_central_album_infos(snapshot, albums, db_params, sources):
+    """Album del centrale con i loro percorsi, calcolati dall'istantanea"""
+    paths_by_id_album = build_album_path_by_id(snapshot.get_album_paths([album[0] for album in albums]), True,
+                                               db_params, sources, snapshot)
+    return [{'mbid': album[1], 'path': paths_by_id_album.get(album[0])} for album in albums]
 
 
-def get_album_infos(use_central, db_params, music_db_name, sources, central_paths):
+def get_local_album_infos(db_params, sources, snapshot):
     music_db_path = db_scan.get_music_db_path()
     album_infos = []
     query = '''SELECT idAlbum, strMusicBrainzAlbumID
                FROM album'''
-    query_results = []
-    if use_central:
-        host = db_params.get('host')
-        username = db_params.get('user')
-        password = db_params.get('pass')
-        central_db = pymysql.connect(host=host, user=username, password=password, database=music_db_name, port=3306,
-                                     cursorclass=pymysql.cursors.DictCursor, connect_timeout=18000)
-        with central_db:
-            with central_db.cursor() as central_cursor:
-                central_cursor.execute(query)
-                log(central_cursor.mogrify(query))
-                query_results.extend(central_cursor.fetchall())
-    else:
-        music_db = sqlite3.connect(music_db_path)
-        music_db.row_factory = sqlite3.Row
-        music_db.set_trace_callback(log)
-        music_db_cursor = music_db.cursor()
-        music_db_cursor.execute(query)
-        query_results.extend(music_db_cursor.fetchall())
-        music_db_cursor.close()
-        music_db.close()
-    if query_results:
-        paths_by_id_album = get_album_path_by_id(list(), use_central, db_params, music_db_name, True,
-                                                 sources, central_paths)
-        for result in query_results:
-            album_info = {'mbid': result['strMusicBrainzAlbumID'], 'path': paths_by_id_album.get(result['idAlbum'])}
-            album_infos.append(album_info)
+    music_db = db_scan.get_local_db(music_db_path)
+    music_db_cursor = music_db.cursor()
+    music_db_cursor.row_factory = sqlite3.Row
+    paths_by_id_album = None
+    for result in music_db_cursor.execute(query):
+        if paths_by_id_album is None:
+            paths_by_id_album = get_local_album_path_by_id(list(), db_params, True, sources, snapshot)
+        album_info = {'mbid': result['strMusicBrainzAlbumID'], 'path': paths_by_id_album.get(result['idAlbum'])}
+        album_infos.append(album_info)
+    music_db_cursor.close()
     return album_infos
 
 
+def get_playlist_signature(playlist):
+    # senza dimensione o data di modifica la playlist viene sempre copiata
+    if playlist.get('size') is None or not playlist.get('lastmodified'):
+        return None
+    return {'size': playlist.get('size'), 'lastmodified': playlist.get('lastmodified')}
+
+
+def is_playlist_changed(playlist, manifest, local_playlists, playlist_path):
+    label = playlist.get('label')
+    signature = get_playlist_signature(playlist)
+    if not signature or manifest.get(label) != signature or label not in local_playlists:
+        return True
+    # una playlist modificata in locale non ha più la dimensione di quella centrale
+    return xbmcvfs.Stat(os.path.join(playlist_path, label)).st_size() != signature.get('size')
+
+
 def sync_playlists_to_central_path(playlist_source, db_params):
     playlists_response = get_central_playlists(playlist_source, db_params)
     if playlists_response and playlists_response.get('files'):
-        central_playlists = [playlist.get('label') for playlist in playlists_response.get('files')]
+        central_playlists = {playlist.get('label'): playlist for playlist in playlists_response.get('files')}
         playlist_path = xbmcvfs.translatePath('special://profile/playlists/music/')
         use_webdav = db_params.get('sourcetype') == 'webdav'
-        local_playlists = xbmcvfs.listdir('special://profile/playlists/music/')[1]
-        for playlist in playlists_response.get('files'):
+        local_playlists = set(xbmcvfs.listdir('special://profile/playlists/music/')[1])
+        manifest = load_profile_json(playlist_manifest_file_name) or {}
+        playlists_to_copy = [playlist for playlist in central_playlists.values()
+                             if is_playlist_changed(playlist, manifest, local_playlists, playlist_path)]
+        playlists_to_delete = [local_playlist for local_playlist in local_playlists
+                               if local_playlist not in central_playlists]
+
+        def copy_playlist(playlist):
             central_playlist_path = db_scan.convert_from_smb_to_davs(
                 playlist.get('file')) if use_webdav else playlist.get('file')
             local_path = os.path.join(playlist_path, playlist.get('label'))
-            xbmcvfs.copy(central_playlist_path, local_path)
-        for local_playlist in local_playlists:
-            if local_playlist not in central_playlists:
-                xbmcvfs.delete(f'special://profile/playlists/music/{local_playlist}')
+            return xbmcvfs.copy(central_playlist_path, local_path)
+
+        def delete_playlist(local_playlist):
+            return xbmcvfs.delete(f'special://profile/playlists/music/{local_playlist}')
+
+        # le copie su samba/webDAV sono dominate dalla latenza: poche alla volta in parallelo, poi le cancellazioni
+        with ThreadPoolExecutor(max_workers=playlist_copy_workers) as executor:
+            copied = list(executor.map(copy_playlist, playlists_to_copy))
+            list(executor.map(delete_playlist, playlists_to_delete))
+        updated_manifest = {label: signature for label, signature in manifest.items()
+                            if label in central_playlists}
+        for (playlist, is_copied) in zip(playlists_to_copy, copied):
+            if is_copied:
+                updated_manifest[playlist.get('label')] = get_playlist_signature(playlist)
+            else:
+                updated_manifest.pop(playlist.get('label'), None)
+        save_profile_json(playlist_manifest_file_name, updated_manifest)
+        log(f'Playlist copiate: {copied.count(True)} su {len(central_playlists)}, rimosse: {len(playlists_to_delete)}')
+
+
+def get_reconcile_mode(db_params):
+    return db_params.get('reconcilemode') or default_reconcile_mode
+
 
+def get_releases_to_align(db_params, music_db_name, sources, snapshot):
+    if get_reconcile_mode(db_params) == 'digest':
+        return get_releases_to_align_by_digest(db_params, music_db_name, sources, snapshot)
+    # None: i percorsi di tutti gli album, già nell'istantanea se il confronto completo era previsto
+    paths_by_id_album = build_album_path_by_id(snapshot.get_album_paths(), True, db_params, sources, snapshot)
+    central_albums = [{'mbid': album[1], 'path': paths_by_id_album.get(album[0])} for album in snapshot.albums]
+    local_albums = get_local_album_infos(db_params, sources, snapshot)
+    return diff_album_paths(central_albums, local_albums)
 
-def get_releases_to_align(db_params, music_db_name, sources, central_paths):
-    central_albums = get_album_infos(True, db_params, music_db_name, sources, central_paths)
-    local_albums = get_album_infos(False, db_params, music_db_name, sources, central_paths)
+
+def diff_album_paths(central_albums, local_albums):
     # Crea dizionari con mbid come chiave e set di path come valore
     central_dict = {}
     for album in central_albums:
@@ -190,6 +422,206 @@ def get_releases_to_align(db_params, music_db_name, sources, central_paths):
     return paths_to_scan
 
 
+def mbid_bucket(mbid, prefix_length):
+    return hashlib.md5(mbid.encode('utf-8')).hexdigest()[:prefix_length]
+
+
+def album_path_digest(mbid, path):
+    # 15 caratteri esadecimali: l'intero sta in un BIGINT con segno anche su SQLite
+    return int(hashlib.md5(f'{mbid}\x1f{path}'.encode('utf-8')).hexdigest()[:15], 16)
+
+
+def get_bucket_prefix_length():
+    music_db = db_scan.get_local_db(db_scan.get_music_db_path())
+    (albums,) = music_db.execute('SELECT COUNT(*) FROM album').fetchone()
+    return 2 if albums <= digest_small_library_albums else 3
+
+
+def get_central_bucket_digests(db_params, music_db_name, prefix_length):
+    """Impronte per bucket calcolate dal MariaDB centrale: numero di coppie (mbid, percorso) e XOR dei loro hash"""
+    query = f'''
+            SELECT LEFT(MD5(album_path.mbid), %s)                                                      AS bucket,
+                   COUNT(*)                                                                           AS pairs,
+                   BIT_XOR(CAST(CONV(LEFT(MD5(CONCAT(album_path.mbid, CHAR(31), album_path.strPath)), 15), 16, 10)
+                       AS UNSIGNED))                                                                  AS digest
+            FROM ({album_path_pairs_query}) AS album_path
+            GROUP BY bucket'''
+    with db_scan.central_db_connection(db_params, music_db_name) as central_db:
+        with central_db.cursor() as central_cursor:
+            central_cursor.execute(query, (prefix_length,))
+            log(central_cursor.mogrify(query, (prefix_length,)))
+            results = central_cursor.fetchall()
+    return {result.get('bucket'): (result.get('pairs'), int(result.get('digest'))) for result in results}
+
+
+def get_local_bucket_digests(db_params, prefix_length):
+    """Le stesse impronte di get_central_bucket_digests sul db locale, con i percorsi webDAV riportati a samba"""
+    use_webdav = db_params.get('sourcetype') == 'webdav'
+    path_translator = db_scan.get_path_translator(db_params)
+    music_db = db_scan.get_local_db(db_scan.get_music_db_path())
+    digests = {}
+    for (mbid, path) in music_db.execute(album_path_pairs_query):
+        if use_webdav:
+            path = path_translator.to_smb(path)
+        bucket = mbid_bucket(mbid, prefix_length)
+        (pairs, digest) = digests.get(bucket, (0, 0))
+        digests[bucket] = (pairs + 1, digest ^ album_path_digest(mbid, path))
+    return digests
+
+
+def get_bucket_album_infos(use_central, buckets, prefix_length, db_params, sources, snapshot):
+    """Album con percorsi, come get_local_album_infos, limitati agli mbid dei bucket indicati"""
+    bucket_set = set(buckets)
+    if use_central:
+        # gli album sono già nell'istantanea: il centrale restituisce solo i percorsi mancanti
+        albums = [album for album in snapshot.albums if mbid_bucket(album[1] or '', prefix_length) in bucket_set]
+        return get_central_album_infos(snapshot, albums, db_params, sources) if albums else []
+    music_db = db_scan.get_local_db(db_scan.get_music_db_path())
+    results = [(id_album, mbid) for (id_album, mbid) in
+               music_db.execute('SELECT idAlbum, strMusicBrainzAlbumID FROM album')
+               if mbid_bucket(mbid or '', prefix_length) in bucket_set]
+    if not results:
+        return []
+    paths_by_id_album = get_local_album_path_by_id([id_album for (id_album, mbid) in results], db_params, False,
+                                                   sources, snapshot)
+    return [{'mbid': mbid, 'path': paths_by_id_album.get(id_album)} for (id_album, mbid) in results]
+
+
+def get_releases_to_align_by_digest(db_params, music_db_name, sources, snapshot):
+    """
+    Confronto completo per impronte: il centrale restituisce un'impronta per bucket calcolata dal MariaDB,
+    solo gli album dei bucket con impronta diversa vengono letti e confrontati come in get_releases_to_align
+    """
+    prefix_length = get_bucket_prefix_length()
+    central_digests = get_central_bucket_digests(db_params, music_db_name, prefix_length)
+    local_digests = get_local_bucket_digests(db_params, prefix_length)
+    buckets = sorted(bucket for bucket in central_digests.keys() | local_digests.keys()
+                     if central_digests.get(bucket) != local_digests.get(bucket))
+    log(f'Bucket con impronta diversa: {len(buckets)} su {len(central_digests)} {buckets}')
+    if not buckets:
+        return []
+    central_albums = get_bucket_album_infos(True, buckets, prefix_length, db_params, sources, snapshot)
+    local_albums = get_bucket_album_infos(False, buckets, prefix_length, db_params, sources, snapshot)
+    return diff_album_paths(central_albums, local_albums)
+
+
+def get_delta_releases_to_align(db_params, sources, snapshot):
+    """Come get_releases_to_align, ma solo per gli album aggiunti, riscansionati o aggiornati dopo il watermark"""
+    central_results = [album for album in snapshot.albums if snapshot.is_after_watermark(album)]
+    if not central_results:
+        return []
+    central_albums = get_central_album_infos(snapshot, central_results, db_params, sources)
+    mbids = list({album.get('mbid') for album in central_albums if album.get('mbid')})
+    local_results = []
+    music_db = db_scan.get_local_db(db_scan.get_music_db_path())
+    music_db_cursor = music_db.cursor()
+    music_db_cursor.row_factory = sqlite3.Row
+    chunks = [mbids[i:i + 999] for i in range(0, len(mbids), 999)]
+    for chunk in chunks:
+        placeholders = ','.join(['?'] * len(chunk))
+        music_db_cursor.execute(f'SELECT idAlbum, strMusicBrainzAlbumID FROM album '
+                                f'WHERE strMusicBrainzAlbumID IN ({placeholders})', chunk)
+        local_results.extend(music_db_cursor.fetchall())
+    music_db_cursor.close()
+    local_albums = []
+    if local_results:
+        paths_by_id_album = get_local_album_path_by_id([result['idAlbum'] for result in local_results], db_params,
+                                                       False, sources, snapshot)
+        local_albums = [{'mbid': result['strMusicBrainzAlbumID'], 'path': paths_by_id_album.get(result['idAlbum'])}
+                        for result in local_results]
+    log(f'Album da verificare dopo il watermark: {len(central_albums)} sul centrale, {len(local_albums)} in locale')
+    return diff_album_paths(central_albums, local_albums)
+
+
+def _summary_value(value):
+    # su MariaDB SUM restituisce un Decimal e le date possono arrivare come datetime
+    if isinstance(value, Decimal):
+        return int(value)
+    if isinstance(value, datetime):
+        return value.strftime(watermark_date_format)
+    return value
+
+
+def get_local_library_summary():
+    """Conteggi, massimi e somme degli id di album e percorsi: bastano a capire se la libreria ha perso qualcosa"""
+    music_db = db_scan.get_local_db(db_scan.get_music_db_path())
+    music_db_cursor = music_db.cursor()
+    music_db_cursor.row_factory = sqlite3.Row
+    summary = dict(music_db_cursor.execute(library_summary_query).fetchone())
+    music_db_cursor.close()
+    return {key: _summary_value(value) for key, value in summary.items()}
+
+
+def get_full_reconcile_interval(db_params):
+    try:
+        return timedelta(hours=float(db_params.get('fullreconcilehours') or full_reconcile_interval_hours))
+    except ValueError:
+        log(f'fullreconcilehours non valido: {db_params.get("fullreconcilehours")}')
+        return timedelta(hours=full_reconcile_interval_hours)
+
+
+def get_local_reconcile_reason(watermark, db_params, music_db_name):
+    """Motivo per cui serve il confronto completo delle librerie noto prima di leggere il centrale, altrimenti None"""
+    if not watermark:
+        return 'nessun watermark salvato'
+    if watermark.get('host') != db_params.get('host') or watermark.get('musicDb') != music_db_name:
+        return 'il watermark si riferisce a un altro db centrale'
+    last_full_reconcile = watermark.get('lastFullReconcile')
+    if not last_full_reconcile or datetime.now() - datetime.strptime(
+            last_full_reconcile, watermark_date_format) >= get_full_reconcile_interval(db_params):
+        return 'cadenza del riallineamento completo'
+    if get_local_library_summary() != watermark.get('local'):
+        return "libreria locale modificata dopo l'ultima sincronizzazione"
+    return None
+
+
+def get_central_reconcile_reason(central_watermark, snapshot):
+    """Motivo per cui l'istantanea del centrale richiede il confronto completo, None se bastano le differenze"""
+    # se sul centrale ci sono state solo aggiunte, conteggi e somme attuali sono quelli salvati più gli id nuovi;
+    # album o percorsi rimossi o rinumerati rompono l'uguaglianza
+    central_summary = snapshot.get_summary()
+    growth = snapshot.get_growth()
+    for key in ('albums', 'albumIdsSum', 'paths', 'pathIdsSum'):
+        if (central_watermark.get(key) or 0) + growth.get(key) != (central_summary.get(key) or 0):
+            return f'checksum del centrale non coerente con le sole aggiunte ({key})'
+    return None
+
+
+def get_profile_file_path(file_name):
+    profile_path = xbmcvfs.translatePath(xbmcaddon.Addon().getAddonInfo('profile'))
+    if not xbmcvfs.exists(profile_path):
+        xbmcvfs.mkdirs(profile_path)
+    return os.path.join(profile_path, file_name)
+
+
+def load_profile_json(file_name):
+    file_path = get_profile_file_path(file_name)
+    if not xbmcvfs.exists(file_path):
+        return None
+    try:
+        with xbmcvfs.File(file_path) as f:
+            return json.load(f)
+    except ValueError as e:
+        log(f'{file_name} illeggibile: {e}')
+        return None
+
+
+def save_profile_json(file_name, content):
+    with xbmcvfs.File(get_profile_file_path(file_name), 'w') as f:
+        f.write(json.dumps(content, indent=2))
+
+
+def load_watermark():
+    return load_profile_json(watermark_file_name)
+
+
+def save_watermark(watermark):
+    """Salva il watermark a sincronizzazione conclusa, con il riepilogo della libreria locale già riallineata"""
+    watermark['local'] = get_local_library_summary()
+    save_profile_json(watermark_file_name, watermark)
+    log(f'Watermark di sincronizzazione salvato: {watermark}')
+
+
 def check_for_scans(db_params):
     table = db_params.get('table')
     url = f'{db_params.get('scanserver')}/scans/{table}/status'
@@ -216,15 +648,18 @@ def get_sources(db_params):
     response = json.loads(get_sources_req)
     if response.get('result'):
         sources = response.get('result').get('sources')
-    return {db_scan.convert_from_davs_to_smb(source.get('file')) if use_webdav else source.get('file') for source in
-            sources}
+    source_paths = [source.get('file') for source in sources]
+    if use_webdav:
+        source_paths = db_scan.get_path_translator(db_params).translate_many(source_paths, to_davs=False)
+    return set(source_paths)
 
 
 def init_music_database():
     db_params = db_scan.get_db_params()
     db_versions = db_scan.get_latest_kodi_dbs()
     music_db_name = db_versions.get('MyMusic')
-    paths_to_scan = sync_paths_to_scan(db_params, music_db_name)
+    # all'avvio di Kodi il confronto è sempre completo
+    (paths_to_scan, watermark) = sync_paths_to_scan(db_params, music_db_name, True)
     params = '?mode=init'
     if paths_to_scan and not xbmc.getCondVisibility('Library.IsScanningMusic'):
         query_string = ';'.join([f"path={path}" for path in paths_to_scan if path])
@@ -233,143 +668,109 @@ def init_music_database():
     monitor = ScanMonitor()
     if monitor.wait_for_scan():
         monitor.reset()
+        save_watermark(watermark)
         xbmc.log(f"Sincronizzazione libreria completata", xbmc.LOGINFO)
         emit_final_dialog(addon_name)
         execute_addon_with_builtin('service.scan.checker')
 
 
-def get_album_path_by_id(id_albums, use_central, db_params, music_db_name, fetch_all_albums, sources, central_paths):
-    use_webdav = db_params.get('sourcetype') == 'webdav'
+def get_local_album_path_by_id(id_albums, db_params, fetch_all_albums, sources, snapshot):
     music_db_path = db_scan.get_music_db_path()
-    query = '''
-            SELECT DISTINCT song.idAlbum,
-                            strPath,
-                            song.idPath
-            FROM song
-                     JOIN path ON song.idPath = path.idPath
-            WHERE song.idAlbum IN (%s)
-              AND (SELECT COUNT(DISTINCT (idAlbum))
-                   FROM song AS song2
-                   WHERE idPath = song.idPath) = 1
-            ORDER BY strPath ASC'''
+    query = album_paths_query
     id_albums_subquery = 'SELECT idAlbum FROM album'
+    music_db = db_scan.get_local_db(music_db_path)
+    music_db_cursor = music_db.cursor()
     query_results = []
-    if use_central:
-        host = db_params.get('host')
-        username = db_params.get('user')
-        password = db_params.get('pass')
-        central_db = pymysql.connect(host=host, user=username, password=password, database=music_db_name, port=3306,
-                                     cursorclass=pymysql.cursors.DictCursor, connect_timeout=18000)
-        with central_db:
-            with central_db.cursor() as central_cursor:
-                if fetch_all_albums:
-                    central_cursor.execute(query % id_albums_subquery)
-                    log(central_cursor.mogrify(query % id_albums_subquery))
-                    query_results.extend(central_cursor.fetchall())
-                elif id_albums:
-                    chunks = [id_albums[i:i + 1000] for i in range(0, len(id_albums), 1000)]
-                    for chunk in chunks:
-                        placeholders = ','.join(['%s'] * len(chunk))
-                        central_cursor.execute(query % placeholders, chunk)
-                        log(central_cursor.mogrify(query % placeholders, chunk))
-                        query_results.extend(central_cursor.fetchall())
-    else:
-        music_db = sqlite3.connect(music_db_path)
-        music_db.row_factory = sqlite3.Row
-        music_db.set_trace_callback(log)
-        music_db_cursor = music_db.cursor()
-        if fetch_all_albums:
-            music_db_cursor.execute(query % id_albums_subquery)
+    if fetch_all_albums:
+        music_db_cursor.execute(query % id_albums_subquery)
+        query_results.extend(music_db_cursor.fetchall())
+    elif id_albums:
+        chunks = [id_albums[i:i + 999] for i in range(0, len(id_albums), 999)]
+        for chunk in chunks:
+            placeholders = ','.join(['?'] * len(chunk))
+            music_db_cursor.execute(query % placeholders, chunk)
             query_results.extend(music_db_cursor.fetchall())
-        elif id_albums:
-            chunks = [id_albums[i:i + 999] for i in range(0, len(id_albums), 999)]
-            for chunk in chunks:
-                placeholders = ','.join(['?'] * len(chunk))
-                music_db_cursor.execute(query % placeholders, chunk)
-                query_results.extend(music_db_cursor.fetchall())
-        music_db_cursor.close()
-        music_db.close()
+    music_db_cursor.close()
+    album_paths = [(id_album, path) for (id_album, path, id_path) in query_results]
+    return build_album_path_by_id(album_paths, False, db_params, sources, snapshot)
+
+
+def build_album_path_by_id(album_paths, use_central, db_params, sources, snapshot):
+    """Percorsi per idAlbum dalle coppie (idAlbum, percorso): la cartella comune se è nota al centrale"""
+    use_webdav = db_params.get('sourcetype') == 'webdav'
+    path_translator = db_scan.get_path_translator(db_params)
     album_path_by_id = {}
-    if query_results:
+    if album_paths:
         paths_by_album = {}
-        for result in query_results:
-            paths = paths_by_album.get(result['idAlbum'])
+        for (id_album, path) in album_paths:
+            paths = paths_by_album.get(id_album)
             if not paths:
                 paths = list()
-            if use_central or not use_webdav:
-                path = result['strPath']
-            else:
-                path = db_scan.convert_from_davs_to_smb(result['strPath'])
+            if not use_central and use_webdav:
+                path = path_translator.to_smb(path)
             paths.append(path)
-            paths_by_album[result['idAlbum']] = paths
+            paths_by_album[id_album] = paths
+        common_prefix_by_album = {}
         for id_album in paths_by_album.keys():
-            paths_to_update = []
             paths = paths_by_album.get(id_album)
             if paths:
                 common_prefix = os.path.commonprefix(paths)
                 # commonprefix può tagliare a metà un nome, tronchiamo all'ultimo slash
                 if '/' in common_prefix:
-                    common_prefix = common_prefix[:common_prefix.rfind('/') + 1]
-                    if any(common_prefix.startswith(source) and common_prefix != source for source in
-                           sources) and common_prefix in central_paths:
-                        paths_to_update.append(common_prefix)
-                        album_path_by_id[id_album] = paths_to_update
-                    else:
-                        # passo i path duplicati e via per evitare danni grossi
-                        album_path_by_id[id_album] = paths
+                    common_prefix_by_album[id_album] = common_prefix[:common_prefix.rfind('/') + 1]
+        # le cartelle comuni sotto una sorgente vengono verificate sul centrale tutte insieme
+        known_paths = snapshot.get_known_paths([common_prefix for common_prefix in common_prefix_by_album.values()
+                                                if any(common_prefix.startswith(source) and common_prefix != source
+                                                       for source in sources)])
+        for id_album, common_prefix in common_prefix_by_album.items():
+            if common_prefix in known_paths:
+                album_path_by_id[id_album] = [common_prefix]
+            else:
+                # passo i path duplicati e via per evitare danni grossi
+                album_path_by_id[id_album] = paths_by_album.get(id_album)
     return album_path_by_id
 
 
-def get_albums_to_sync(dt_last_scanned_local, music_db_name, db_params, sources, central_paths):
+def get_sync_window(dt_last_scanned_local):
+    """Date di aggiunta (dal giorno dell'ultima scansione locale a domani) degli album da sincronizzare"""
+    from_date_str_local = datetime.strptime(dt_last_scanned_local, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
+    to_date = datetime.now() + timedelta(days=1)
+    to_date_str = to_date.strftime('%Y-%m-%d')
+    return from_date_str_local, to_date_str
+
+
+def get_albums_to_sync(db_params, sources, snapshot):
     query = '''
             SELECT dateAdded,
                    idAlbum,
                    strMusicBrainzAlbumID
             FROM album
-            WHERE dateAdded BETWEEN %s AND %s
+            WHERE dateAdded BETWEEN ? AND ?
             ORDER BY dateAdded'''
-    from_date_str_local = datetime.strptime(dt_last_scanned_local, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
-    to_date = datetime.now() + timedelta(days=1)
-    to_date_str = to_date.strftime('%Y-%m-%d')
-    central_results = []
     local_results = []
     albums_to_sync = []
-    host = db_params.get('host')
-    username = db_params.get('user')
-    password = db_params.get('pass')
-    central_db = pymysql.connect(host=host, user=username, password=password, database=music_db_name, port=3306,
-                                 cursorclass=pymysql.cursors.DictCursor, connect_timeout=18000)
-    with central_db:
-        with central_db.cursor() as central_cursor:
-            central_cursor.execute(query, (from_date_str_local, to_date_str))
-            log(central_cursor.mogrify(query, (from_date_str_local, to_date_str)))
-            central_results.extend(central_cursor.fetchall())
+    central_results = sorted((album for album in snapshot.albums if snapshot.is_in_sync_window(album)),
+                             key=lambda album: album[2])
 
     central_dt_added_by_mbid = {}
     if central_results:
-        album_ids = [result.get('idAlbum') for result in central_results]
-        paths_by_id_album = get_album_path_by_id(album_ids, True, db_params, music_db_name, False,
-                                                 sources, central_paths)
+        paths_by_id_album = build_album_path_by_id(snapshot.get_album_paths([album[0] for album in central_results]),
+                                                   True, db_params, sources, snapshot)
         central_dt_added_by_mbid = {
-            result.get('strMusicBrainzAlbumID'): {'paths': paths_by_id_album.get(result.get('idAlbum')),
-                                                  'dateAdded': result.get('dateAdded')} for result in central_results
+            album[1]: {'paths': paths_by_id_album.get(album[0]), 'dateAdded': album[2]} for album in central_results
         }
     music_db_path = db_scan.get_music_db_path()
-    music_db = sqlite3.connect(music_db_path)
-    music_db.row_factory = sqlite3.Row
-    music_db.set_trace_callback(log)
+    music_db = db_scan.get_local_db(music_db_path)
     music_db_cursor = music_db.cursor()
-    query = query.replace('%s', '?')
-    music_db_cursor.execute(query, (from_date_str_local, to_date_str))
+    music_db_cursor.row_factory = sqlite3.Row
+    music_db_cursor.execute(query, snapshot.sync_window)
     local_results.extend(music_db_cursor.fetchall())
     music_db_cursor.close()
-    music_db.close()
 
     local_dt_added_by_mbid = {}
     if local_results:
         album_ids = [result['idAlbum'] for result in local_results]
-        paths_by_id_album = get_album_path_by_id(album_ids, False, db_params, music_db_name, False,
-                                                 sources, central_paths)
+        paths_by_id_album = get_local_album_path_by_id(album_ids, db_params, False, sources, snapshot)
         local_dt_added_by_mbid = {
             result['strMusicBrainzAlbumID']: {'paths': paths_by_id_album.get(result['idAlbum']),
                                               'dateAdded': result['dateAdded']} for result in local_results
@@ -385,7 +786,7 @@ def get_albums_to_sync(dt_last_scanned_local, music_db_name, db_params, sources,
     return albums_to_sync
 
 
-def sync_paths_to_scan(db_params, music_db_name):
+def sync_paths_to_scan(db_params, music_db_name, force_full_reconcile=False):
     local_props = get_properties(False, db_params)
     local_last_scanned = local_props.get('librarylastupdated')
     central_playlists_enabled = db_params.get('centralplaylist')
@@ -393,13 +794,37 @@ def sync_paths_to_scan(db_params, music_db_name):
         playlist_source = f'{db_params.get("sambasource")}/playlists/music/'
         sync_playlists_to_central_path(playlist_source, db_params)
     sources = get_sources(db_params)
-    central_paths = get_central_paths(db_params, music_db_name)
-    albums_to_sync = get_albums_to_sync(local_last_scanned, music_db_name, db_params, sources, central_paths)
-    albums_to_align = get_releases_to_align(db_params, music_db_name, sources, central_paths)
+    watermark = load_watermark()
+    if force_full_reconcile:
+        full_reconcile_reason = 'richiesto'
+    else:
+        full_reconcile_reason = get_local_reconcile_reason(watermark, db_params, music_db_name)
+    central_watermark = None if full_reconcile_reason else watermark.get('central') or {}
+    sync_window = get_sync_window(local_last_scanned)
+    all_album_paths = get_reconcile_mode(db_params) == 'paths'
+    # un solo giro verso il centrale: le tabelle intere solo se il confronto completo è già previsto, altrimenti
+    # riepilogo, crescita e le sole righe della finestra di sincronizzazione e di quanto cambiato dopo il watermark.
+    # Il riepilogo viene dalla stessa istantanea: quello che arriva dopo verrà ricontrollato al giro successivo
+    snapshot = CentralSnapshot(db_params, music_db_name, sync_window, central_watermark, all_album_paths)
+    albums_to_sync = get_albums_to_sync(db_params, sources, snapshot)
+    if not full_reconcile_reason:
+        full_reconcile_reason = get_central_reconcile_reason(central_watermark, snapshot)
+        if full_reconcile_reason:
+            # il centrale ha perso qualcosa: serve l'istantanea completa
+            snapshot = CentralSnapshot(db_params, music_db_name, sync_window, None, all_album_paths)
+    if full_reconcile_reason:
+        log(f'Riallineamento completo delle librerie: {full_reconcile_reason}')
+        albums_to_align = get_releases_to_align(db_params, music_db_name, sources, snapshot)
+        last_full_reconcile = datetime.now().strftime(watermark_date_format)
+    else:
+        albums_to_align = get_delta_releases_to_align(db_params, sources, snapshot)
+        last_full_reconcile = watermark.get('lastFullReconcile')
+    new_watermark = {'host': db_params.get('host'), 'musicDb': music_db_name, 'central': snapshot.get_summary(),
+                     'lastFullReconcile': last_full_reconcile}
     paths_to_scan = set()
     paths_to_scan.update(albums_to_sync)
     paths_to_scan.update(albums_to_align)
-    return paths_to_scan
+    return paths_to_scan, new_watermark
 
 
 def emit_final_dialog(addon_name):
@@ -413,14 +838,19 @@ def sync_library():
     db_params = db_scan.get_db_params()
     exec_mode = 'scan'
     music_db_name = db_scan.get_latest_kodi_dbs().get('MyMusic')
-    current_scans = sync_paths_to_scan(db_params, music_db_name)
-    if current_scans and not xbmc.getCondVisibility('Library.IsScanningMusic'):
+    # con mode=full il confronto completo viene eseguito anche prima della cadenza prevista
+    force_full_reconcile = db_scan.get_exec_mode() == 'full'
+    (current_scans, watermark) = sync_paths_to_scan(db_params, music_db_name, force_full_reconcile)
+    if not current_scans:
+        save_watermark(watermark)
+    elif not xbmc.getCondVisibility('Library.IsScanningMusic'):
         query_string = ';'.join([f"path={path}" for path in current_scans if path])
         params = db_scan.encode_string(f'?{query_string};mode={exec_mode}', safe_chars='()!')
         execute_addon_with_builtin('script.scanner.trigger', params)
         monitor = ScanMonitor()
         if monitor.wait_for_scan():
             monitor.reset()
+            save_watermark(watermark)
             xbmc.log(f"Sincronizzazione libreria completata", xbmc.LOGINFO)
             emit_final_dialog(addon_name)
 